@@ -4,12 +4,27 @@ import stpyvista as stpv
 from PIL import Image
 import os
 import io
+import queue
+import time
 
+import job_queue
 from prompt_enhancer import PromptEnhancer
 from txt2img_pipeline import generate_image
-from img2_3d_pipeline import image_to_3d, extract_glb 
+from img2_3d_pipeline import image_to_3d, extract_glb, get_job_queue, DEVICE
 from util import render_glb 
 
+POLL_INTERVAL = 1.0  # seconds between polls of a running job
+STATUS_LABELS = {
+    job_queue.QUEUED: "Waiting in queue",
+    job_queue.SAMPLING_SS: "Sampling sparse structure",
+    job_queue.SAMPLING_SLAT: "Sampling structured latent",
+    job_queue.DECODING: "Decoding",
+    job_queue.RENDERING: "Rendering preview",
+    job_queue.BAKING: "Baking texture",
+}
+jobs = get_job_queue()
+needs_poll = False
+
 st.title("Asset Generator")
 st.markdown("Enter a text prompt or upload an image to generate your 3D asset.")
 
@@ -57,26 +72,49 @@ with col2:
 st.markdown("---")
 st.subheader("3D Model Preview & Download")
 
-if st.button("Generate 3D Model"):
+if st.button("Generate 3D Model", disabled=bool(st.session_state.get('generate_job_id'))):
     image_bytes = st.session_state.get('generated_image_bytes') or st.session_state.get('uploaded_image_bytes')
     if image_bytes:
-        with st.spinner("Generating 3D Model... Please wait."):
-            try:
-                # Convert bytes to PIL Image
-                image = Image.open(io.BytesIO(image_bytes))
-                state, video_path = image_to_3d(image=image, seed=0)
-                st.session_state.generated_model_state = state
-                # Read video as bytes
-                if os.path.exists(video_path):
-                    with open(video_path, 'rb') as f:
-                        st.session_state.video_bytes = f.read()
-                else:
-                    st.error("Video file not found.")
-            except Exception as e:
-                st.error(f"Error generating 3D model: {e}")
+        try:
+            # Convert bytes to PIL Image
+            image = Image.open(io.BytesIO(image_bytes))
+            st.session_state.generate_job_id = jobs.submit(image_to_3d, image=image, seed=0, output_dir=st.session_state.temp_dir)
+        except queue.Full:
+            st.error("The server is busy, please try again in a moment.")
+        except Exception as e:
+            st.error(f"Error generating 3D model: {e}")
     else:
         st.error("No image source available for 3D model generation.")
 
+# Poll the generation job
+if st.session_state.get('generate_job_id'):
+    job_id = st.session_state.generate_job_id
+    job = jobs.poll(job_id)
+    if job is None:
+        st.error("The generation job was lost, please try again.")
+        st.session_state.generate_job_id = None
+    elif not job.finished:
+        st.info(f"Generating 3D Model... {STATUS_LABELS.get(job.status, job.status)}")
+        if job.preview is not None:
+            st.image(job.preview, caption="Coarse structure preview", width=256)
+        if st.button("Cancel", key="cancel_generate"):
+            jobs.cancel(job_id)
+        needs_poll = True
+    else:
+        if job.status == job_queue.DONE:
+            state, video_path = job.result
+            st.session_state.generated_model_state = state
+            # Read video as bytes
+            if os.path.exists(video_path):
+                with open(video_path, 'rb') as f:
+                    st.session_state.video_bytes = f.read()
+            else:
+                st.error("Video file not found.")
+        elif job.status == job_queue.FAILED:
+            st.error(f"Error generating 3D model: {job.error}")
+        jobs.forget(job_id)
+        st.session_state.generate_job_id = None
+
 # Display 3D model video if available
 if st.session_state.get('video_bytes'):
     st.video(st.session_state.video_bytes, format="video/mp4")
@@ -86,20 +124,43 @@ if st.session_state.get('video_bytes'):
     with st.expander("GLB Extraction Settings", expanded=True):
         mesh_simplify = st.slider("Simplify", 0.9, 0.98, 0.95, 0.01)
         texture_size = st.slider("Texture Size", 512, 2048, 1024, 512)
-        if st.button("Extract GLB", key="extract_glb", type="secondary"):
+        if DEVICE.type != 'cuda':
+            st.caption("Without a CUDA device the GLB is exported without a texture.")
+        if st.button("Extract GLB", key="extract_glb", type="secondary", disabled=bool(st.session_state.get('glb_job_id'))):
             if st.session_state.get('generated_model_state'):
-                with st.spinner("Extracting GLB..."):
-                    try:
-                        # Extract GLB to a temporary file
-                        glb_path = extract_glb(st.session_state.generated_model_state, mesh_simplify, texture_size)
-                        # Read GLB as bytes
-                        with open(glb_path, 'rb') as f:
-                            st.session_state.glb_bytes = f.read()
-                    except Exception as e:
-                        st.error(f"Error extracting GLB: {e}")
+                try:
+                    # Extract GLB to a temporary file
+                    st.session_state.glb_job_id = jobs.submit(
+                        extract_glb, st.session_state.generated_model_state, mesh_simplify, texture_size,
+                        output_dir=st.session_state.temp_dir,
+                    )
+                except queue.Full:
+                    st.error("The server is busy, please try again in a moment.")
             else:
                 st.error("No 3D model state available for GLB extraction.")
 
+        # Poll the GLB extraction job
+        if st.session_state.get('glb_job_id'):
+            job_id = st.session_state.glb_job_id
+            job = jobs.poll(job_id)
+            if job is None:
+                st.error("The GLB extraction job was lost, please try again.")
+                st.session_state.glb_job_id = None
+            elif not job.finished:
+                st.info(f"Extracting GLB... {STATUS_LABELS.get(job.status, job.status)}")
+                if st.button("Cancel", key="cancel_glb"):
+                    jobs.cancel(job_id)
+                needs_poll = True
+            else:
+                if job.status == job_queue.DONE:
+                    # Read GLB as bytes
+                    with open(job.result, 'rb') as f:
+                        st.session_state.glb_bytes = f.read()
+                elif job.status == job_queue.FAILED:
+                    st.error(f"Error extracting GLB: {job.error}")
+                jobs.forget(job_id)
+                st.session_state.glb_job_id = None
+
 # Display GLB if available
 if st.session_state.get('glb_bytes'):
     try:
@@ -122,3 +183,8 @@ if st.session_state.get('glb_bytes'):
             os.remove(temp_glb_path)
     except Exception as e:
         st.error(f"Error rendering GLB: {e}")
+
+# Rerun the script until the running jobs have finished
+if needs_poll:
+    time.sleep(POLL_INTERVAL)
+    st.rerun()
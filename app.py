@@ -15,6 +15,10 @@ if "video_bytes" not in st.session_state:
     st.session_state.video_bytes = None
 if "glb_bytes" not in st.session_state:
     st.session_state.glb_bytes = None
+if "generate_job_id" not in st.session_state:
+    st.session_state.generate_job_id = None
+if "glb_job_id" not in st.session_state:
+    st.session_state.glb_job_id = None
 
 from util import end_session
 from dotenv import load_dotenv
@@ -0,0 +1,169 @@
+"""
+Time and quality of the adaptive visibility estimation of the hole filling in `postprocess_mesh`.
+
+Every mesh is postprocessed twice without simplification: with the fixed estimation of 1000
+views at 1024px, and with the adaptive one `to_glb` uses, which picks the resolution from the
+mesh and stops adding views once the visibility converges. `differ` is the number of faces of
+either output that the other one does not have, and `chamfer` the mean symmetric distance
+between their surfaces, relative to the bounding box diagonal, if they differ.
+
+The synthetic meshes are the hard cases of the estimation: 'nested' is a bumpy sphere around a
+hidden inner sphere whose faces have to be removed, and 'well' a cylinder with a narrow well
+whose bottom is only seen from the few views around its axis, and has to be kept. A mesh file can
+be given instead.
+
+Usage:
+    python benchmarks/fill_holes.py [--meshes nested well] [--mesh mesh.ply] [--backend auto] [--device cuda]
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import torch
+from scipy.spatial import cKDTree
+
+
+def bumpy_sphere(num_faces: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n = max(4, int(np.sqrt(num_faces / 4)))
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, n + 2)[1:-1], np.linspace(0, 2 * np.pi, 2 * n, endpoint=False), indexing='ij')
+    r = 1 + 0.1 * np.sin(rng.integers(2, 8) * theta) * np.cos(rng.integers(2, 8) * phi)
+    vertices = np.stack([r * np.sin(theta) * np.cos(phi), r * np.sin(theta) * np.sin(phi), r * np.cos(theta)], -1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(n - 1), np.arange(2 * n), indexing='ij')
+    a, b = i * 2 * n + j, i * 2 * n + (j + 1) % (2 * n)
+    faces = np.concatenate([np.stack([a, b, a + 2 * n], -1), np.stack([b, b + 2 * n, a + 2 * n], -1)]).reshape(-1, 3)
+    # Close the poles with triangle fans
+    north, south = vertices.shape[0], vertices.shape[0] + 1
+    j = np.arange(2 * n)
+    faces = np.concatenate([
+        faces,
+        np.stack([np.full(2 * n, north), (j + 1) % (2 * n), j], -1),
+        np.stack([np.full(2 * n, south), (n - 1) * 2 * n + j, (n - 1) * 2 * n + (j + 1) % (2 * n)], -1),
+    ])
+    vertices = np.concatenate([vertices, [[0, 0, 1], [0, 0, -1]]])
+    return vertices.astype(np.float32), faces.astype(np.int64)
+
+
+def sample_surface(vertices, faces, num_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    triangles = vertices[faces].astype(np.float64)
+    areas = np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1)
+    index = rng.choice(faces.shape[0], num_samples, p=areas / areas.sum())
+    u, v = rng.random((2, num_samples, 1))
+    flip = u + v > 1
+    u, v = np.where(flip, 1 - u, u), np.where(flip, 1 - v, v)
+    t = triangles[index]
+    return t[:, 0] + u * (t[:, 1] - t[:, 0]) + v * (t[:, 2] - t[:, 0])
+
+
+def chamfer(vertices_a, faces_a, vertices_b, faces_b, num_samples=100000):
+    points_a = sample_surface(vertices_a, faces_a, num_samples)
+    points_b = sample_surface(vertices_b, faces_b, num_samples)
+    distance = 0.5 * (cKDTree(points_b).query(points_a)[0].mean() + cKDTree(points_a).query(points_b)[0].mean())
+    return distance / np.linalg.norm(vertices_a.max(axis=0) - vertices_a.min(axis=0))
+
+
+def surface_of_revolution(profile: np.ndarray, num_segments: int):
+    """
+    A closed mesh from revolving the (r, z) `profile` around the z axis. The profile runs
+    from the axis back to the axis.
+    """
+    phi = np.linspace(0, 2 * np.pi, num_segments, endpoint=False)
+    ring = profile[1:-1]
+    n = ring.shape[0]
+    vertices = np.stack([
+        ring[:, None, 0] * np.cos(phi)[None], ring[:, None, 0] * np.sin(phi)[None], np.repeat(ring[:, None, 1], num_segments, axis=1)
+    ], -1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(n - 1), np.arange(num_segments), indexing='ij')
+    a, b = i * num_segments + j, i * num_segments + (j + 1) % num_segments
+    faces = np.concatenate([np.stack([a, a + num_segments, b], -1), np.stack([b, a + num_segments, b + num_segments], -1)]).reshape(-1, 3)
+    first, last = vertices.shape[0], vertices.shape[0] + 1
+    j = np.arange(num_segments)
+    faces = np.concatenate([
+        faces,
+        np.stack([np.full(num_segments, first), j, (j + 1) % num_segments], -1),
+        np.stack([np.full(num_segments, last), (n - 1) * num_segments + (j + 1) % num_segments, (n - 1) * num_segments + j], -1),
+    ])
+    vertices = np.concatenate([vertices, [[0, 0, profile[0, 1]], [0, 0, profile[-1, 1]]]])
+    return vertices.astype(np.float32), faces.astype(np.int64)
+
+
+def nested_spheres(num_faces: int):
+    outer_vertices, outer_faces = bumpy_sphere(num_faces * 4 // 5)
+    inner_vertices, inner_faces = bumpy_sphere(num_faces // 5, seed=1)
+    vertices = np.concatenate([outer_vertices * 0.4, inner_vertices * 0.15])
+    faces = np.concatenate([outer_faces, inner_faces + outer_vertices.shape[0]])
+    return vertices, faces
+
+
+def well(num_faces: int):
+    # Outer radius 0.4 and height 0.6; the well has a radius of 0.15, too wide to count as a hole, and is 0.4 deep
+    def segment(a, b, n):
+        return np.linspace(a, b, n, endpoint=False)
+    rings = max(4, int(np.sqrt(num_faces / 52)))
+    profile = np.concatenate([
+        segment([0, -0.3], [0.4, -0.3], rings),
+        segment([0.4, -0.3], [0.4, 0.3], 2 * rings),
+        segment([0.4, 0.3], [0.15, 0.3], rings),
+        segment([0.15, 0.3], [0.15, -0.1], 2 * rings),
+        segment([0.15, -0.1], [0, -0.1], rings // 2),
+        [[0, -0.1]],
+    ])
+    return surface_of_revolution(profile, 4 * rings)
+
+
+def face_set(vertices, faces):
+    triangles = np.round(vertices[faces].astype(np.float64), 5).tolist()
+    return set(frozenset(map(tuple, triangle)) for triangle in triangles)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meshes', nargs='+', default=['nested', 'well'], choices=['nested', 'well'])
+    parser.add_argument('--faces', type=int, default=20000)
+    parser.add_argument('--mesh', default=None)
+    parser.add_argument('--backend', default='auto', choices=['auto', 'cuda', 'torch', 'numpy'])
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--mincut_solver', default='auto')
+    args = parser.parse_args()
+
+    from trellis.utils.postprocessing_utils import postprocess_mesh
+
+    if args.mesh is not None:
+        import trimesh
+        mesh = trimesh.load(args.mesh, force='mesh')
+        meshes = [(os.path.basename(args.mesh), np.asarray(mesh.vertices, dtype=np.float32), np.asarray(mesh.faces, dtype=np.int64))]
+    else:
+        generators = {'nested': nested_spheres, 'well': well}
+        meshes = [(name, *generators[name](args.faces)) for name in args.meshes]
+
+    print(f'device: {args.device}, backend: {args.backend}')
+    print(f'{"mesh":>10} {"faces":>7} {"mode":>8} {"res":>5} {"views":>6} {"vis (s)":>8} {"total (s)":>9} {"invisible":>9} {"removed":>8} {"out faces":>9} {"differ":>7} {"chamfer":>9}')
+    for name, vertices, faces in meshes:
+        outputs = {}
+        for mode, adaptive in [('fixed', False), ('adaptive', True)]:
+            start = time.time()
+            out_vertices, out_faces, stats = postprocess_mesh(
+                vertices, faces, simplify=False,
+                fill_holes_max_hole_nbe=int(250 * np.sqrt(1 - 0.95)),
+                fill_holes_resolution=None if adaptive else 1024,
+                fill_holes_num_views=1000,
+                fill_holes_adaptive_views=adaptive,
+                fill_holes_mincut_solver=args.mincut_solver,
+                fill_holes_backend=args.backend,
+                device=args.device,
+                return_stats=True,
+            )
+            elapsed = time.time() - start
+            outputs[mode] = (out_vertices, out_faces)
+            stats = stats.fill_holes
+            line = f'{name:>10} {faces.shape[0]:>7} {mode:>8} {stats.resolution:>5} {stats.num_views:>6} {stats.visibility_time:>8.1f} {elapsed:>9.1f} ' \
+                   f'{stats.num_invisible:>9} {stats.num_removed:>8} {out_faces.shape[0]:>9}'
+            if mode == 'adaptive':
+                differ = len(face_set(*outputs['fixed']) ^ face_set(out_vertices, out_faces))
+                distance = chamfer(*outputs['fixed'], out_vertices, out_faces) if differ > 0 else 0.0
+                line += f' {differ:>7} {distance:>9.2e}'
+            print(line, flush=True)
@@ -0,0 +1,77 @@
+"""
+Per-stage latency of the image-to-3D pipeline, on CPU by default.
+
+Without CUDA the pipeline runs on the pure PyTorch backends: dense and sparse attention
+use torch's scaled_dot_product_attention and sparse convolutions use the gather-GEMM
+implementation of `trellis.modules.sparse.conv.conv_torch`. On CPU all models run in float32.
+Off CUDA, previews are rendered by the PyTorch Gaussian and mesh renderers, and GLB
+export postprocesses the mesh but skips texture baking, which needs nvdiffrast; neither is
+covered.
+
+Usage:
+    python benchmarks/pipeline_cpu.py --image assets/example_image/T.png [--threads 16] [--formats mesh gaussian]
+    python benchmarks/pipeline_cpu.py --image assets/example_image/T.png --device cuda
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import torch
+from PIL import Image
+
+
+def timed(name: str, timings: dict, device: torch.device, fn, *args, **kwargs):
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    out = fn(*args, **kwargs)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    timings[name] = time.time() - start
+    return out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', required=True)
+    parser.add_argument('--model', default='JeffreyXiang/TRELLIS-image-large')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--threads', type=int, default=None, help='Number of CPU threads; torch default if not given')
+    parser.add_argument('--formats', nargs='+', default=['mesh', 'gaussian'], choices=['mesh', 'gaussian', 'radiance_field'])
+    parser.add_argument('--ss_steps', type=int, default=12)
+    parser.add_argument('--slat_steps', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+
+    from trellis.pipelines import TrellisImageTo3DPipeline
+    from trellis.modules import sparse as sp
+    from trellis.modules import attention
+
+    timings = {}
+    pipeline = timed('load', timings, device, TrellisImageTo3DPipeline.from_pretrained, args.model)
+    pipeline.to(device)
+    if device.type == 'cpu':
+        pipeline.convert_to_fp32()
+
+    with torch.no_grad():
+        image = Image.open(args.image)
+        image = timed('preprocess', timings, device, pipeline.preprocess_image, image)
+        cond = timed('get_cond', timings, device, pipeline.get_cond, [image])
+        torch.manual_seed(args.seed)
+        coords = timed('sample_ss', timings, device, pipeline.sample_sparse_structure, cond, 1, {'steps': args.ss_steps})
+        slat = timed('sample_slat', timings, device, pipeline.sample_slat, cond, coords, {'steps': args.slat_steps})
+        for fmt in args.formats:
+            timed(f'decode_{fmt}', timings, device, pipeline.decode_slat, slat, [fmt])
+
+    print(f'device: {device}, threads: {torch.get_num_threads()}, attention: {attention.BACKEND}, '
+          f'sparse: {sp.BACKEND}/{sp.ATTN}, voxels: {coords.shape[0]}')
+    print(f'{"stage":>22} {"time (s)":>9}')
+    for name, elapsed in timings.items():
+        print(f'{name:>22} {elapsed:>9.3f}')
+    print(f'{"total (excl. load)":>22} {sum(v for k, v in timings.items() if k != "load"):>9.3f}')
@@ -0,0 +1,64 @@
+"""
+Frames per second of the preview video of `image_to_3d`.
+
+An asset is generated from the image, then its turntable preview is rendered both ways: as
+before, with the gaussians and the mesh rendered in two `render_video` calls and the frames
+concatenated with numpy, and in one composite pass of `render_frames` into a preallocated
+buffer. Encoding is not included. Needs CUDA.
+
+Usage:
+    python benchmarks/preview_render.py --image assets/example_image/T.png [--num_frames 120] [--resolution 512]
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', required=True)
+    parser.add_argument('--model', default='JeffreyXiang/TRELLIS-image-large')
+    parser.add_argument('--num_frames', type=int, default=120)
+    parser.add_argument('--resolution', type=int, default=512)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from trellis.pipelines import TrellisImageTo3DPipeline
+    from trellis.utils import render_utils
+
+    pipeline = TrellisImageTo3DPipeline.from_pretrained(args.model)
+    pipeline.cuda()
+    outputs = pipeline.run(Image.open(args.image), seed=args.seed, formats=['gaussian', 'mesh'])
+    gs, mesh = outputs['gaussian'][0], outputs['mesh'][0]
+
+    def separate():
+        video = render_utils.render_video(gs, resolution=args.resolution, num_frames=args.num_frames, verbose=False)['color']
+        video_geo = render_utils.render_video(mesh, resolution=args.resolution, num_frames=args.num_frames, verbose=False)['normal']
+        return [np.concatenate([video[i], video_geo[i]], axis=1) for i in range(len(video))]
+
+    def composite():
+        return render_utils.render_video(
+            [gs, mesh], resolution=args.resolution, num_frames=args.num_frames, verbose=False, channels=['color', 'normal'],
+        )['composite']
+
+    print(f'frames: {args.num_frames}, resolution: {args.resolution}')
+    print(f'{"mode":>10} {"time (s)":>9} {"fps":>7}')
+    reference = None
+    for name, fn in [('separate', separate), ('composite', composite)]:
+        fn()  # Warm up
+        torch.cuda.synchronize()
+        start = time.time()
+        frames = fn()
+        torch.cuda.synchronize()
+        elapsed = time.time() - start
+        print(f'{name:>10} {elapsed:>9.2f} {args.num_frames / elapsed:>7.1f}')
+        if reference is None:
+            reference = frames
+        else:
+            assert all((a == b).all() for a, b in zip(reference, frames)), 'Composite frames differ from the separate renders'
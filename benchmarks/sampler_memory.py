@@ -0,0 +1,94 @@
+"""
+Peak memory of FlowEulerSampler.sample versus step count, with and without per-step history.
+
+Runs on CPU by default. On CPU, each configuration runs in a fresh process and the
+peak is the growth of the process' max RSS during sampling; on CUDA it is
+torch.cuda.max_memory_allocated.
+
+Usage:
+    python benchmarks/sampler_memory.py [--device cpu] [--steps 4 8 12 25 50] [--reso 64]
+"""
+import os
+import sys
+import argparse
+import resource
+import multiprocessing as mp
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import torch
+import torch.nn as nn
+
+
+class ToyFlowModel(nn.Module):
+    """
+    A velocity model with the call signature of the flow models and negligible activations.
+    """
+    def __init__(self, channels: int):
+        super().__init__()
+        self.proj = nn.Conv3d(channels, channels, 1)
+
+    def forward(self, x, t, cond=None):
+        return self.proj(x)
+
+
+def _max_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def measure(device: str, reso: int, channels: int, steps: int, history_stride: int) -> int:
+    from trellis.pipelines.samplers import FlowEulerSampler
+    torch.manual_seed(0)
+    model = ToyFlowModel(channels).to(device).eval()
+    noise = torch.randn(1, channels, reso, reso, reso, device=device)
+    sampler = FlowEulerSampler(sigma_min=1e-5)
+
+    # Warm up so one-off allocations are not attributed to sampling
+    sampler.sample(model, noise, steps=2, verbose=False, history_stride=0)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+    else:
+        base = _max_rss_bytes()
+    ret = sampler.sample(model, noise, steps=steps, verbose=False, history_stride=history_stride)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+        peak = torch.cuda.max_memory_allocated()
+    else:
+        peak = _max_rss_bytes()
+    del ret
+    return peak - base
+
+
+def _worker(result_queue, *args):
+    result_queue.put(measure(*args))
+
+
+def measure_isolated(*args) -> int:
+    ctx = mp.get_context('spawn')
+    result_queue = ctx.Queue()
+    proc = ctx.Process(target=_worker, args=(result_queue, *args))
+    proc.start()
+    result = result_queue.get()
+    proc.join()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--steps', type=int, nargs='+', default=[4, 8, 12, 25, 50])
+    parser.add_argument('--reso', type=int, default=64)
+    parser.add_argument('--channels', type=int, default=8)
+    args = parser.parse_args()
+
+    latent_mb = args.channels * args.reso ** 3 * 4 / 1024 ** 2
+    print(f'Latent: {args.channels}x{args.reso}^3 float32 = {latent_mb:.1f} MB, device: {args.device}')
+    print(f'{"steps":>6} {"full history (MB)":>18} {"lean (MB)":>10}')
+    run = measure if args.device == 'cuda' else measure_isolated
+    for steps in args.steps:
+        full = run(args.device, args.reso, args.channels, steps, 1)
+        lean = run(args.device, args.reso, args.channels, steps, 0)
+        print(f'{steps:>6} {full / 1024 ** 2:>18.1f} {lean / 1024 ** 2:>10.1f}')
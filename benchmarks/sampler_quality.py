@@ -0,0 +1,126 @@
+"""
+Sample quality versus step count for the flow samplers.
+
+By default the samplers integrate an analytic flow whose data distribution is a
+per-element Gaussian. Its velocity field is known in closed form and the probability
+flow ODE maps the noise to the data linearly, so the error of every sampler is measured
+against the exact solution. With --model, a sparse structure flow checkpoint is sampled
+instead and the reference is a many-step Euler solve from the same noise.
+
+Errors are relative L2 errors of the final samples; `evals` is the number of model
+evaluations, which is what the latency of a stage scales with.
+
+Usage:
+    python benchmarks/sampler_quality.py [--steps 2 4 6 8 12 25] [--rescale_t 3.0]
+    python benchmarks/sampler_quality.py --model JeffreyXiang/TRELLIS-image-large/ckpts/ss_flow_img_dit_L_16l8_fp16 --device cuda
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import torch
+import torch.nn as nn
+
+SIGMA_MIN = 1e-5
+
+SAMPLERS = {
+    'euler': ('FlowEulerSampler', {}),
+    'heun': ('FlowHeunSampler', {'method': 'heun'}),
+    'midpoint': ('FlowHeunSampler', {'method': 'midpoint'}),
+    'dpm++2m': ('FlowDpmSolverSampler', {'order': 2}),
+    'adaptive': ('FlowAdaptiveSampler', {}),
+}
+
+
+class GaussianFlowModel(nn.Module):
+    """
+    The exact velocity of the flow x_t = (1 - t) x_0 + (sigma_min + (1 - sigma_min) t) eps
+    for x_0 ~ N(mean, std^2) elementwise, with the call signature of the flow models.
+    """
+    def __init__(self, mean: torch.Tensor, std: torch.Tensor, sigma_min: float):
+        super().__init__()
+        self.register_buffer('mean', mean)
+        self.register_buffer('std', std)
+        self.sigma_min = sigma_min
+
+    def forward(self, x, t, cond=None):
+        t = (t / 1000).view(-1, *[1] * (x.dim() - 1))
+        sigma = self.sigma_min + (1 - self.sigma_min) * t
+        var = ((1 - t) * self.std) ** 2 + sigma ** 2
+        residual = x - (1 - t) * self.mean
+        x_0 = self.mean + (1 - t) * self.std ** 2 / var * residual
+        eps = sigma / var * residual
+        return (1 - self.sigma_min) * eps - x_0
+
+    def solution(self, noise: torch.Tensor) -> torch.Tensor:
+        return self.mean + torch.sqrt(self.std ** 2 + self.sigma_min ** 2) * noise
+
+
+class EvalCounter(nn.Module):
+    """
+    Counts the forward calls of a model.
+    """
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+        self.num_evals = 0
+
+    def forward(self, *args, **kwargs):
+        self.num_evals += 1
+        return self.model(*args, **kwargs)
+
+
+def run_sampler(name: str, model, noise, cond, steps: int, rescale_t: float):
+    from trellis.pipelines import samplers
+    cls_name, args = SAMPLERS[name]
+    sampler = getattr(samplers, cls_name)(sigma_min=SIGMA_MIN, **args)
+    counter = EvalCounter(model)
+    kwargs = {} if cond is None else {'cond': cond}
+    if noise.is_cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    samples = sampler.sample(counter, noise, steps=steps, rescale_t=rescale_t, verbose=False, history_stride=0, **kwargs).samples
+    if noise.is_cuda:
+        torch.cuda.synchronize()
+    return samples, counter.num_evals, time.time() - start
+
+
+def relative_error(x: torch.Tensor, ref: torch.Tensor) -> float:
+    return ((x - ref).float().norm() / ref.float().norm()).item()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samplers', nargs='+', default=list(SAMPLERS.keys()), choices=list(SAMPLERS.keys()))
+    parser.add_argument('--steps', type=int, nargs='+', default=[2, 4, 6, 8, 12, 25])
+    parser.add_argument('--rescale_t', type=float, default=3.0)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=None, help='Path of a sparse structure flow model; analytic flow if not given')
+    parser.add_argument('--ref_steps', type=int, default=200, help='Euler steps of the reference solve with --model')
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    if args.model is None:
+        shape = (1, 8, 16, 16, 16)
+        mean = torch.randn(shape)
+        std = torch.rand(shape) * 1.5 + 0.05
+        model = GaussianFlowModel(mean, std, SIGMA_MIN).to(args.device)
+        noise = torch.randn(shape, device=args.device)
+        cond = None
+        reference = model.solution(noise)
+    else:
+        from trellis import models
+        model = models.from_pretrained(args.model).to(args.device).eval()
+        reso = model.resolution
+        noise = torch.randn(1, model.in_channels, reso, reso, reso, device=args.device)
+        cond = torch.randn(1, 1374, model.cond_channels, device=args.device)
+        reference, _, _ = run_sampler('euler', model, noise, cond, args.ref_steps, args.rescale_t)
+
+    print(f'{"sampler":>10} {"steps":>6} {"evals":>6} {"rel. error":>11} {"time (s)":>9}')
+    for name in args.samplers:
+        for steps in args.steps:
+            samples, num_evals, elapsed = run_sampler(name, model, noise, cond, steps, args.rescale_t)
+            print(f'{name:>10} {steps:>6} {num_evals:>6} {relative_error(samples, reference):>11.2e} {elapsed:>9.3f}')
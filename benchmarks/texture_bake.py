@@ -0,0 +1,91 @@
+"""
+Quality and time of the texture baking modes.
+
+An asset is generated from the image and its mesh postprocessed and parametrized as in
+`to_glb`, then its gaussians are rendered from the 100 baking views and the texture is baked
+with every mode. Quality is the PSNR of the textured mesh against the gaussian renders,
+on the baking views and on held-out views between them, over the pixels the mesh covers.
+Needs CUDA.
+
+Usage:
+    python benchmarks/texture_bake.py --image assets/example_image/T.png [--modes opt ls fast] [--texture_size 1024]
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import torch
+import utils3d
+import nvdiffrast.torch as dr
+from PIL import Image
+
+
+def psnr(vertices, faces, uvs, texture, observations, extrinsics, intrinsics):
+    vertices, faces, uvs = torch.tensor(vertices).cuda(), torch.tensor(faces.astype(np.int32)).cuda(), torch.tensor(uvs).cuda()
+    texture = torch.tensor(texture).float().cuda()[None].flip(1) / 255
+    rastctx = utils3d.torch.RastContext(backend='cuda')
+    mse = []
+    for observation, extr, intr in zip(observations, extrinsics, intrinsics):
+        observation = torch.tensor(observation).float().cuda().flip(0) / 255
+        rast = utils3d.torch.rasterize_triangle_faces(
+            rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None],
+            view=utils3d.torch.extrinsics_to_view(extr), projection=utils3d.torch.intrinsics_to_perspective(intr, 0.1, 10.0)
+        )
+        mask = rast['mask'][0].bool() & (observation > 0).any(dim=-1)
+        render = dr.texture(texture, rast['uv'], filter_mode='linear')[0]
+        mse.append(((render - observation)[mask] ** 2).mean().item())
+    return 10 * np.log10(1 / np.mean(mse))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--image', required=True)
+    parser.add_argument('--model', default='JeffreyXiang/TRELLIS-image-large')
+    parser.add_argument('--modes', nargs='+', default=['opt', 'ls', 'fast'], choices=['opt', 'ls', 'fast'])
+    parser.add_argument('--texture_size', type=int, default=1024)
+    parser.add_argument('--simplify', type=float, default=0.95)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from trellis.pipelines import TrellisImageTo3DPipeline
+    from trellis.utils import postprocessing_utils
+    from trellis.utils.render_utils import render_multiview, render_frames, yaw_pitch_r_fov_to_extrinsics_intrinsics
+
+    pipeline = TrellisImageTo3DPipeline.from_pretrained(args.model)
+    pipeline.cuda()
+    outputs = pipeline.run(Image.open(args.image), seed=args.seed, formats=['gaussian', 'mesh'])
+    gs, mesh = outputs['gaussian'][0], outputs['mesh'][0]
+
+    vertices, faces = postprocessing_utils.postprocess_mesh(
+        mesh.vertices.cpu().numpy(), mesh.faces.cpu().numpy(),
+        simplify=args.simplify > 0, simplify_ratio=args.simplify,
+        fill_holes_max_hole_nbe=int(250 * np.sqrt(1 - args.simplify)),
+    )
+    vertices, faces, uvs = postprocessing_utils.parametrize_mesh(vertices, faces)
+
+    observations, extrinsics, intrinsics = render_multiview(gs, resolution=1024, nviews=100)
+    masks = [np.any(observation > 0, axis=-1) for observation in observations]
+    # Held-out views: a yaw orbit at pitches the Hammersley views do not hit exactly
+    yaws = np.linspace(0, 2 * np.pi, 20, endpoint=False) + 0.1
+    pitchs = np.linspace(-0.6, 0.9, 20)
+    test_extrinsics, test_intrinsics = yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws.tolist(), pitchs.tolist(), 2, 40)
+    test_observations = render_frames(gs, test_extrinsics, test_intrinsics, {'resolution': 1024, 'bg_color': (0, 0, 0)}, verbose=False)['color']
+
+    print(f'faces: {faces.shape[0]}, texture: {args.texture_size}px')
+    print(f'{"mode":>6} {"time (s)":>9} {"PSNR train":>11} {"PSNR test":>10}')
+    for mode in args.modes:
+        torch.cuda.synchronize()
+        start = time.time()
+        texture = postprocessing_utils.bake_texture(
+            vertices, faces, uvs, observations, masks,
+            [e.cpu().numpy() for e in extrinsics], [i.cpu().numpy() for i in intrinsics],
+            texture_size=args.texture_size, mode=mode, lambda_tv=0.01,
+        )
+        torch.cuda.synchronize()
+        elapsed = time.time() - start
+        train = psnr(vertices, faces, uvs, texture, observations, extrinsics, intrinsics)
+        test = psnr(vertices, faces, uvs, texture, test_observations, test_extrinsics, test_intrinsics)
+        print(f'{mode:>6} {elapsed:>9.2f} {train:>11.2f} {test:>10.2f}')
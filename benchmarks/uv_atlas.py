@@ -0,0 +1,63 @@
+"""
+Time of the UV atlas computation, single xatlas call versus chunks charted in a process pool.
+
+The synthetic meshes are clusters of bumpy spheres, each a separate connected component,
+with increasing face counts. `coverage` is the fraction of the atlas covered by triangles,
+which drops when the charts are packed less tightly.
+
+Usage:
+    python benchmarks/uv_atlas.py [--faces 50000 200000 800000] [--workers 8] [--max_chunk_faces 50000]
+"""
+import os
+import sys
+import time
+import argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import xatlas
+
+
+def bumpy_spheres(num_faces: int, num_spheres: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n = max(4, int(np.sqrt(num_faces / num_spheres / 4)))
+    theta, phi = np.meshgrid(np.linspace(0.05, np.pi - 0.05, n), np.linspace(0, 2 * np.pi, 2 * n, endpoint=False), indexing='ij')
+    i, j = np.meshgrid(np.arange(n - 1), np.arange(2 * n), indexing='ij')
+    a, b = i * 2 * n + j, i * 2 * n + (j + 1) % (2 * n)
+    sphere_faces = np.concatenate([np.stack([a, b, a + 2 * n], -1), np.stack([b, b + 2 * n, a + 2 * n], -1)]).reshape(-1, 3)
+    vertices, faces = [], []
+    for k in range(num_spheres):
+        r = 1 + 0.1 * np.sin(rng.integers(2, 8) * theta) * np.cos(rng.integers(2, 8) * phi)
+        v = np.stack([r * np.sin(theta) * np.cos(phi), r * np.sin(theta) * np.sin(phi), r * np.cos(theta)], -1).reshape(-1, 3)
+        vertices.append(v * rng.uniform(0.05, 0.2) + rng.uniform(-1, 1, 3))
+        faces.append(sphere_faces + k * v.shape[0])
+    return np.concatenate(vertices).astype(np.float32), np.concatenate(faces).astype(np.uint32)
+
+
+def coverage(faces, uvs):
+    t = uvs[faces]
+    e1, e2 = t[:, 1] - t[:, 0], t[:, 2] - t[:, 0]
+    return 0.5 * np.abs(e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]).sum()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--faces', type=int, nargs='+', default=[50000, 200000, 800000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max_chunk_faces', type=int, default=50000)
+    args = parser.parse_args()
+
+    from trellis.utils.atlas_utils import parametrize_parallel
+
+    print(f'workers: {args.workers}, max chunk faces: {args.max_chunk_faces}')
+    print(f'{"faces":>8} {"single (s)":>11} {"coverage":>9} {"parallel (s)":>13} {"coverage":>9} {"speedup":>8}')
+    for num_faces in args.faces:
+        vertices, faces = bumpy_spheres(num_faces)
+        start = time.time()
+        vmapping, single_faces, single_uvs = xatlas.parametrize(vertices, faces)
+        single = time.time() - start
+        start = time.time()
+        _, parallel_faces, parallel_uvs = parametrize_parallel(vertices, faces, num_workers=args.workers, max_chunk_faces=args.max_chunk_faces)
+        parallel = time.time() - start
+        print(f'{faces.shape[0]:>8} {single:>11.2f} {coverage(single_faces, single_uvs):>9.3f} '
+              f'{parallel:>13.2f} {coverage(parallel_faces, parallel_uvs):>9.3f} {single / parallel:>8.2f}')
@@ -1,24 +1,48 @@
 import os
 import shutil
+import threading
 import numpy as np
-import imageio
 import torch
-from typing import Tuple
+from typing import Callable, Optional, Tuple
 from PIL import Image
 from trellis.pipelines import TrellisImageTo3DPipeline
 from trellis.representations import Gaussian, MeshExtractResult
 from trellis.utils import render_utils, postprocessing_utils
+from trellis.utils.cache_utils import ArrayCache
+from trellis.utils.state_utils import save_state, load_state
+from trellis.utils.video_utils import BackgroundVideoWriter
 from easydict import EasyDict as edict
 import tempfile
 import streamlit as st
+import job_queue
 
 # Configuration
 MAX_SEED = np.iinfo(np.int32).max
 TMP_DIR = st.session_state.temp_dir
 os.environ['SPCONV_ALGO'] = 'native'
+COND_CACHE_MAX_BYTES = 512 * 1024 ** 2
+COND_CACHE_DIR = os.environ.get('COND_CACHE_DIR')  # Optional on-disk tier of the conditioning cache
+GLB_CACHE_MAX_BYTES = int(os.environ.get('GLB_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+GLB_CACHE_DIR = os.environ.get('GLB_CACHE_DIR')  # Optional on-disk tier of the GLB extraction cache
+NUM_MODEL_WORKERS = int(os.environ.get('NUM_MODEL_WORKERS', 1))
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 8))
+DEVICE = torch.device(os.environ.get('TRELLIS_DEVICE', 'cuda' if torch.cuda.is_available() else 'cpu'))
+VIDEO_QUEUE_SIZE = 8  # Preview frames waiting to be encoded
+STATE_COMPRESSION = os.environ.get('STATE_COMPRESSION')  # 'zstd' to compress the asset state files
+# Storage of the Gaussian attributes in the state files; the mesh is kept exact for extraction
+STATE_ENCODINGS = {
+    '_xyz': 'quant16',
+    '_features_dc': 'float16',
+    '_scaling': 'float16',
+    '_rotation': 'float16',
+    '_opacity': 'float16',
+}
 
 # Initialize pipeline (to be called once in the main app)
 pipeline = None
+_pipeline_lock = threading.Lock()  # Every model worker initializes the pipeline, only the first one loads it
+# Re-exports of the same asset with other settings reuse the unaffected stages of to_glb
+glb_cache = ArrayCache(max_bytes=GLB_CACHE_MAX_BYTES, cache_dir=GLB_CACHE_DIR)
 
 def initialize_pipeline():
     """
@@ -28,15 +52,37 @@ def initialize_pipeline():
         None: The function initializes the pipeline and sets it to the global variable.
     """
     global pipeline
-    if pipeline is None:
-        pipeline = TrellisImageTo3DPipeline.from_pretrained("JeffreyXiang/TRELLIS-image-large")
-        pipeline.cuda()
-        try:
-            pipeline.preprocess_image(Image.fromarray(np.zeros((512, 512, 3), dtype=np.uint8)))  # Preload rembg
-        except:
-            pass
+    with _pipeline_lock:
+        if pipeline is None:
+            new_pipeline = TrellisImageTo3DPipeline.from_pretrained("JeffreyXiang/TRELLIS-image-large")
+            new_pipeline.to(DEVICE)
+            if DEVICE.type == 'cpu':
+                new_pipeline.convert_to_fp32()
+            # Re-rolls of the same image skip background removal and image encoding
+            new_pipeline.cond_cache = ArrayCache(max_bytes=COND_CACHE_MAX_BYTES, cache_dir=COND_CACHE_DIR)
+            try:
+                new_pipeline.preprocess_image(Image.fromarray(np.zeros((512, 512, 3), dtype=np.uint8)))  # Preload rembg
+            except:
+                pass
+            # Only published once fully set up, so that a worker never sees a half-initialized pipeline
+            pipeline = new_pipeline
     return pipeline
 
+@st.cache_resource
+def get_job_queue() -> job_queue.JobQueue:
+    """
+    Get the process-wide job queue that runs generation and GLB extraction off the Streamlit script thread.
+
+    Returns:
+        job_queue.JobQueue: The job queue, whose workers share the pipeline from initialize_pipeline.
+            Concurrent jobs are independent: each run draws its noise from a generator seeded with its own seed.
+    """
+    return job_queue.JobQueue(
+        num_workers=NUM_MODEL_WORKERS,
+        max_queue_size=MAX_QUEUED_JOBS,
+        worker_init=initialize_pipeline,
+    )
+
 def preprocess_image(image: Image.Image) -> Image.Image:
     """
     Preprocess the input image.
@@ -47,55 +93,70 @@ def preprocess_image(image: Image.Image) -> Image.Image:
     """
     return pipeline.preprocess_image(image)
 
-def pack_state(gs: Gaussian, mesh: MeshExtractResult) -> dict:
+def voxel_preview_image(coords: np.ndarray, resolution: int = 64) -> np.ndarray:
+    """
+    Render occupied voxels as a depth-shaded front view, nearer voxels brighter.
+    Args:
+        coords (np.ndarray): The (N, 3) integer voxel coordinates (x, y, z), z up.
+        resolution (int): The resolution of the voxel grid.
+    Returns:
+        np.ndarray: A (resolution, resolution) uint8 grayscale image.
+    """
+    image = np.zeros((resolution, resolution), dtype=np.float32)
+    shade = 1 - 0.75 * coords[:, 1] / resolution
+    np.maximum.at(image, (resolution - 1 - coords[:, 2], coords[:, 0]), shade)
+    return (image * 255).astype(np.uint8)
+
+def pack_state(gs: Gaussian, mesh: MeshExtractResult, path: str) -> str:
     """
-    Pack the Gaussian and mesh states into a dictionary.
+    Pack the Gaussian and mesh states into a state file, so that the session only keeps its path.
     Args:
         gs (Gaussian): The Gaussian object.
         mesh (MeshExtractResult): The mesh object.
+        path (str): The path of the state file.
     Returns:
-        dict: A dictionary containing the packed states.
-    """
-    return {
-        'gaussian': {
-            **gs.init_params,
-            '_xyz': gs._xyz.cpu().numpy(),
-            '_features_dc': gs._features_dc.cpu().numpy(),
-            '_scaling': gs._scaling.cpu().numpy(),
-            '_rotation': gs._rotation.cpu().numpy(),
-            '_opacity': gs._opacity.cpu().numpy(),
-        },
-        'mesh': {
-            'vertices': mesh.vertices.cpu().numpy(),
-            'faces': mesh.faces.cpu().numpy(),
+        str: The path of the state file.
+    """
+    init_params = {k: v.tolist() if isinstance(v, (torch.Tensor, np.ndarray)) else v for k, v in gs.init_params.items()}
+    save_state(
+        path,
+        {
+            '_xyz': gs._xyz,
+            '_features_dc': gs._features_dc,
+            '_scaling': gs._scaling,
+            '_rotation': gs._rotation,
+            '_opacity': gs._opacity,
+            'vertices': mesh.vertices,
+            'faces': mesh.faces.int(),
         },
-    }
+        meta={'gaussian': init_params},
+        encodings=STATE_ENCODINGS,
+        compression=STATE_COMPRESSION,
+    )
+    return path
 
-def unpack_state(state: dict) -> Tuple[Gaussian, edict]:
+def unpack_state(state: str, device: torch.device = DEVICE) -> Tuple[Gaussian, edict]:
     """
-    Unpack the state dictionary into Gaussian and mesh objects.
+    Unpack a state file into Gaussian and mesh objects.
     Args:
-        state (dict): A dictionary containing packed states.
+        state (str): The path of the state file.
+        device (torch.device): The device to put the tensors on.
     Returns:
         Tuple[Gaussian, edict]: A tuple containing the Gaussian object and mesh object.
     """
-    gs = Gaussian(
-        aabb=state['gaussian']['aabb'],
-        sh_degree=state['gaussian']['sh_degree'],
-        mininum_kernel_size=state['gaussian']['mininum_kernel_size'],
-        scaling_bias=state['gaussian']['scaling_bias'],
-        opacity_bias=state['gaussian']['opacity_bias'],
-        scaling_activation=state['gaussian']['scaling_activation'],
-    )
-    gs._xyz = torch.tensor(state['gaussian']['_xyz'], device='cuda')
-    gs._features_dc = torch.tensor(state['gaussian']['_features_dc'], device='cuda')
-    gs._scaling = torch.tensor(state['gaussian']['_scaling'], device='cuda')
-    gs._rotation = torch.tensor(state['gaussian']['_rotation'], device='cuda')
-    gs._opacity = torch.tensor(state['gaussian']['_opacity'], device='cuda')
-    
+    arrays, meta = load_state(state)
+    # The arrays are memory-mapped: from_numpy wraps them without a copy, and .to copies them once to the device
+    tensor = lambda name, dtype=torch.float32: torch.from_numpy(arrays[name]).to(device=device, dtype=dtype)
+    gs = Gaussian(**meta['gaussian'], device=device)
+    gs._xyz = tensor('_xyz')
+    gs._features_dc = tensor('_features_dc')
+    gs._scaling = tensor('_scaling')
+    gs._rotation = tensor('_rotation')
+    gs._opacity = tensor('_opacity')
+
     mesh = edict(
-        vertices=torch.tensor(state['mesh']['vertices'], device='cuda'),
-        faces=torch.tensor(state['mesh']['faces'], device='cuda'),
+        vertices=tensor('vertices'),
+        faces=tensor('faces', torch.int64),
     )
     return gs, mesh
 
@@ -116,7 +177,9 @@ def image_to_3d(
     ss_guidance_strength: float = 7.5,
     ss_sampling_steps: int = 12,
     slat_guidance_strength: float = 3.0,
-    slat_sampling_steps: int = 12
+    slat_sampling_steps: int = 12,
+    output_dir: Optional[str] = None,
+    progress: Optional[Callable[[str], None]] = None,
 ) -> Tuple[dict, str]:
     """
     Convert an image to a 3D model.
@@ -128,8 +191,11 @@ def image_to_3d(
         ss_sampling_steps (int): Number of sampling steps for sparse structure.
         slat_guidance_strength (float): Strength for slat guidance.
         slat_sampling_steps (int): Number of sampling steps for slat.
+        output_dir (str): Directory to write the video to. Defaults to TMP_DIR.
+        progress (Callable): Called with the name of each stage as it starts, and with a coarse
+            voxel preview image during sparse structure sampling.
     Returns:
-        Tuple[dict, str]: A tuple containing the state dictionary and the video path.
+        Tuple[str, str]: A tuple containing the path of the state file and the video path.
     """
 
     outputs = pipeline.run(
@@ -145,33 +211,53 @@ def image_to_3d(
             "steps": slat_sampling_steps,
             "cfg_strength": slat_guidance_strength,
         },
+        progress=progress,
+        preview=None if progress is None else lambda coords: progress(
+            job_queue.SAMPLING_SS, preview=voxel_preview_image(coords[:, 1:].cpu().numpy())
+        ),
+    )
+    if progress is not None:
+        progress(job_queue.RENDERING)
+    video_path = os.path.join(output_dir or TMP_DIR, 'sample.mp4')
+    # Color and normals are rendered side by side in one pass, and the frames are encoded on a
+    # background thread as they are rendered. The writer holds up to its queue size plus one frame.
+    # Without CUDA the samples are rendered by the PyTorch renderers, see render_utils.
+    frames = render_utils.iter_video(
+        [outputs['gaussian'][0], outputs['mesh'][0]], num_frames=120,
+        channels=['color', 'normal'], num_buffers=VIDEO_QUEUE_SIZE + 2,
     )
-    video = render_utils.render_video(outputs['gaussian'][0], num_frames=120)['color']
-    video_geo = render_utils.render_video(outputs['mesh'][0], num_frames=120)['normal']
-    video = [np.concatenate([video[i], video_geo[i]], axis=1) for i in range(len(video))]
-    video_path = os.path.join(TMP_DIR, 'sample.mp4')
-    imageio.mimsave(video_path, video, fps=15)
-    state = pack_state(outputs['gaussian'][0], outputs['mesh'][0])
-    torch.cuda.empty_cache()
+    with BackgroundVideoWriter(video_path, fps=15, max_queue_size=VIDEO_QUEUE_SIZE) as writer:
+        for frame in frames:
+            writer.write(frame['composite'])
+    state = pack_state(outputs['gaussian'][0], outputs['mesh'][0], os.path.join(output_dir or TMP_DIR, 'sample.state'))
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
     return state, video_path
 
 def extract_glb(
-    state: dict,
+    state: str,
     mesh_simplify: float = 0.95,
-    texture_size: int = 1024
+    texture_size: int = 1024,
+    output_dir: Optional[str] = None,
+    progress: Optional[Callable[[str], None]] = None,
 ) -> str:
     """
     Extract a GLB file from the 3D model state.
     Args:
-        state (dict): The state dictionary containing the 3D model data.
+        state (str): The path of the state file of the 3D model.
         mesh_simplify (float): The simplification factor for the mesh.
         texture_size (int): The size of the texture.
+        output_dir (str): Directory to write the GLB file to. Defaults to TMP_DIR.
+        progress (Callable): Called with the name of each stage as it starts.
     Returns:
-        str: The path to the generated GLB file.
+        str: The path to the generated GLB file. Without CUDA the mesh is untextured, see `to_glb`.
     """
+    if progress is not None:
+        progress(job_queue.BAKING)
     gs, mesh = unpack_state(state)
-    glb = postprocessing_utils.to_glb(gs, mesh, simplify=mesh_simplify, texture_size=texture_size, verbose=False)
-    glb_path = os.path.join(TMP_DIR, 'sample.glb')
+    glb = postprocessing_utils.to_glb(gs, mesh, simplify=mesh_simplify, texture_size=texture_size, cache=glb_cache, verbose=False)
+    glb_path = os.path.join(output_dir or TMP_DIR, 'sample.glb')
     glb.export(glb_path)
-    torch.cuda.empty_cache()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
     return glb_path
\ No newline at end of file
@@ -0,0 +1,202 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# Job statuses. The stage statuses are reported by the job function through its `progress` callback.
+QUEUED = 'queued'
+SAMPLING_SS = 'sampling_ss'
+SAMPLING_SLAT = 'sampling_slat'
+DECODING = 'decoding'
+RENDERING = 'rendering'
+BAKING = 'baking'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job when it has been cancelled.
+    """
+    pass
+
+
+class Job:
+    """
+    A unit of work submitted to a JobQueue.
+
+    Args:
+        job_id (str): The unique id of the job.
+        fn (Callable): The function to run. It is called as `fn(*args, progress=..., **kwargs)`.
+        args (tuple): Positional arguments of the function.
+        kwargs (dict): Keyword arguments of the function.
+    """
+    def __init__(self, job_id: str, fn: Callable, args: tuple, kwargs: dict):
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = QUEUED
+        self.result = None
+        self.preview = None
+        self.error = None
+        self.traceback = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_requested = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def progress(self, status: str, preview: Any = None) -> None:
+        """
+        Report the stage the job has reached, optionally with an intermediate preview of its result.
+        Raises JobCancelled if the job has been cancelled, so cancellation takes effect at the next report.
+        """
+        if self._cancel_requested:
+            raise JobCancelled(self.id)
+        self.status = status
+        if preview is not None:
+            self.preview = preview
+
+
+class JobQueue:
+    """
+    A bounded job queue served by a pool of model worker threads.
+
+    Jobs are submitted with `submit`, which returns immediately with a job id. The caller
+    then polls the job with `poll` until it has finished, and reads its result or error.
+
+    Args:
+        num_workers (int): The number of worker threads.
+        max_queue_size (int): The maximum number of queued jobs. `submit` raises queue.Full beyond it.
+        max_finished_jobs (int): The number of finished jobs whose results are kept; the oldest are dropped first.
+        worker_init (Callable): Called once in each worker thread before it serves jobs, e.g. to load the pipeline.
+    """
+    def __init__(
+        self,
+        num_workers: int = 1,
+        max_queue_size: int = 8,
+        max_finished_jobs: int = 64,
+        worker_init: Optional[Callable[[], Any]] = None,
+    ):
+        self.num_workers = num_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.worker_init = worker_init
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f'model-worker-{i}', daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> str:
+        """
+        Queue a job without blocking.
+
+        Args:
+            fn (Callable): The function to run. It receives a `progress` keyword argument to report its stage.
+            *args, **kwargs: Arguments of the function.
+
+        Returns:
+            str: The id of the job.
+        """
+        job = Job(uuid.uuid4().hex, fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise
+        return job.id
+
+    def poll(self, job_id: str) -> Optional[Job]:
+        """
+        Get a job by id, or None if it is unknown or its result has been dropped.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job. A queued job is never run; a running job stops at its next stage boundary.
+
+        Returns:
+            bool: Whether the job was still unfinished.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job._cancel_requested = True
+            if job.started_at is None:
+                self._finish(job, CANCELLED)
+        return True
+
+    def forget(self, job_id: str) -> None:
+        """
+        Drop a job and its result.
+        """
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the workers after the jobs already queued.
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _finish(self, job: Job, status: str) -> None:
+        # Must be called with the lock held
+        job.status = status
+        job.finished_at = time.time()
+        finished = [k for k, j in self._jobs.items() if j.finished]
+        for k in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[k]
+
+    def _worker_loop(self) -> None:
+        if self.worker_init is not None:
+            self.worker_init()
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            with self._lock:
+                if job.finished:
+                    continue
+                job.started_at = time.time()
+            try:
+                result = job.fn(*job.args, progress=job.progress, **job.kwargs)
+            except JobCancelled:
+                with self._lock:
+                    self._finish(job, CANCELLED)
+            except Exception as e:
+                job.error = str(e)
+                job.traceback = traceback.format_exc()
+                with self._lock:
+                    self._finish(job, FAILED)
+            else:
+                job.result = result
+                with self._lock:
+                    self._finish(job, DONE)
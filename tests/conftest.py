@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Run the tests against the source tree, on CPU
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ATTN_BACKEND', 'sdpa')
+os.environ.setdefault('SPARSE_BACKEND', 'torch')
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from trellis.utils.atlas_utils import face_components, split_mesh, parametrize_parallel
+
+
+def spheres(num_spheres: int = 4, n: int = 12, seed: int = 0):
+    # Separate UV spheres of different sizes, each one connected component of 4 * n * (n - 1) faces
+    rng = np.random.default_rng(seed)
+    theta, phi = np.meshgrid(np.linspace(0.2, np.pi - 0.2, n), np.linspace(0, 2 * np.pi, 2 * n, endpoint=False), indexing='ij')
+    sphere = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)], -1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(n - 1), np.arange(2 * n), indexing='ij')
+    a, b = i * 2 * n + j, i * 2 * n + (j + 1) % (2 * n)
+    sphere_faces = np.concatenate([np.stack([a, b, a + 2 * n], -1), np.stack([b, b + 2 * n, a + 2 * n], -1)]).reshape(-1, 3)
+    vertices = np.concatenate([sphere * (0.1 + 0.1 * k) + rng.uniform(-1, 1, 3) for k in range(num_spheres)])
+    faces = np.concatenate([sphere_faces + k * sphere.shape[0] for k in range(num_spheres)])
+    return vertices.astype(np.float32), faces.astype(np.uint32)
+
+
+def triangle_set(vertices, faces):
+    return set(frozenset(map(tuple, triangle)) for triangle in np.round(vertices[faces].astype(np.float64), 5).tolist())
+
+
+def test_face_components_numbered_by_first_face():
+    # Two triangles sharing only a vertex are connected; the third one is not
+    faces = np.array([[4, 5, 6], [0, 1, 2], [2, 3, 1]])
+    assert face_components(faces, 7).tolist() == [0, 1, 1]
+    _, faces = spheres(3)
+    labels = face_components(faces[::-1].copy(), faces.max() + 1)
+    assert np.bincount(labels).tolist() == [faces.shape[0] // 3] * 3
+    assert labels[0] == 0 and labels[-1] == 2
+
+
+def test_split_mesh_covers_every_face_once():
+    vertices, faces = spheres(4)
+    sphere_faces = faces.shape[0] // 4
+    # Whole components are grouped in order, without splitting them
+    chunks = split_mesh(vertices, faces, 2 * sphere_faces)
+    assert [chunk.shape[0] for chunk in chunks] == [2 * sphere_faces] * 2
+    assert np.array_equal(np.sort(np.concatenate(chunks)), np.arange(faces.shape[0]))
+    # Components larger than the maximum are bisected spatially
+    chunks = split_mesh(vertices, faces, sphere_faces // 3)
+    assert all(chunk.shape[0] <= sphere_faces // 3 for chunk in chunks)
+    assert np.array_equal(np.sort(np.concatenate(chunks)), np.arange(faces.shape[0]))
+    labels = face_components(faces, vertices.shape[0])
+    assert all(np.unique(labels[chunk]).shape[0] == 1 for chunk in chunks)
+    # Balanced over a number of chunks
+    chunks = split_mesh(vertices, faces, sphere_faces // 2, num_chunks=3)
+    sizes = [chunk.shape[0] for chunk in chunks]
+    assert len(chunks) == 3 and sum(sizes) == faces.shape[0] and max(sizes) - min(sizes) <= sphere_faces // 2
+
+
+@pytest.mark.skipif(os.cpu_count() == 1, reason='xatlas crashes with a single hardware thread')
+@pytest.mark.parametrize('num_workers', [1, 2])
+def test_parametrize_parallel_reassembles_chunks(num_workers):
+    vertices, faces = spheres(4)
+    out_vertices, out_faces, uvs = parametrize_parallel(vertices, faces, num_workers=num_workers, max_chunk_faces=faces.shape[0] // 6)
+    # The same triangles, with the vertices split along the seams
+    assert out_faces.shape == faces.shape and uvs.shape == (out_vertices.shape[0], 2)
+    assert triangle_set(out_vertices, out_faces) == triangle_set(vertices, faces)
+    assert uvs.min() >= 0 and uvs.max() <= 1
+    # The charts of all chunks are packed at one texel density
+    corners, texcoords = out_vertices[out_faces].astype(np.float64), uvs[out_faces].astype(np.float64)
+    area = 0.5 * np.linalg.norm(np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+    e1, e2 = texcoords[:, 1] - texcoords[:, 0], texcoords[:, 2] - texcoords[:, 0]
+    uv_area = 0.5 * np.abs(e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0])
+    density = uv_area.sum() / area.sum()
+    chunks = split_mesh(vertices, faces, faces.shape[0] // 6)
+    start = 0
+    for chunk in chunks:
+        chunk_density = uv_area[start:start + chunk.shape[0]].sum() / area[start:start + chunk.shape[0]].sum()
+        assert abs(chunk_density / density - 1) < 0.1
+        start += chunk.shape[0]
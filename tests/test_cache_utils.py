@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+import torch
+from PIL import Image
+from trellis.pipelines import TrellisImageTo3DPipeline
+from trellis.utils.cache_utils import ArrayCache
+
+
+def test_cached_conditions_do_not_share_the_batch():
+    calls = []
+    def encode_image(images):
+        calls.append(len(images))
+        return torch.stack([torch.full((4, 8), float(i)) for i in range(len(images))])
+    pipeline = SimpleNamespace(encode_image=encode_image, device=torch.device('cpu'))
+    images = [Image.new('RGB', (8, 8), (i * 40, 0, 0)) for i in range(3)]
+    cache = ArrayCache()
+
+    cond = TrellisImageTo3DPipeline._encode_image_cached(pipeline, images, cache)
+    assert cond.shape == (3, 4, 8)
+    for entry in cache._entries.values():
+        # Each entry owns only the storage of its own slice, which is what the cache budget counts
+        assert entry['cond'].untyped_storage().nbytes() == entry['cond'].numel() * entry['cond'].element_size()
+    assert cache.num_bytes == 3 * 4 * 8 * 4
+
+    # Cached images are not encoded again
+    cond_again = TrellisImageTo3DPipeline._encode_image_cached(pipeline, images[1:] + [Image.new('RGB', (8, 8), (0, 255, 0))], cache)
+    assert calls == [3, 1]
+    torch.testing.assert_close(cond_again[:2], cond[1:])
@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+import pytest
+import job_queue
+
+
+def wait_until_finished(jobs: job_queue.JobQueue, job_id: str, timeout: float = 5) -> job_queue.Job:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.poll(job_id)
+        if job is not None and job.finished:
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+
+def staged_job(release: threading.Event, started: threading.Event = None, value=None, progress=None):
+    """
+    Stub of a pipeline job: reports two stages and waits for `release` in between.
+    """
+    progress(job_queue.SAMPLING_SS, preview='preview')
+    if started is not None:
+        started.set()
+    release.wait(5)
+    progress(job_queue.DECODING)
+    return value
+
+
+@pytest.fixture
+def jobs():
+    jobs = job_queue.JobQueue(num_workers=1, max_queue_size=2, max_finished_jobs=2)
+    yield jobs
+    jobs.shutdown(wait=False)
+
+
+def test_submit_and_poll(jobs):
+    release, started = threading.Event(), threading.Event()
+    job_id = jobs.submit(staged_job, release, started, value=42)
+    assert started.wait(5)
+    job = jobs.poll(job_id)
+    assert job.status == job_queue.SAMPLING_SS and job.preview == 'preview'
+    release.set()
+    job = wait_until_finished(jobs, job_id)
+    assert job.status == job_queue.DONE and job.result == 42
+
+
+def test_failed_job_keeps_its_error(jobs):
+    def failing_job(progress=None):
+        raise ValueError('broken')
+    job = wait_until_finished(jobs, jobs.submit(failing_job))
+    assert job.status == job_queue.FAILED
+    assert job.error == 'broken' and 'ValueError' in job.traceback
+
+
+def test_cancel_running_and_queued_jobs(jobs):
+    release, started = threading.Event(), threading.Event()
+    running = jobs.submit(staged_job, release, started)
+    queued = jobs.submit(staged_job, release)
+    assert started.wait(5)
+    assert jobs.cancel(queued)
+    assert jobs.poll(queued).status == job_queue.CANCELLED
+    assert jobs.cancel(running)
+    # A running job stops at its next progress report
+    release.set()
+    assert wait_until_finished(jobs, running).status == job_queue.CANCELLED
+    assert not jobs.cancel(running)
+    assert jobs.poll(queued).started_at is None
+
+
+def test_submit_raises_when_queue_is_full(jobs):
+    release, started = threading.Event(), threading.Event()
+    jobs.submit(staged_job, release, started)
+    assert started.wait(5)
+    queued = [jobs.submit(staged_job, release) for _ in range(2)]
+    with pytest.raises(queue.Full):
+        jobs.submit(staged_job, release)
+    release.set()
+    for job_id in queued:
+        assert wait_until_finished(jobs, job_id).status == job_queue.DONE
+
+
+def test_oldest_finished_jobs_are_evicted(jobs):
+    release = threading.Event()
+    release.set()
+    job_ids = []
+    for i in range(4):
+        job_ids.append(jobs.submit(staged_job, release, value=i))
+        wait_until_finished(jobs, job_ids[-1])
+    assert [jobs.poll(job_id) for job_id in job_ids[:2]] == [None, None]
+    assert [jobs.poll(job_id).result for job_id in job_ids[2:]] == [2, 3]
+
+
+def test_worker_init_runs_in_every_worker():
+    initialized = []
+    lock = threading.Lock()
+    def worker_init():
+        with lock:
+            initialized.append(threading.current_thread().name)
+    jobs = job_queue.JobQueue(num_workers=3, worker_init=worker_init)
+    jobs.shutdown(wait=True)
+    assert sorted(initialized) == [f'model-worker-{i}' for i in range(3)]
@@ -0,0 +1,68 @@
+import numpy as np
+from trellis.utils.postprocessing_utils import postprocess_mesh
+
+
+def nested_cubes():
+    # A small cube fully enclosed by a large one: only the faces of the large one can be seen
+    corners = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=np.float32)
+    faces = np.array([
+        [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+        [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+        [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],
+    ])
+    return np.concatenate([corners * 0.5, corners * 0.2]), np.concatenate([faces, faces + 8])
+
+
+def uv_sphere(n: int = 40):
+    theta, phi = np.meshgrid(np.linspace(0, np.pi, n + 2)[1:-1], np.linspace(0, 2 * np.pi, 2 * n, endpoint=False), indexing='ij')
+    vertices = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)], -1).reshape(-1, 3)
+    i, j = np.meshgrid(np.arange(n - 1), np.arange(2 * n), indexing='ij')
+    a, b = i * 2 * n + j, i * 2 * n + (j + 1) % (2 * n)
+    faces = np.concatenate([np.stack([a, b, a + 2 * n], -1), np.stack([b, b + 2 * n, a + 2 * n], -1)]).reshape(-1, 3)
+    j = np.arange(2 * n)
+    faces = np.concatenate([
+        faces,
+        np.stack([np.full(2 * n, n * 2 * n), (j + 1) % (2 * n), j], -1),
+        np.stack([np.full(2 * n, n * 2 * n + 1), (n - 1) * 2 * n + j, (n - 1) * 2 * n + (j + 1) % (2 * n)], -1),
+    ])
+    vertices = np.concatenate([vertices, [[0, 0, 1], [0, 0, -1]]])
+    return vertices.astype(np.float32), faces.astype(np.int64)
+
+
+def test_simplify_keeps_closed_surface():
+    vertices, faces = uv_sphere()
+    out_vertices, out_faces = postprocess_mesh(vertices, faces, simplify=True, simplify_ratio=0.9, fill_holes=False)
+    assert abs(out_faces.shape[0] - faces.shape[0] // 10) <= faces.shape[0] // 100
+    # Still a closed manifold sphere: every edge has two faces, and the Euler characteristic is 2
+    edges = np.sort(np.concatenate([out_faces[:, [0, 1]], out_faces[:, [1, 2]], out_faces[:, [2, 0]]]), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+    assert (counts == 2).all()
+    assert out_vertices.shape[0] - edges.shape[0] + out_faces.shape[0] == 2
+    assert np.abs(np.linalg.norm(out_vertices, axis=1) - 1).max() < 0.05
+
+
+def test_fill_holes_on_cpu_returns_stats():
+    vertices, faces = nested_cubes()
+    out_vertices, out_faces, stats = postprocess_mesh(
+        vertices, faces, simplify=False,
+        fill_holes_resolution=64, fill_holes_num_views=32,
+        fill_holes_mincut_solver='scipy', fill_holes_backend='torch', device='cpu',
+        return_stats=True,
+    )
+    assert out_faces.shape == (12, 3) and np.abs(out_vertices).max() == 0.5
+    assert stats.fill_holes.resolution == 64 and stats.fill_holes.num_views == stats.fill_holes.max_views == 32
+    assert stats.fill_holes.num_invisible == 12 and stats.fill_holes.num_removed == 12
+
+
+def test_adaptive_fill_holes_reports_views():
+    vertices, faces = nested_cubes()
+    _, out_faces, stats = postprocess_mesh(
+        vertices, faces, simplify=False,
+        fill_holes_resolution=None, fill_holes_num_views=64, fill_holes_adaptive_views=True,
+        fill_holes_mincut_solver='scipy', fill_holes_backend='torch', device='cpu',
+        return_stats=True,
+    )
+    assert out_faces.shape == (12, 3)
+    assert 256 <= stats.fill_holes.resolution <= 1024
+    assert 32 <= stats.fill_holes.num_views <= 64 and stats.fill_holes.max_views == 64
+    assert stats.fill_holes.visibility_time_saved >= 0
@@ -0,0 +1,153 @@
+import itertools
+import pytest
+import torch
+import torch.nn as nn
+from trellis.modules import sparse as sp
+from trellis.modules.attention import MultiHeadAttention, CachedContext
+from trellis.pipelines.samplers import base as sampler_base
+from trellis.pipelines.samplers import FlowAdaptiveSampler, FlowEulerCfgSampler, FlowEulerGuidanceIntervalSampler
+
+
+class RiggedAdaptiveSampler(FlowAdaptiveSampler):
+    """
+    Adaptive sampler whose error estimate is replaced by a fixed one, chosen by the end of the step.
+    """
+    def __init__(self, *args, error_fn, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.error_fn = error_fn
+
+    def _get_model_prediction(self, model, x_t, t, cond=None, **kwargs):
+        self.last_t = t
+        return super()._get_model_prediction(model, x_t, t, cond, **kwargs)
+
+    def _error_norm(self, err, x, x_new):
+        return self.error_fn(self.last_t)
+
+
+def bounded_model(max_evals: int = 1000):
+    evals = itertools.count()
+    def model(x_t, t, cond):
+        if next(evals) >= max_evals:
+            raise RuntimeError('The sampler does not terminate')
+        return -x_t
+    return model
+
+
+@pytest.mark.parametrize('min_step', [0.02, 0.05, 0.1])
+@pytest.mark.parametrize('steps', [3, 7, 8, 13])
+def test_adaptive_sampler_terminates_when_last_step_is_rejected(min_step, steps):
+    sampler = RiggedAdaptiveSampler(1e-5, min_step=min_step, error_fn=lambda t_prev: 1.5 if t_prev == 0 else 0.5)
+    outputs = list(sampler.sample_iter(bounded_model(), torch.randn(2, 4), steps=steps, verbose=False))
+    assert outputs[-1].num_steps == len(outputs)
+
+
+@pytest.mark.parametrize('error', [2.0, float('nan')])
+def test_adaptive_sampler_terminates_when_every_step_is_rejected(error):
+    sampler = RiggedAdaptiveSampler(1e-5, min_step=0.05, max_rejections=4, error_fn=lambda t_prev: error)
+    outputs = list(sampler.sample_iter(bounded_model(), torch.randn(2, 4), steps=4, verbose=False))
+    assert outputs[-1].num_steps == len(outputs)
+
+
+class ToyDenseModel(nn.Module):
+    """
+    Dense flow model with a cross-attention to the condition, per sample.
+    """
+    def __init__(self, channels: int = 8, ctx_channels: int = 16, supports_cached_context: bool = False):
+        super().__init__()
+        self.attn = MultiHeadAttention(channels, 2, ctx_channels=ctx_channels, type='cross')
+        self.supports_cached_context = supports_cached_context
+
+    def forward(self, x, t, cond):
+        tokens = x.flatten(2).transpose(1, 2)
+        h = tokens + self.attn(tokens, cond) + 1e-3 * t[:, None, None]
+        return h.transpose(1, 2).reshape(x.shape)
+
+
+class ToySparseModel(nn.Module):
+    """
+    Sparse flow model with a cross-attention of every voxel to the condition of its batch.
+    """
+    def __init__(self, channels: int = 8, ctx_channels: int = 16, supports_cached_context: bool = False):
+        super().__init__()
+        self.attn = sp.SparseMultiHeadAttention(channels, 2, ctx_channels=ctx_channels, type='cross')
+        self.supports_cached_context = supports_cached_context
+
+    def forward(self, x, t, cond):
+        h = self.attn(x, cond)
+        return x.replace(x.feats + h.feats + 1e-3 * t[x.coords[:, 0].long(), None])
+
+
+def toy_inputs(sparse: bool, batch_size: int = 2, channels: int = 8):
+    generator = torch.Generator().manual_seed(0)
+    cond = torch.randn(batch_size, 5, 16, generator=generator)
+    neg_cond = torch.zeros_like(cond)
+    if sparse:
+        coords = torch.argwhere(torch.rand(batch_size, 6, 6, 6, generator=generator) < 0.3).int()
+        noise = sp.SparseTensor(torch.randn(coords.shape[0], channels, generator=generator), coords)
+    else:
+        noise = torch.randn(batch_size, channels, 4, 4, 4, generator=generator)
+    return noise, cond, neg_cond
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('cached', [False, True])
+@pytest.mark.parametrize('sampler_cls', [FlowEulerCfgSampler, FlowEulerGuidanceIntervalSampler])
+def test_fused_cfg_matches_two_passes(sparse, cached, sampler_cls):
+    torch.manual_seed(0)
+    model = (ToySparseModel if sparse else ToyDenseModel)(supports_cached_context=cached).eval()
+    noise, cond, neg_cond = toy_inputs(sparse)
+    kwargs = {'cfg_interval': (0.2, 0.8)} if sampler_cls is FlowEulerGuidanceIntervalSampler else {}
+    sampler = sampler_cls(1e-5)
+    samples = [
+        sampler.sample(model, noise, cond, neg_cond, steps=4, cfg_strength=3.0, cfg_fused=fused, verbose=False, **kwargs).samples
+        for fused in (False, True)
+    ]
+    if sparse:
+        assert torch.equal(samples[0].coords, samples[1].coords)
+        samples = [s.feats for s in samples]
+    torch.testing.assert_close(samples[1], samples[0], rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('fused', [False, True])
+@pytest.mark.parametrize('sampler_cls', [FlowEulerCfgSampler, FlowEulerGuidanceIntervalSampler])
+def test_cached_context_matches_uncached(sparse, fused, sampler_cls, monkeypatch):
+    contexts = []
+    def cached_context(context):
+        contexts.append(CachedContext(context))
+        return contexts[-1]
+    monkeypatch.setattr(sampler_base, 'CachedContext', cached_context)
+
+    torch.manual_seed(0)
+    model = (ToySparseModel if sparse else ToyDenseModel)().eval()
+    noise, cond, neg_cond = toy_inputs(sparse)
+    kwargs = {'cfg_interval': (0.2, 0.8)} if sampler_cls is FlowEulerGuidanceIntervalSampler else {}
+    sampler = sampler_cls(1e-5)
+    def sample(cond):
+        samples = sampler.sample(model, noise, cond, neg_cond, steps=4, cfg_strength=3.0, cfg_fused=fused, verbose=False, **kwargs).samples
+        return samples.feats if sparse else samples
+
+    # Two runs with different conditions, so that projections cached by the first run must not leak into the second
+    conds = [cond, cond.flip(0)]
+    expected = [sample(c) for c in conds]
+    assert len(contexts) == 0
+    model.supports_cached_context = True
+    for c, e in zip(conds, expected):
+        assert torch.equal(sample(c), e)
+    # Fused guidance caches the projections of the concatenated contexts, derived from the ones created here
+    def has_kv(context):
+        return len(context._kv) > 0 or any(has_kv(c) for c in context._derived.values())
+    assert any(has_kv(c) for c in contexts)
+
+
+def test_cached_context_is_invalidated_by_in_place_updates():
+    torch.manual_seed(0)
+    attn = MultiHeadAttention(8, 2, ctx_channels=16, type='cross').eval()
+    x = torch.randn(2, 3, 8)
+    cond = torch.randn(2, 5, 16)
+    context = CachedContext(cond)
+    with torch.no_grad():
+        torch.testing.assert_close(attn(x, context), attn(x, cond))
+        assert len(context._kv) == 1
+        cond.mul_(2)
+        torch.testing.assert_close(attn(x, context), attn(x, cond))
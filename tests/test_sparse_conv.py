@@ -0,0 +1,72 @@
+import pytest
+import torch
+import torch.nn.functional as F
+from trellis.modules import sparse as sp
+
+
+pytestmark = pytest.mark.skipif(sp.BACKEND != 'torch', reason='Tests the pure PyTorch sparse backend')
+
+
+def random_sparse_tensor(channels: int, resolution: int = 9, batch_size: int = 2, density: float = 0.3) -> sp.SparseTensor:
+    generator = torch.Generator().manual_seed(0)
+    occupied = torch.rand(batch_size, resolution, resolution, resolution, generator=generator) < density
+    coords = torch.argwhere(occupied).int()
+    return sp.SparseTensor(torch.randn(coords.shape[0], channels, generator=generator), coords)
+
+
+def gather(dense: torch.Tensor, coords: torch.Tensor) -> torch.Tensor:
+    coords = coords.long()
+    return dense[coords[:, 0], :, coords[:, 1], coords[:, 2], coords[:, 3]]
+
+
+@pytest.mark.parametrize('kernel_size, stride, padding, dilation', [
+    (3, 1, None, 1),
+    (3, 2, None, 1),
+    (3, 2, 1, 1),
+    (2, 2, None, 1),
+    (3, 2, 0, 2),
+    ((3, 2, 1), (2, 1, 2), (1, 0, 1), 1),
+])
+def test_sparse_conv_matches_dense_conv(kernel_size, stride, padding, dilation):
+    x = random_sparse_tensor(3)
+    conv = sp.SparseConv3d(3, 4, kernel_size, stride=stride, padding=padding, dilation=dilation)
+    y = conv(x)
+
+    weight = conv.conv.weight.permute(0, 4, 1, 2, 3)
+    if stride == 1 and padding is None:
+        # Submanifold: the dense convolution at the input voxels
+        pad = tuple((k // 2) * dilation for k in weight.shape[2:])
+        expected = F.conv3d(x.dense(), weight, conv.conv.bias, padding=pad, dilation=dilation)
+        assert torch.equal(y.coords, x.coords)
+    else:
+        expected = F.conv3d(x.dense(), weight, conv.conv.bias, stride=stride, padding=padding or 0, dilation=dilation)
+        # The output voxels are exactly those reached by an input voxel
+        reached = F.conv3d((x.dense().abs().sum(1, keepdim=True) > 0).float(), torch.ones(1, 1, *weight.shape[2:]), stride=stride, padding=padding or 0, dilation=dilation) > 0
+        assert y.coords.shape[0] == reached.sum()
+        assert reached[y.coords[:, 0].long(), 0, y.coords[:, 1].long(), y.coords[:, 2].long(), y.coords[:, 3].long()].all()
+    torch.testing.assert_close(y.feats, gather(expected, y.coords))
+
+
+@pytest.mark.parametrize('kernel_size, stride, padding', [(3, 2, None), (2, 2, None), (3, 2, 1)])
+def test_inverse_conv_matches_transposed_conv(kernel_size, stride, padding):
+    x = random_sparse_tensor(3)
+    y = sp.SparseConv3d(3, 4, kernel_size, stride=stride, padding=padding)(x)
+    inverse = sp.SparseInverseConv3d(4, 5, kernel_size, stride=stride)
+    z = inverse(y)
+    assert torch.equal(z.coords, x.coords)
+    assert z._scale == x._scale
+
+    dense_y = torch.zeros(y.coords[:, 0].max() + 1, 4, *(y.coords[:, 1:].max(0).values + 1).tolist())
+    dense_y[y.coords[:, 0].long(), :, y.coords[:, 1].long(), y.coords[:, 2].long(), y.coords[:, 3].long()] = y.feats
+    expected = F.conv_transpose3d(dense_y, inverse.conv.weight.permute(4, 0, 1, 2, 3), inverse.conv.bias, stride=stride, padding=padding or 0)
+    # Input voxels beyond the reach of the transposed convolution only get the bias
+    size = [max(a, b) for a, b in zip(expected.shape[2:], x.dense().shape[2:])]
+    padded = inverse.conv.bias[None, :, None, None, None].repeat(expected.shape[0], 1, *size)
+    padded[:, :, :expected.shape[2], :expected.shape[3], :expected.shape[4]] = expected
+    torch.testing.assert_close(z.feats, gather(padded, z.coords))
+
+
+def test_inverse_conv_needs_a_strided_conv():
+    x = random_sparse_tensor(3)
+    with pytest.raises(ValueError):
+        sp.SparseInverseConv3d(3, 3, 3, stride=2)(x)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from trellis.utils.state_utils import ENCODINGS, save_state, load_state
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_round_trip_keeps_shapes(tmp_path, encoding):
+    arrays = {
+        'scalar': np.array(3.5, dtype=np.float32),
+        'matrix': np.random.default_rng(0).random((5, 3), dtype=np.float32),
+        'empty': np.zeros((0, 4), dtype=np.float32),
+    }
+    path = str(tmp_path / 'sample.state')
+    save_state(path, arrays, meta={'seed': 1}, encodings={name: encoding for name in arrays})
+    loaded, meta = load_state(path)
+    assert meta == {'seed': 1}
+    for name, array in arrays.items():
+        assert loaded[name].shape == array.shape
+        np.testing.assert_allclose(loaded[name], array, atol=1e-2)
@@ -0,0 +1,125 @@
+import math
+import numpy as np
+import torch
+from trellis.representations import Gaussian
+from trellis.representations.mesh import MeshExtractResult
+from trellis.renderers import TorchGaussianRenderer, TorchMeshRenderer
+from trellis.renderers.gaussian_render_torch import splat_gaussians
+from trellis.renderers.mesh_renderer_torch import rasterize_triangles
+from trellis.utils.camera_utils import yaw_pitch_r_fov_to_cameras
+from trellis.utils.visibility_utils import rasterize_face_ids_numpy
+
+
+def splat_reference(means, covs, colors, opacities, extrinsics, intrinsics, resolution, bg_color, kernel_size=0.1):
+    # Per-pixel front-to-back compositing over all Gaussians, as in the CUDA rasterizer
+    R, t = extrinsics[:3, :3].double(), extrinsics[:3, 3].double()
+    view = means.double() @ R.T + t
+    splats = []
+    for i in torch.argsort(view[:, 2], stable=True).tolist():
+        x, y, z = view[i].tolist()
+        if z <= 0.2:
+            continue
+        fx, fy = intrinsics[0, 0].item() * resolution, intrinsics[1, 1].item() * resolution
+        J = torch.tensor([[fx / z, 0, -fx * x / z ** 2], [0, fy / z, -fy * y / z ** 2]], dtype=torch.float64)
+        cov = J @ R @ covs[i].double() @ R.T @ J.T
+        det_0 = max(1e-6, torch.det(cov).item())
+        cov = cov + kernel_size * torch.eye(2, dtype=torch.float64)
+        det_1 = max(1e-6, torch.det(cov).item())
+        opacity = opacities[i].item() * math.sqrt(det_0 / (det_1 + 1e-6) + 1e-6)
+        center = torch.tensor([
+            (intrinsics[0, 0].item() * x / z + intrinsics[0, 2].item()) * resolution,
+            (intrinsics[1, 1].item() * y / z + intrinsics[1, 2].item()) * resolution,
+        ], dtype=torch.float64)
+        splats.append((center, torch.inverse(cov), opacity, colors[i].double()))
+    image = torch.zeros(3, resolution, resolution, dtype=torch.float64)
+    for py in range(resolution):
+        for px in range(resolution):
+            T, color = 1.0, torch.zeros(3, dtype=torch.float64)
+            for center, conic, opacity, c in splats:
+                d = center - torch.tensor([px + 0.5, py + 0.5], dtype=torch.float64)
+                power = -0.5 * (d @ conic @ d).item()
+                if power > 0:
+                    continue
+                alpha = min(0.99, opacity * math.exp(power))
+                if alpha < 1 / 255:
+                    continue
+                if T * (1 - alpha) < 1e-4:
+                    break
+                color += c * alpha * T
+                T *= 1 - alpha
+            image[:, py, px] = color + T * bg_color.double()
+    return image
+
+
+def random_gaussians(num, spread, size, opacity, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    means = torch.randn(num, 3, generator=generator) * spread
+    A = torch.randn(num, 3, 3, generator=generator) * size
+    covs = A @ A.transpose(1, 2) + 1e-4 * torch.eye(3)
+    colors = torch.rand(num, 3, generator=generator)
+    opacities = opacity + (1 - opacity) * torch.rand(num, generator=generator)
+    return means, covs, colors, opacities
+
+
+def test_splat_gaussians_matches_reference():
+    extrinsics, intrinsics = yaw_pitch_r_fov_to_cameras(0.3, 0.2, 2.0, 40.0, device='cpu')
+    bg_color = torch.tensor([0.2, 0.3, 0.4])
+    # Sparse translucent Gaussians, and a dense opaque cluster that saturates the transmittance
+    for gaussians, resolution in [(random_gaussians(30, 0.15, 0.05, 0.5), 20), (random_gaussians(150, 0.05, 0.08, 0.999), 12)]:
+        expected = splat_reference(*gaussians, extrinsics[0], intrinsics[0], resolution, bg_color)
+        for max_fragments in (1 << 22, 40):
+            image = splat_gaussians(*gaussians, extrinsics[0], intrinsics[0], resolution, bg_color, max_fragments=max_fragments)
+            torch.testing.assert_close(image.double(), expected, rtol=0, atol=1e-5)
+
+
+def test_gaussian_renderer_occludes_and_uses_sh_colors():
+    # Camera on the -y axis looking at the origin: the red Gaussian hides the green one behind it
+    extrinsics, intrinsics = yaw_pitch_r_fov_to_cameras(torch.pi, 0.0, 2.0, 40.0, device='cpu')
+    gs = Gaussian(aabb=[-0.5, -0.5, -0.5, 1.0, 1.0, 1.0], device='cpu')
+    gs.from_xyz(torch.tensor([[0.0, -0.2, 0.0], [0.0, 0.2, 0.0]]))
+    gs._features_dc = ((torch.tensor([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]) - 0.5) / 0.28209479177387814)[:, None]
+    gs.from_scaling(torch.full((2, 3), 0.15))
+    gs.from_rotation(torch.tensor([[1.0, 0.0, 0.0, 0.0]] * 2))
+    gs._opacity = torch.full((2, 1), 10.0)
+    renderer = TorchGaussianRenderer({'resolution': 32, 'bg_color': (0, 0, 0)})
+    res = renderer.render(gs, extrinsics[0], intrinsics[0])
+    assert res.color.shape == (3, 32, 32)
+    red, green, blue = res.color[:, 16, 16].tolist()
+    assert red > 0.95 and green < 0.05 and blue == 0
+    assert res.color[:, 0, 0].abs().max() < 1e-6
+
+
+def test_rasterize_triangles_matches_numpy_reference():
+    rng = np.random.default_rng(0)
+    f = 1 / np.tan(np.radians(25))
+    projection = np.array([[f, 0, 0, 0], [0, f, 0, 0], [0, 0, -5 / 3, -8 / 3], [0, 0, -1, 0]])
+    for trial in range(10):
+        verts = rng.uniform(-1, 1, (40, 3))
+        faces = rng.integers(0, 40, (60, 3))
+        angle = rng.uniform(0, 2 * np.pi)
+        view = np.eye(4)
+        view[:3, :3] = [[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]]
+        view[2, 3] = rng.uniform(-3.5, -1.5)
+        expected = rasterize_face_ids_numpy(verts, faces, view[None], projection, 32)[0]
+        clip = torch.from_numpy(np.concatenate([verts, np.ones((40, 1))], axis=1) @ (projection @ view).T)
+        face_ids, bary, _ = rasterize_triangles(clip, torch.from_numpy(faces), 32, max_fragments=1 << 22 if trial % 2 else 100)
+        np.testing.assert_array_equal(face_ids.numpy(), expected)
+        covered = face_ids > 0
+        torch.testing.assert_close(bary[covered].sum(dim=-1), torch.ones(int(covered.sum()), dtype=torch.float64))
+        assert (bary[covered] >= 0).all() and (bary[~covered] == 0).all()
+
+
+def test_mesh_renderer_normals_and_depth():
+    # A square facing the camera on the -y axis, 2 units away
+    vertices = torch.tensor([[-0.5, 0.0, -0.5], [0.5, 0.0, -0.5], [0.5, 0.0, 0.5], [-0.5, 0.0, 0.5]])
+    faces = torch.tensor([[0, 1, 2], [0, 2, 3]], dtype=torch.int32)
+    mesh = MeshExtractResult(vertices, faces)
+    extrinsics, intrinsics = yaw_pitch_r_fov_to_cameras(torch.pi, 0.0, 2.0, 40.0, device='cpu')
+    renderer = TorchMeshRenderer({'resolution': 32, 'near': 1, 'far': 100, 'ssaa': 2})
+    res = renderer.render(mesh, extrinsics[0], intrinsics[0], return_types=['mask', 'normal', 'depth'])
+    assert res.normal.shape == (3, 32, 32) and res.mask.shape == (32, 32) and res.depth.shape == (32, 32)
+    torch.testing.assert_close(res.normal[:, 16, 16], (mesh.face_normal[0, 0] + 1) / 2)
+    torch.testing.assert_close(res.depth[16, 16], torch.tensor(2.0))
+    assert res.mask[16, 16] == 1 and res.mask[0, 0] == 0
+    # The background normal is 0 mapped to color, as with nvdiffrast
+    torch.testing.assert_close(res.normal[:, 0, 0], torch.full((3,), 0.5))
@@ -0,0 +1,62 @@
+import torch
+import utils3d
+from trellis.utils.visibility_utils import sphere_hammersley_views, face_visibility, adaptive_face_visibility
+
+
+def cube(half_size: float):
+    verts = torch.tensor([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=torch.float32) * half_size
+    # Two triangles per side, wound outwards
+    faces = torch.tensor([
+        [0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+        [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+        [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3],
+    ])
+    return verts, faces
+
+
+def nested_cubes():
+    # A small cube fully enclosed by a large one: only the faces of the large one can be seen
+    outer_verts, outer_faces = cube(0.5)
+    inner_verts, inner_faces = cube(0.2)
+    verts = torch.cat([outer_verts, inner_verts])
+    faces = torch.cat([outer_faces, inner_faces + outer_verts.shape[0]])
+    return verts, faces
+
+
+def projection():
+    fov = torch.deg2rad(torch.tensor(40.0))
+    return utils3d.torch.perspective_from_fov_xy(fov, fov, 1, 3)
+
+
+def test_face_visibility_hides_enclosed_faces():
+    verts, faces = nested_cubes()
+    views = sphere_hammersley_views(32, radius=2.0, device='cpu')
+    visibility = face_visibility(verts, faces, views, projection(), 64, batch_size=5, backend='numpy')
+    assert visibility.shape == (24,) and visibility.dtype == torch.int32
+    assert (visibility[:12] > 0).all()
+    assert (visibility[12:] == 0).all()
+    # At most three sides of a cube face a camera, so no face is seen from every view
+    assert (visibility[:12] < 32).all()
+
+
+def test_face_visibility_sees_inner_cube_alone():
+    verts, faces = cube(0.2)
+    views = sphere_hammersley_views(32, radius=2.0, device='cpu')
+    visibility = face_visibility(verts, faces, views, projection(), 64, backend='numpy')
+    assert (visibility > 0).all()
+
+
+def test_adaptive_face_visibility_matches_classification():
+    verts, faces = nested_cubes()
+    visibility, stats = adaptive_face_visibility(verts, faces, projection(), 64, max_views=64, min_views=16, batch_size=8, backend='numpy')
+    assert 16 <= stats.num_views <= 64
+    assert (visibility[:12] > 0).all()
+    assert (visibility[12:] == 0).all()
+
+
+def test_torch_backend_matches_numpy():
+    verts, faces = nested_cubes()
+    views = sphere_hammersley_views(32, radius=2.0, device='cpu')
+    expected = face_visibility(verts.double(), faces, views.double(), projection().double(), 64, backend='numpy')
+    visibility = face_visibility(verts.double(), faces, views.double(), projection().double(), 64, batch_size=5, backend='torch')
+    assert torch.equal(visibility, expected)
@@ -53,6 +53,9 @@ class TimestepEmbedder(nn.Module):
 
 
 class SparseStructureFlowModel(nn.Module):
+    # `cond` is only used as cross-attention context, so it may be passed as a CachedContext
+    supports_cached_context = True
+
     def __init__(
         self,
         resolution: int,
@@ -66,6 +66,9 @@ class SparseResBlock3d(nn.Module):
     
 
 class SLatFlowModel(nn.Module):
+    # `cond` is only used as cross-attention context, so it may be passed as a CachedContext
+    supports_cached_context = True
+
     def __init__(
         self,
         resolution: int,
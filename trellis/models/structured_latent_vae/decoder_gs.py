@@ -95,7 +95,8 @@ class SLatGaussianDecoder(SparseTransformerBase):
                 mininum_kernel_size = self.rep_config['3d_filter_kernel_size'],
                 scaling_bias = self.rep_config['scaling_bias'],
                 opacity_bias = self.rep_config['opacity_bias'],
-                scaling_activation = self.rep_config['scaling_activation']
+                scaling_activation = self.rep_config['scaling_activation'],
+                device = x.device,
             )
             xyz = (x.coords[x.layout[i]][:, 1:].float() + 0.5) / self.resolution
             for k, v in self.layout.items():
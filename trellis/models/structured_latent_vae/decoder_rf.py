@@ -85,11 +85,11 @@ class SLatRadianceFieldDecoder(SparseTransformerBase):
                 aabb=[-0.5, -0.5, -0.5, 1, 1, 1],
                 rank=self.rep_config['rank'],
                 dim=self.rep_config['dim'],
-                device='cuda',
+                device=x.device,
             )
             representation.density_shift = 0.0
             representation.position = (x.coords[x.layout[i]][:, 1:].float() + 0.5) / self.resolution
-            representation.depth = torch.full((representation.position.shape[0], 1), int(np.log2(self.resolution)), dtype=torch.uint8, device='cuda')
+            representation.depth = torch.full((representation.position.shape[0], 1), int(np.log2(self.resolution)), dtype=torch.uint8, device=x.device)
             for k, v in self.layout.items():
                 setattr(representation, k, x.feats[x.layout[i]][:, v['range'][0]:v['range'][1]].reshape(-1, *v['shape']))
             representation.trivec = representation.trivec + 1
@@ -5,10 +5,15 @@ DEBUG = False
 
 def __from_env():
     import os
+    import torch
     
     global BACKEND
     global DEBUG
     
+    # Without CUDA, fall back to the PyTorch implementation
+    if not torch.cuda.is_available():
+        BACKEND = 'sdpa'
+    
     env_attn_backend = os.environ.get('ATTN_BACKEND')
     env_sttn_debug = os.environ.get('ATTN_DEBUG')
     
@@ -23,7 +28,7 @@ def __from_env():
 __from_env()
     
 
-def set_backend(backend: Literal['xformers', 'flash_attn']):
+def set_backend(backend: Literal['xformers', 'flash_attn', 'sdpa', 'naive']):
     global BACKEND
     BACKEND = backend
 
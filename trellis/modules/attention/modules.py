@@ -5,6 +5,90 @@ import torch.nn.functional as F
 from .full_attn import scaled_dot_product_attention
 
 
+class CachedContext:
+    """
+    A cross-attention context that stays constant over many forward passes, e.g. the
+    condition of a sampling run. Cross-attention modules compute the key/value projections
+    of the context on first use and reuse them afterwards, so the cache holds one [N x L x 2C]
+    tensor per cross-attention module and lives as long as this object. The model weights
+    are assumed not to change while it is alive.
+
+    Contexts derived from a cached context by `type`, slicing or `concat` are cached as well.
+    All caches are invalidated when the context tensor is modified in place, or explicitly
+    with `clear`.
+
+    Args:
+        context (torch.Tensor): The [N x L x C] context tensor.
+    """
+    def __init__(self, context: torch.Tensor):
+        self.context = context
+        self._version = context._version
+        self._derived = {}
+        self._kv = {}
+
+    @property
+    def shape(self) -> torch.Size:
+        return self.context.shape
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return self.context.dtype
+
+    @property
+    def device(self) -> torch.device:
+        return self.context.device
+
+    def __len__(self) -> int:
+        return len(self.context)
+
+    def clear(self) -> None:
+        """
+        Drop all cached projections and derived contexts.
+        """
+        self._derived.clear()
+        self._kv.clear()
+        self._version = self.context._version
+
+    def _check_version(self) -> None:
+        if self.context._version != self._version:
+            self.clear()
+
+    def _derive(self, key: Hashable, fn: Callable[[], torch.Tensor]) -> 'CachedContext':
+        self._check_version()
+        if key not in self._derived:
+            self._derived[key] = CachedContext(fn())
+        return self._derived[key]
+
+    def type(self, dtype: torch.dtype) -> 'CachedContext':
+        if dtype == self.context.dtype:
+            return self
+        return self._derive(('type', dtype), lambda: self.context.type(dtype))
+
+    def __getitem__(self, idx: Union[int, slice]) -> 'CachedContext':
+        key = ('slice', idx.start, idx.stop, idx.step) if isinstance(idx, slice) else ('index', idx)
+        return self._derive(key, lambda: self.context[idx])
+
+    def concat(self, other: 'CachedContext') -> 'CachedContext':
+        """
+        The batch-wise concatenation with another context, broadcasting its batch dimension if it is 1.
+        """
+        def fn():
+            other_context = other.context
+            if other_context.shape[0] != self.context.shape[0]:
+                other_context = other_context.expand(self.context.shape[0], *other_context.shape[1:])
+            return torch.cat([self.context, other_context], dim=0)
+        return self._derive(('concat', other, other.context._version), fn)
+
+    def kv(self, module: nn.Module, to_kv: Callable[[torch.Tensor], torch.Tensor]) -> torch.Tensor:
+        """
+        The key/value projection of the context by `module`, computed with `to_kv` on first use.
+        """
+        self._check_version()
+        if module not in self._kv:
+            self._kv[module] = to_kv(self.context)
+        return self._kv[module]
+
+
 class MultiHeadRMSNorm(nn.Module):
     def __init__(self, dim: int, heads: int):
         super().__init__()
@@ -131,7 +215,7 @@ class MultiHeadAttention(nn.Module):
         else:
             Lkv = context.shape[1]
             q = self.to_q(x)
-            kv = self.to_kv(context)
+            kv = context.kv(self, self.to_kv) if isinstance(context, CachedContext) else self.to_kv(context)
             q = q.reshape(B, L, self.num_heads, -1)
             kv = kv.reshape(B, Lkv, 2, self.num_heads, -1)
             if self.qk_rms_norm:
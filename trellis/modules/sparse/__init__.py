@@ -6,6 +6,7 @@ ATTN = 'flash_attn'
 
 def __from_env():
     import os
+    import torch
     
     global BACKEND
     global DEBUG
@@ -17,11 +18,16 @@ def __from_env():
     if env_sparse_attn is None:
         env_sparse_attn = os.environ.get('ATTN_BACKEND')
 
-    if env_sparse_backend is not None and env_sparse_backend in ['spconv', 'torchsparse']:
+    # Without CUDA, fall back to the pure PyTorch implementations
+    if not torch.cuda.is_available():
+        BACKEND = 'torch'
+        ATTN = 'sdpa'
+
+    if env_sparse_backend is not None and env_sparse_backend in ['spconv', 'torchsparse', 'torch']:
         BACKEND = env_sparse_backend
     if env_sparse_debug is not None:
         DEBUG = env_sparse_debug == '1'
-    if env_sparse_attn is not None and env_sparse_attn in ['xformers', 'flash_attn']:
+    if env_sparse_attn is not None and env_sparse_attn in ['xformers', 'flash_attn', 'sdpa']:
         ATTN = env_sparse_attn
         
     print(f"[SPARSE] Backend: {BACKEND}, Attention: {ATTN}")
@@ -30,7 +36,7 @@ def __from_env():
 __from_env()
     
 
-def set_backend(backend: Literal['spconv', 'torchsparse']):
+def set_backend(backend: Literal['spconv', 'torchsparse', 'torch']):
     global BACKEND
     BACKEND = backend
 
@@ -38,7 +44,7 @@ def set_debug(debug: bool):
     global DEBUG
     DEBUG = debug
 
-def set_attn(attn: Literal['xformers', 'flash_attn']):
+def set_attn(attn: Literal['xformers', 'flash_attn', 'sdpa']):
     global ATTN
     ATTN = attn
     
@@ -7,6 +7,8 @@ if ATTN == 'xformers':
     import xformers.ops as xops
 elif ATTN == 'flash_attn':
     import flash_attn
+elif ATTN == 'sdpa':
+    from torch.nn.functional import scaled_dot_product_attention as sdpa
 else:
     raise ValueError(f"Unknown attention module: {ATTN}")
 
@@ -16,6 +18,51 @@ __all__ = [
 ]
 
 
+def _sdpa_varlen(q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, q_seqlen: List[int], kv_seqlen: List[int]) -> torch.Tensor:
+    """
+    Attention over a batch of variable-length sequences with PyTorch's scaled_dot_product_attention.
+    The sequences are padded to the longest one and padded keys are masked out.
+
+    Args:
+        q (torch.Tensor): A [T_Q, H, Ci] tensor of concatenated queries.
+        k (torch.Tensor): A [T_KV, H, Ci] tensor of concatenated keys.
+        v (torch.Tensor): A [T_KV, H, Co] tensor of concatenated values.
+        q_seqlen (List[int]): The query length of each sequence.
+        kv_seqlen (List[int]): The key/value length of each sequence.
+
+    Returns:
+        (torch.Tensor): A [T_Q, H, Co] tensor of concatenated outputs.
+    """
+    device = q.device
+
+    def pad_index(seqlen):
+        seqlen = torch.tensor(seqlen, device=device)
+        batch = torch.repeat_interleave(torch.arange(seqlen.shape[0], device=device), seqlen)
+        pos = torch.arange(batch.shape[0], device=device) - (torch.cumsum(seqlen, dim=0) - seqlen)[batch]
+        return batch, pos
+
+    def pad(x, seqlen):
+        if all(l == seqlen[0] for l in seqlen):
+            return x.reshape(len(seqlen), seqlen[0], *x.shape[1:]), None
+        batch, pos = pad_index(seqlen)
+        out = x.new_zeros(len(seqlen), max(seqlen), *x.shape[1:])
+        out[batch, pos] = x
+        return out, (batch, pos)
+
+    q, q_index = pad(q, q_seqlen)   # [N, L_Q, H, Ci]
+    k, kv_index = pad(k, kv_seqlen) # [N, L_KV, H, Ci]
+    v, _ = pad(v, kv_seqlen)        # [N, L_KV, H, Co]
+    mask = None
+    if kv_index is not None:
+        mask = torch.arange(k.shape[1], device=device) < torch.tensor(kv_seqlen, device=device)[:, None]
+        mask = mask[:, None, None, :]   # [N, 1, 1, L_KV]
+    out = sdpa(q.permute(0, 2, 1, 3), k.permute(0, 2, 1, 3), v.permute(0, 2, 1, 3), attn_mask=mask)
+    out = out.permute(0, 2, 1, 3)       # [N, L_Q, H, Co]
+    if q_index is None:
+        return out.reshape(-1, *out.shape[2:])
+    return out[q_index]
+
+
 @overload
 def sparse_scaled_dot_product_attention(qkv: SparseTensor) -> SparseTensor:
     """
@@ -206,6 +253,12 @@ def sparse_scaled_dot_product_attention(*args, **kwargs):
             out = flash_attn.flash_attn_varlen_kvpacked_func(q, kv, cu_seqlens_q, cu_seqlens_kv, max(q_seqlen), max(kv_seqlen))
         elif num_all_args == 3:
             out = flash_attn.flash_attn_varlen_func(q, k, v, cu_seqlens_q, cu_seqlens_kv, max(q_seqlen), max(kv_seqlen))
+    elif ATTN == 'sdpa':
+        if num_all_args == 1:
+            q, k, v = qkv.unbind(dim=1)
+        elif num_all_args == 2:
+            k, v = kv.unbind(dim=1)
+        out = _sdpa_varlen(q, k, v, q_seqlen, kv_seqlen)
     else:
         raise ValueError(f"Unknown attention module: {ATTN}")
     
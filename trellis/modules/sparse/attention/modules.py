@@ -6,7 +6,7 @@ from .. import SparseTensor
 from .full_attn import sparse_scaled_dot_product_attention
 from .serialized_attn import SerializeMode, sparse_serialized_scaled_dot_product_self_attention
 from .windowed_attn import sparse_windowed_scaled_dot_product_self_attention
-from ...attention import RotaryPositionEmbedder
+from ...attention import RotaryPositionEmbedder, CachedContext
 
 
 class SparseMultiHeadRMSNorm(nn.Module):
@@ -126,7 +126,10 @@ class SparseMultiHeadAttention(nn.Module):
         else:
             q = self._linear(self.to_q, x)
             q = self._reshape_chs(q, (self.num_heads, -1))
-            kv = self._linear(self.to_kv, context)
+            if isinstance(context, CachedContext):
+                kv = context.kv(self, self.to_kv)
+            else:
+                kv = self._linear(self.to_kv, context)
             kv = self._fused_pre(kv, num_fused=2)
             if self.qk_rms_norm:
                 q = self.q_rms_norm(q)
@@ -0,0 +1,197 @@
+from typing import *
+import math
+import itertools
+import torch
+import torch.nn as nn
+from .. import SparseTensor
+
+
+def _neighbor_map(coords: torch.Tensor, kernel_size, dilation):
+    """
+    Find the input voxel at every kernel offset of every voxel.
+
+    Args:
+        coords (torch.Tensor): [N x 4] coordinates, (batch, x, y, z).
+        kernel_size (Tuple[int, int, int]): The kernel size.
+        dilation (Tuple[int, int, int]): The kernel dilation.
+
+    Returns:
+        (List[Tuple[torch.Tensor, torch.Tensor]]): For each kernel offset, in the order of
+            the flattened kernel, the indices of the output voxels that have a neighbor at
+            that offset and the indices of these neighbors.
+    """
+    coords = coords.long()
+    pad = [(k // 2) * d for k, d in zip(kernel_size, dilation)]
+    # Shift the coordinates so that every neighbor lies in a non-negative box
+    spatial = coords[:, 1:] - coords[:, 1:].min(dim=0).values + torch.tensor(pad, device=coords.device)
+    size = (spatial.max(dim=0).values + torch.tensor(pad, device=coords.device) + 1).tolist()
+
+    def encode(b, x, y, z):
+        return ((b * size[0] + x) * size[1] + y) * size[2] + z
+
+    keys = encode(coords[:, 0], *spatial.unbind(dim=1))
+    sorted_keys, order = torch.sort(keys)
+    arange = torch.arange(coords.shape[0], device=coords.device)
+
+    neighbors = []
+    for offset in itertools.product(*[range(k) for k in kernel_size]):
+        delta = [(o - k // 2) * d for o, k, d in zip(offset, kernel_size, dilation)]
+        if all(d == 0 for d in delta):
+            neighbors.append((arange, arange))
+            continue
+        query = encode(coords[:, 0], *[spatial[:, i] + delta[i] for i in range(3)])
+        pos = torch.searchsorted(sorted_keys, query).clamp_(max=coords.shape[0] - 1)
+        found = sorted_keys[pos] == query
+        neighbors.append((arange[found], order[pos[found]]))
+    return neighbors
+
+
+def _strided_neighbor_map(coords: torch.Tensor, kernel_size, stride, dilation, padding):
+    """
+    Find the output voxels of a regular (non-submanifold) sparse convolution, and the input voxel
+    at every kernel offset of every output voxel, following spconv: an input voxel `i` reaches the
+    output voxel `o` through the offset `k` if `o * stride == i + padding - k * dilation`, within
+    the output grid of the dense convolution over the bounding box of the input coordinates.
+
+    Args:
+        coords (torch.Tensor): [N x 4] coordinates, (batch, x, y, z).
+        kernel_size (Tuple[int, int, int]): The kernel size.
+        stride (Tuple[int, int, int]): The stride.
+        dilation (Tuple[int, int, int]): The kernel dilation.
+        padding (Tuple[int, int, int]): The padding.
+
+    Returns:
+        (torch.Tensor): [M x 4] output coordinates, sorted.
+        (List[Tuple[torch.Tensor, torch.Tensor]]): For each kernel offset, the indices of the
+            output voxels and of the input voxels it connects.
+    """
+    device = coords.device
+    coords = coords.long()
+    stride_t, dilation_t, padding_t, kernel_t = [torch.tensor(v, device=device) for v in (stride, dilation, padding, kernel_size)]
+    in_size = coords[:, 1:].max(dim=0).values + 1
+    out_size = (in_size + 2 * padding_t - dilation_t * (kernel_t - 1) - 1) // stride_t + 1
+
+    candidates = []
+    for offset in itertools.product(*[range(k) for k in kernel_size]):
+        pos = coords[:, 1:] + padding_t - torch.tensor(offset, device=device) * dilation_t
+        valid = ((pos % stride_t) == 0).all(dim=1) & (pos >= 0).all(dim=1)
+        pos = pos // stride_t
+        valid &= (pos < out_size).all(dim=1)
+        in_idx = torch.nonzero(valid).squeeze(1)
+        candidates.append((in_idx, torch.cat([coords[in_idx, :1], pos[in_idx]], dim=1)))
+
+    size = out_size.tolist()
+    def encode(c):
+        return ((c[:, 0] * size[0] + c[:, 1]) * size[1] + c[:, 2]) * size[2] + c[:, 3]
+
+    keys, inverse = torch.unique(torch.cat([encode(c) for _, c in candidates]), return_inverse=True)
+    out_coords = torch.stack([
+        keys // (size[0] * size[1] * size[2]),
+        keys // (size[1] * size[2]) % size[0],
+        keys // size[2] % size[1],
+        keys % size[2],
+    ], dim=1).int()
+    out_idx = inverse.split([in_idx.shape[0] for in_idx, _ in candidates])
+    neighbors = [(o, in_idx) for o, (in_idx, _) in zip(out_idx, candidates)]
+    return out_coords, neighbors
+
+
+class SubMConv3d(nn.Module):
+    """
+    Submanifold sparse convolution in PyTorch: every voxel gathers its neighbors at each kernel
+    offset and accumulates one matrix product per offset. The weight has the [Co x K x K x K x Ci]
+    layout of spconv, so checkpoints trained with spconv load unchanged.
+    """
+    def __init__(self, in_channels, out_channels, kernel_size, dilation=1, bias=True):
+        super(SubMConv3d, self).__init__()
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = tuple(kernel_size) if isinstance(kernel_size, (list, tuple)) else (kernel_size,) * 3
+        self.dilation = tuple(dilation) if isinstance(dilation, (list, tuple)) else (dilation,) * 3
+        self.weight = nn.Parameter(torch.empty(out_channels, *self.kernel_size, in_channels))
+        self.bias = nn.Parameter(torch.empty(out_channels)) if bias else None
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        fan_in = self.in_channels * self.kernel_size[0] * self.kernel_size[1] * self.kernel_size[2]
+        bound = 1 / fan_in ** 0.5
+        nn.init.uniform_(self.weight, -bound, bound)
+        if self.bias is not None:
+            nn.init.uniform_(self.bias, -bound, bound)
+
+    def forward(self, feats: torch.Tensor, neighbors, num_out: Optional[int] = None) -> torch.Tensor:
+        """
+        Convolve along `neighbors`, pairs of output and input voxel indices per kernel offset.
+        The output voxels are the input ones if `num_out` is None, else `num_out` other voxels.
+        """
+        weight = self.weight.reshape(self.out_channels, -1, self.in_channels)
+        submanifold = num_out is None
+        out = feats.new_zeros(feats.shape[0] if submanifold else num_out, self.out_channels)
+        for k, (out_idx, in_idx) in enumerate(neighbors):
+            # Submanifold offsets with a neighbor for every voxel map the voxels in order
+            if submanifold and out_idx.shape[0] == feats.shape[0]:
+                out += feats[in_idx] @ weight[:, k].t()
+            elif out_idx.shape[0] > 0:
+                out.index_add_(0, out_idx, feats[in_idx] @ weight[:, k].t())
+        if self.bias is not None:
+            out += self.bias
+        return out
+
+
+class SparseConv3d(nn.Module):
+    def __init__(self, in_channels, out_channels, kernel_size, stride=1, dilation=1, padding=None, bias=True, indice_key=None):
+        super(SparseConv3d, self).__init__()
+        self.conv = SubMConv3d(in_channels, out_channels, kernel_size, dilation=dilation, bias=bias)
+        self.stride = tuple(stride) if isinstance(stride, (list, tuple)) else (stride, stride, stride)
+        self.padding = padding
+
+    def forward(self, x: SparseTensor) -> SparseTensor:
+        spatial_changed = any(s != 1 for s in self.stride) or (self.padding is not None)
+        if not spatial_changed:
+            # The neighbor map only depends on the coordinates, so it is shared by all convolutions at this scale
+            cache_name = f'conv_torch_{self.conv.kernel_size}_{self.conv.dilation}_neighbors'
+            neighbors = x.get_spatial_cache(cache_name)
+            if neighbors is None:
+                neighbors = _neighbor_map(x.coords, self.conv.kernel_size, self.conv.dilation)
+                x.register_spatial_cache(cache_name, neighbors)
+            feats = self.conv(x.feats, neighbors)
+            return x.replace(feats)
+
+        padding = self.padding if self.padding is not None else 0
+        padding = tuple(padding) if isinstance(padding, (list, tuple)) else (padding,) * 3
+        coords, neighbors = _strided_neighbor_map(x.coords, self.conv.kernel_size, self.stride, self.conv.dilation, padding)
+        feats = self.conv(x.feats, neighbors, num_out=coords.shape[0])
+        scale = tuple([s * stride for s, stride in zip(x._scale, self.stride)])
+        out = SparseTensor(
+            feats, coords, scale=scale,
+            # Caches are per scale, so a padded convolution that keeps the scale starts a new one
+            spatial_cache=x._spatial_cache if scale != x._scale else {},
+        )
+        # The inverse convolution maps the features back to the input voxels along the same pairs
+        out.register_spatial_cache(f'conv_{self.stride}_inverse', (x.coords, x.layout, neighbors))
+        return out
+
+
+class SparseInverseConv3d(nn.Module):
+    """
+    Inverse of a strided `SparseConv3d` with the same kernel and stride: the features are
+    scattered back to the input voxels of that convolution, along the voxel pairs it used.
+    """
+    def __init__(self, in_channels, out_channels, kernel_size, stride=1, dilation=1, bias=True, indice_key=None):
+        super(SparseInverseConv3d, self).__init__()
+        self.conv = SubMConv3d(in_channels, out_channels, kernel_size, dilation=dilation, bias=bias)
+        self.stride = tuple(stride) if isinstance(stride, (list, tuple)) else (stride, stride, stride)
+
+    def forward(self, x: SparseTensor) -> SparseTensor:
+        cache = x.get_spatial_cache(f'conv_{self.stride}_inverse')
+        if cache is None:
+            raise ValueError('Inverse convolution cache not found. SparseInverseConv3d must be paired with a strided SparseConv3d.')
+        coords, layout, neighbors = cache
+        if len(neighbors) != math.prod(self.conv.kernel_size):
+            raise ValueError('SparseInverseConv3d must have the kernel size of the paired SparseConv3d')
+        feats = self.conv(x.feats, [(in_idx, out_idx) for out_idx, in_idx in neighbors], num_out=coords.shape[0])
+        return SparseTensor(
+            feats, coords, layout=layout,
+            scale=tuple([s // stride for s, stride in zip(x._scale, self.stride)]),
+            spatial_cache=x._spatial_cache,
+        )
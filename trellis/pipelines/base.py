@@ -64,3 +64,13 @@ class Pipeline:
 
     def cpu(self) -> None:
         self.to(torch.device("cpu"))
+
+    def convert_to_fp32(self) -> None:
+        """
+        Run all models in float32, e.g. on CPUs, where float16 kernels are slow or missing.
+        """
+        for model in self.models.values():
+            if getattr(model, 'use_fp16', False):
+                model.convert_to_fp32()
+                model.use_fp16 = False
+                model.dtype = torch.float32
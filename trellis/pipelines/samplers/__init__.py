@@ -1,2 +1,5 @@
 from .base import Sampler
-from .flow_euler import FlowEulerSampler, FlowEulerCfgSampler, FlowEulerGuidanceIntervalSampler
\ No newline at end of file
+from .flow_euler import FlowEulerSampler, FlowEulerCfgSampler, FlowEulerGuidanceIntervalSampler
+from .flow_heun import FlowHeunSampler, FlowHeunCfgSampler, FlowHeunGuidanceIntervalSampler
+from .flow_dpm_solver import FlowDpmSolverSampler, FlowDpmSolverCfgSampler, FlowDpmSolverGuidanceIntervalSampler
+from .flow_adaptive import FlowAdaptiveSampler, FlowAdaptiveCfgSampler, FlowAdaptiveGuidanceIntervalSampler
\ No newline at end of file
@@ -1,5 +1,7 @@
 from typing import *
 from abc import ABC, abstractmethod
+import torch
+from ...modules.attention import CachedContext
 
 
 class Sampler(ABC):
@@ -17,4 +19,15 @@ class Sampler(ABC):
         Sample from a model.
         """
         pass
+
+    @staticmethod
+    def _cache_context(model, context):
+        """
+        Wrap a condition that is constant over a sampling run in a CachedContext, so the model
+        computes its cross-attention key/value projections once per run instead of once per step.
+        Models opt in with a `supports_cached_context` attribute; otherwise the condition is returned as is.
+        """
+        if getattr(model, 'supports_cached_context', False) and isinstance(context, torch.Tensor):
+            return CachedContext(context)
+        return context
     
\ No newline at end of file
@@ -1,12 +1,86 @@
 from typing import *
+import torch
+from ...modules import sparse as sp
+from ...modules.attention import CachedContext
+from .guidance_schedule import GuidanceSchedule, get_guidance_schedule
+
+
+def fused_cfg_inference(inference_model: Callable, model, x_t, t, cond, neg_cond, **kwargs):
+    """
+    Run the conditional and unconditional passes as one forward call.
+
+    The two passes share `x_t` and `t`, so the input is duplicated along the batch
+    dimension (for sparse tensors, the layout is duplicated) and the conditions are
+    concatenated. The output is split back into the two predictions.
+
+    Args:
+        inference_model: The single-pass inference function to call.
+        model: The model to sample from.
+        x_t: The [N x C x ...] tensor or [N x * x C] sparse tensor of noisy inputs at time t.
+        t: The current timestep.
+        cond: conditional information.
+        neg_cond: negative conditional information.
+        **kwargs: Additional arguments for model inference.
+
+    Returns:
+        a tuple of the conditional and unconditional predictions.
+    """
+    if isinstance(cond, CachedContext) and isinstance(neg_cond, CachedContext):
+        # The concatenated context is cached too, so its projections are still computed once
+        cond_in = cond.concat(neg_cond)
+    else:
+        if isinstance(cond, CachedContext):
+            cond = cond.context
+        if isinstance(neg_cond, CachedContext):
+            neg_cond = neg_cond.context
+        if neg_cond.shape[0] != cond.shape[0]:
+            neg_cond = neg_cond.expand(cond.shape[0], *neg_cond.shape[1:])
+        cond_in = torch.cat([cond, neg_cond], dim=0)
+    if isinstance(x_t, sp.SparseTensor):
+        x_in = sp.sparse_cat([x_t, x_t])
+    else:
+        x_in = torch.cat([x_t, x_t], dim=0)
+    out = inference_model(model, x_in, t, cond_in, **kwargs)
+    if isinstance(out, sp.SparseTensor):
+        pred, neg_pred = out.feats.chunk(2, dim=0)
+        return x_t.replace(pred), x_t.replace(neg_pred)
+    return out.chunk(2, dim=0)
 
 
 class ClassifierFreeGuidanceSamplerMixin:
     """
     A mixin class for samplers that apply classifier-free guidance.
+
+    The guidance strength can follow a per-timestep schedule (see `guidance_schedule.py`),
+    given as the `cfg_schedule` sampler parameter. Wherever the effective strength is 0,
+    the unconditional forward pass is skipped.
     """
 
-    def _inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, **kwargs):
-        pred = super()._inference_model(model, x_t, t, cond, **kwargs)
-        neg_pred = super()._inference_model(model, x_t, t, neg_cond, **kwargs)
+    @torch.no_grad()
+    def sample(
+        self,
+        model,
+        noise,
+        cond: Optional[Any] = None,
+        steps: int = 50,
+        rescale_t: float = 1.0,
+        verbose: bool = True,
+        neg_cond: Optional[Any] = None,
+        cfg_schedule: Optional[Union[dict, GuidanceSchedule]] = None,
+        **kwargs
+    ):
+        cfg_schedule = get_guidance_schedule(cfg_schedule, self._get_t_pairs(steps, rescale_t))
+        neg_cond = self._cache_context(model, neg_cond)
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_schedule=cfg_schedule, **kwargs)
+
+    def _inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_fused=False, cfg_schedule=None, **kwargs):
+        if cfg_schedule is not None:
+            cfg_strength = cfg_strength * cfg_schedule(t)
+        if cfg_strength == 0:
+            return super()._inference_model(model, x_t, t, cond, **kwargs)
+        if cfg_fused:
+            pred, neg_pred = fused_cfg_inference(super()._inference_model, model, x_t, t, cond, neg_cond, **kwargs)
+        else:
+            pred = super()._inference_model(model, x_t, t, cond, **kwargs)
+            neg_pred = super()._inference_model(model, x_t, t, neg_cond, **kwargs)
         return (1 + cfg_strength) * pred - cfg_strength * neg_pred
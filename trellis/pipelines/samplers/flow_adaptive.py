@@ -0,0 +1,209 @@
+from typing import *
+import math
+import torch
+from tqdm import tqdm
+from easydict import EasyDict as edict
+from .flow_euler import FlowEulerSampler
+from .classifier_free_guidance_mixin import ClassifierFreeGuidanceSamplerMixin
+from .guidance_interval_mixin import GuidanceIntervalSamplerMixin
+from ...modules import sparse as sp
+
+
+class FlowAdaptiveSampler(FlowEulerSampler):
+    """
+    Generate samples from a flow-matching model with adaptive step sizes.
+
+    Every step is an embedded Heun-Euler pair: the difference between the second-order
+    and the first-order update estimates the local error, which is used to accept or
+    reject the step and to choose the size of the next one. Step sizes are controlled
+    in the un-rescaled time, so `rescale_t` still shapes the schedule.
+
+    Args:
+        sigma_min: The minimum scale of noise in flow.
+        rtol: Relative tolerance of the local error.
+        atol: Absolute tolerance of the local error.
+        min_step: The smallest step size. Steps of this size are always accepted.
+        safety: Safety factor of the step size controller.
+        max_rejections: The number of times a step can be rejected before it is accepted anyway.
+    """
+    def __init__(
+        self,
+        sigma_min: float,
+        rtol: float = 0.05,
+        atol: float = 0.01,
+        min_step: float = 0.02,
+        safety: float = 0.9,
+        max_rejections: int = 16,
+    ):
+        super().__init__(sigma_min)
+        self.rtol = rtol
+        self.atol = atol
+        self.min_step = min_step
+        self.safety = safety
+        self.max_rejections = max_rejections
+
+    def _error_norm(self, err, x, x_new) -> float:
+        if isinstance(err, sp.SparseTensor):
+            err, x, x_new = err.feats, x.feats, x_new.feats
+        scale = self.atol + self.rtol * torch.maximum(x.abs(), x_new.abs())
+        return (err / scale).float().pow(2).mean().sqrt().item()
+
+    @torch.no_grad()
+    def sample_iter(
+        self,
+        model,
+        noise,
+        cond: Optional[Any] = None,
+        steps: int = 8,
+        rescale_t: float = 1.0,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model with adaptive step sizes, yielding after every accepted step.
+
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            steps: The number of uniform steps the initial step size is chosen for.
+            rescale_t: The rescale factor for t.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Yields:
+            a dict for each step containing the following
+            - 'step': the index of the step.
+            - 'num_steps': the estimated total number of steps, exact at the last step.
+            - 't': the timestep of the step.
+            - 'pred_x_prev': x_{t-1}.
+            - 'pred_x_0': a prediction of x_0.
+            - 'num_evals': the number of model evaluations so far.
+        """
+        sample = noise
+        u, du = 1.0, 1.0 / steps
+        i, num_evals = 0, 0
+        pbar = tqdm(desc="Sampling", disable=not verbose)
+        while u > 0:
+            t = float(self._rescale_t(u, rescale_t))
+            pred_x_0, _, pred_v = self._get_model_prediction(model, sample, t, cond, **kwargs)
+            num_evals += 1
+            for num_rejections in range(self.max_rejections + 1):
+                du = min(max(du, self.min_step), u)
+                # Do not leave a remainder smaller than the minimum step. A rejected step that would
+                # leave one is shrunk to leave exactly the minimum step instead, or, if that is not
+                # possible, to the minimum step itself, so that every retry makes progress.
+                if u - du < self.min_step:
+                    if num_rejections == 0:
+                        du = u
+                    elif u >= 2 * self.min_step:
+                        du = u - self.min_step
+                    else:
+                        du = self.min_step
+                at_min_step = du <= self.min_step or num_rejections == self.max_rejections
+                t_prev = float(self._rescale_t(u - du, rescale_t))
+                dt = t - t_prev
+                x_euler = sample - dt * pred_v
+                _, _, pred_v_prev = self._get_model_prediction(model, x_euler, t_prev, cond, **kwargs)
+                num_evals += 1
+                x_heun = sample - (0.5 * dt) * (pred_v + pred_v_prev)
+                err = self._error_norm(x_heun - x_euler, sample, x_heun)
+                # A NaN error shrinks the step as much as possible
+                factor = 5.0 if err == 0 else min(5.0, max(0.2, self.safety * err ** -0.5))
+                if err <= 1 or at_min_step:
+                    break
+                du = du * factor
+            sample = x_heun
+            u = u - du
+            du = du * factor
+            num_steps = i + 1 + (math.ceil(u / min(max(du, self.min_step), u)) if u > 0 else 0)
+            pbar.update()
+            yield edict({"step": i, "num_steps": num_steps, "t": t, "pred_x_prev": sample, "pred_x_0": pred_x_0, "num_evals": num_evals})
+            i += 1
+        pbar.close()
+
+
+class FlowAdaptiveCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowAdaptiveSampler):
+    """
+    Generate samples from a flow-matching model with adaptive step sizes and classifier-free guidance.
+    """
+    @torch.no_grad()
+    def sample(
+        self,
+        model,
+        noise,
+        cond,
+        neg_cond,
+        steps: int = 8,
+        rescale_t: float = 1.0,
+        cfg_strength: float = 3.0,
+        cfg_fused: bool = False,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model with adaptive step sizes.
+
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            neg_cond: negative conditional information.
+            steps: The number of uniform steps the initial step size is chosen for.
+            rescale_t: The rescale factor for t.
+            cfg_strength: The strength of classifier-free guidance.
+            cfg_fused: If True, run the conditional and unconditional passes as one batched forward call.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Returns:
+            a dict containing the following
+            - 'samples': the model samples.
+            - 'pred_x_t': a list of prediction of x_t.
+            - 'pred_x_0': a list of prediction of x_0.
+        """
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_fused=cfg_fused, **kwargs)
+
+
+class FlowAdaptiveGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowAdaptiveSampler):
+    """
+    Generate samples from a flow-matching model with adaptive step sizes, classifier-free guidance and interval.
+    """
+    @torch.no_grad()
+    def sample(
+        self,
+        model,
+        noise,
+        cond,
+        neg_cond,
+        steps: int = 8,
+        rescale_t: float = 1.0,
+        cfg_strength: float = 3.0,
+        cfg_interval: Tuple[float, float] = (0.0, 1.0),
+        cfg_fused: bool = False,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model with adaptive step sizes.
+
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            neg_cond: negative conditional information.
+            steps: The number of uniform steps the initial step size is chosen for.
+            rescale_t: The rescale factor for t.
+            cfg_strength: The strength of classifier-free guidance.
+            cfg_interval: The interval for classifier-free guidance.
+            cfg_fused: If True, run the conditional and unconditional passes as one batched forward call.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Returns:
+            a dict containing the following
+            - 'samples': the model samples.
+            - 'pred_x_t': a list of prediction of x_t.
+            - 'pred_x_0': a list of prediction of x_0.
+        """
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_interval=cfg_interval, cfg_fused=cfg_fused, **kwargs)
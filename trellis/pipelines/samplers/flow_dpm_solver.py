@@ -0,0 +1,177 @@
+from typing import *
+import math
+import torch
+from tqdm import tqdm
+from easydict import EasyDict as edict
+from .flow_euler import FlowEulerSampler
+from .classifier_free_guidance_mixin import ClassifierFreeGuidanceSamplerMixin
+from .guidance_interval_mixin import GuidanceIntervalSamplerMixin
+
+
+class FlowDpmSolverSampler(FlowEulerSampler):
+    """
+    Generate samples from a flow-matching model using DPM-Solver++ multistep sampling.
+
+    The flow x_t = (1 - t) x_0 + (sigma_min + (1 - sigma_min) t) eps is treated as a
+    diffusion with alpha_t = 1 - t and sigma_t = sigma_min + (1 - sigma_min) t, and the
+    ODE is integrated exactly in log-SNR for the x_0 prediction. The second-order variant
+    reuses the x_0 prediction of the previous step, so every step costs one model evaluation.
+
+    Args:
+        sigma_min: The minimum scale of noise in flow.
+        order: 1 or 2. Order 1 is equivalent to DDIM.
+        lower_order_final: If True, take the last step with order 1, which is more stable for few steps.
+    """
+    def __init__(
+        self,
+        sigma_min: float,
+        order: int = 2,
+        lower_order_final: bool = True,
+    ):
+        super().__init__(sigma_min)
+        assert order in [1, 2], f"Unsupported order {order}"
+        self.order = order
+        self.lower_order_final = lower_order_final
+
+    def _alpha_sigma(self, t: float) -> Tuple[float, float]:
+        return float(1 - t), float(self.sigma_min + (1 - self.sigma_min) * t)
+
+    @torch.no_grad()
+    def sample_iter(
+        self,
+        model,
+        noise,
+        cond: Optional[Any] = None,
+        steps: int = 12,
+        rescale_t: float = 1.0,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model using DPM-Solver++, yielding after every step.
+
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            steps: The number of steps to sample.
+            rescale_t: The rescale factor for t.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Yields:
+            a dict for each step containing the following
+            - 'step': the index of the step.
+            - 'num_steps': the total number of steps.
+            - 't': the timestep of the step.
+            - 'pred_x_prev': x_{t-1}.
+            - 'pred_x_0': a prediction of x_0.
+        """
+        sample = noise
+        last_x_0, last_h = None, None
+        t_pairs = self._get_t_pairs(steps, rescale_t)
+        for i, (t, t_prev) in enumerate(tqdm(t_pairs, desc="Sampling", disable=not verbose)):
+            pred_x_0, _, _ = self._get_model_prediction(model, sample, t, cond, **kwargs)
+            alpha_t, sigma_t = self._alpha_sigma(t)
+            alpha_prev, sigma_prev = self._alpha_sigma(t_prev)
+            # exp(-h), with h the log-SNR increment of the step; 0 for the first step from t = 1
+            exp_neg_h = (alpha_t * sigma_prev) / (sigma_t * alpha_prev)
+            h = -math.log(exp_neg_h) if exp_neg_h > 0 else math.inf
+            first_order = (
+                self.order == 1 or last_x_0 is None or math.isinf(last_h) or
+                (self.lower_order_final and i == steps - 1)
+            )
+            if first_order:
+                d = pred_x_0
+            else:
+                r = last_h / h
+                d = (1 + 0.5 / r) * pred_x_0 - (0.5 / r) * last_x_0
+            sample = (sigma_prev / sigma_t) * sample + (alpha_prev * (1 - exp_neg_h)) * d
+            last_x_0, last_h = pred_x_0, h
+            yield edict({"step": i, "num_steps": steps, "t": t, "pred_x_prev": sample, "pred_x_0": pred_x_0})
+
+
+class FlowDpmSolverCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowDpmSolverSampler):
+    """
+    Generate samples from a flow-matching model using DPM-Solver++ with classifier-free guidance.
+    """
+    @torch.no_grad()
+    def sample(
+        self,
+        model,
+        noise,
+        cond,
+        neg_cond,
+        steps: int = 12,
+        rescale_t: float = 1.0,
+        cfg_strength: float = 3.0,
+        cfg_fused: bool = False,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model using DPM-Solver++.
+
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            neg_cond: negative conditional information.
+            steps: The number of steps to sample.
+            rescale_t: The rescale factor for t.
+            cfg_strength: The strength of classifier-free guidance.
+            cfg_fused: If True, run the conditional and unconditional passes as one batched forward call.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Returns:
+            a dict containing the following
+            - 'samples': the model samples.
+            - 'pred_x_t': a list of prediction of x_t.
+            - 'pred_x_0': a list of prediction of x_0.
+        """
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_fused=cfg_fused, **kwargs)
+
+
+class FlowDpmSolverGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowDpmSolverSampler):
+    """
+    Generate samples from a flow-matching model using DPM-Solver++ with classifier-free guidance and interval.
+    """
+    @torch.no_grad()
+    def sample(
+        self,
+        model,
+        noise,
+        cond,
+        neg_cond,
+        steps: int = 12,
+        rescale_t: float = 1.0,
+        cfg_strength: float = 3.0,
+        cfg_interval: Tuple[float, float] = (0.0, 1.0),
+        cfg_fused: bool = False,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model using DPM-Solver++.
+
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            neg_cond: negative conditional information.
+            steps: The number of steps to sample.
+            rescale_t: The rescale factor for t.
+            cfg_strength: The strength of classifier-free guidance.
+            cfg_interval: The interval for classifier-free guidance.
+            cfg_fused: If True, run the conditional and unconditional passes as one batched forward call.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Returns:
+            a dict containing the following
+            - 'samples': the model samples.
+            - 'pred_x_t': a list of prediction of x_t.
+            - 'pred_x_0': a list of prediction of x_0.
+        """
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_interval=cfg_interval, cfg_fused=cfg_fused, **kwargs)
@@ -1,4 +1,5 @@
 from typing import *
+from collections import deque
 import torch
 import numpy as np
 from tqdm import tqdm
@@ -44,6 +45,14 @@ class FlowEulerSampler(Sampler):
         pred_x_0, pred_eps = self._v_to_xstart_eps(x_t=x_t, t=t, v=pred_v)
         return pred_x_0, pred_eps, pred_v
 
+    @staticmethod
+    def _rescale_t(t, rescale_t: float):
+        return rescale_t * t / (1 + (rescale_t - 1) * t)
+
+    def _get_t_pairs(self, steps: int, rescale_t: float) -> List[Tuple[float, float]]:
+        t_seq = self._rescale_t(np.linspace(1, 0, steps + 1), rescale_t)
+        return list((t_seq[i], t_seq[i + 1]) for i in range(steps))
+
     @torch.no_grad()
     def sample_once(
         self,
@@ -74,6 +83,44 @@ class FlowEulerSampler(Sampler):
         pred_x_prev = x_t - (t - t_prev) * pred_v
         return edict({"pred_x_prev": pred_x_prev, "pred_x_0": pred_x_0})
 
+    @torch.no_grad()
+    def sample_iter(
+        self,
+        model,
+        noise,
+        cond: Optional[Any] = None,
+        steps: int = 50,
+        rescale_t: float = 1.0,
+        verbose: bool = True,
+        **kwargs
+    ):
+        """
+        Generate samples from the model using Euler method, yielding after every step.
+        
+        Args:
+            model: The model to sample from.
+            noise: The initial noise tensor.
+            cond: conditional information.
+            steps: The number of steps to sample.
+            rescale_t: The rescale factor for t.
+            verbose: If True, show a progress bar.
+            **kwargs: Additional arguments for model_inference.
+
+        Yields:
+            a dict for each step containing the following
+            - 'step': the index of the step.
+            - 'num_steps': the total number of steps.
+            - 't': the timestep of the step.
+            - 'pred_x_prev': x_{t-1}.
+            - 'pred_x_0': a prediction of x_0.
+        """
+        sample = noise
+        t_pairs = self._get_t_pairs(steps, rescale_t)
+        for i, (t, t_prev) in enumerate(tqdm(t_pairs, desc="Sampling", disable=not verbose)):
+            out = self.sample_once(model, sample, t, t_prev, cond, **kwargs)
+            sample = out.pred_x_prev
+            yield edict({"step": i, "num_steps": steps, "t": t, "pred_x_prev": out.pred_x_prev, "pred_x_0": out.pred_x_0})
+
     @torch.no_grad()
     def sample(
         self,
@@ -83,6 +130,9 @@ class FlowEulerSampler(Sampler):
         steps: int = 50,
         rescale_t: float = 1.0,
         verbose: bool = True,
+        callback: Optional[Callable[[edict], None]] = None,
+        history_stride: int = 1,
+        history_size: Optional[int] = None,
         **kwargs
     ):
         """
@@ -95,6 +145,10 @@ class FlowEulerSampler(Sampler):
             steps: The number of steps to sample.
             rescale_t: The rescale factor for t.
             verbose: If True, show a progress bar.
+            callback: If given, called after every step with the per-step dict yielded by `sample_iter`.
+            history_stride: Record the predictions of every `history_stride`-th step.
+                If 0, no history is kept and only the running sample stays alive.
+            history_size: If given, only the last `history_size` recorded steps are kept.
             **kwargs: Additional arguments for model_inference.
 
         Returns:
@@ -103,18 +157,19 @@ class FlowEulerSampler(Sampler):
             - 'pred_x_t': a list of prediction of x_t.
             - 'pred_x_0': a list of prediction of x_0.
         """
+        cond = self._cache_context(model, cond)
         sample = noise
-        t_seq = np.linspace(1, 0, steps + 1)
-        t_seq = rescale_t * t_seq / (1 + (rescale_t - 1) * t_seq)
-        t_pairs = list((t_seq[i], t_seq[i + 1]) for i in range(steps))
-        ret = edict({"samples": None, "pred_x_t": [], "pred_x_0": []})
-        for t, t_prev in tqdm(t_pairs, desc="Sampling", disable=not verbose):
-            out = self.sample_once(model, sample, t, t_prev, cond, **kwargs)
+        pred_x_t = deque(maxlen=history_size)
+        pred_x_0 = deque(maxlen=history_size)
+        for out in self.sample_iter(model, noise, cond, steps, rescale_t, verbose, **kwargs):
             sample = out.pred_x_prev
-            ret.pred_x_t.append(out.pred_x_prev)
-            ret.pred_x_0.append(out.pred_x_0)
-        ret.samples = sample
-        return ret
+            if history_stride > 0 and (out.step + 1) % history_stride == 0:
+                pred_x_t.append(out.pred_x_prev)
+                pred_x_0.append(out.pred_x_0)
+            if callback is not None:
+                callback(out)
+            del out
+        return edict({"samples": sample, "pred_x_t": list(pred_x_t), "pred_x_0": list(pred_x_0)})
 
 
 class FlowEulerCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowEulerSampler):
@@ -131,6 +186,7 @@ class FlowEulerCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowEulerSampler):
         steps: int = 50,
         rescale_t: float = 1.0,
         cfg_strength: float = 3.0,
+        cfg_fused: bool = False,
         verbose: bool = True,
         **kwargs
     ):
@@ -145,6 +201,7 @@ class FlowEulerCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowEulerSampler):
             steps: The number of steps to sample.
             rescale_t: The rescale factor for t.
             cfg_strength: The strength of classifier-free guidance.
+            cfg_fused: If True, run the conditional and unconditional passes as one batched forward call.
             verbose: If True, show a progress bar.
             **kwargs: Additional arguments for model_inference.
 
@@ -154,7 +211,7 @@ class FlowEulerCfgSampler(ClassifierFreeGuidanceSamplerMixin, FlowEulerSampler):
             - 'pred_x_t': a list of prediction of x_t.
             - 'pred_x_0': a list of prediction of x_0.
         """
-        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, **kwargs)
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_fused=cfg_fused, **kwargs)
 
 
 class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSampler):
@@ -172,6 +229,7 @@ class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSa
         rescale_t: float = 1.0,
         cfg_strength: float = 3.0,
         cfg_interval: Tuple[float, float] = (0.0, 1.0),
+        cfg_fused: bool = False,
         verbose: bool = True,
         **kwargs
     ):
@@ -187,6 +245,7 @@ class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSa
             rescale_t: The rescale factor for t.
             cfg_strength: The strength of classifier-free guidance.
             cfg_interval: The interval for classifier-free guidance.
+            cfg_fused: If True, run the conditional and unconditional passes as one batched forward call.
             verbose: If True, show a progress bar.
             **kwargs: Additional arguments for model_inference.
 
@@ -196,4 +255,4 @@ class FlowEulerGuidanceIntervalSampler(GuidanceIntervalSamplerMixin, FlowEulerSa
             - 'pred_x_t': a list of prediction of x_t.
             - 'pred_x_0': a list of prediction of x_0.
         """
-        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_interval=cfg_interval, **kwargs)
+        return super().sample(model, noise, cond, steps, rescale_t, verbose, neg_cond=neg_cond, cfg_strength=cfg_strength, cfg_interval=cfg_interval, cfg_fused=cfg_fused, **kwargs)
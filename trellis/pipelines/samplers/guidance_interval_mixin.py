@@ -1,15 +1,14 @@
 from typing import *
+from .classifier_free_guidance_mixin import ClassifierFreeGuidanceSamplerMixin
 
 
-class GuidanceIntervalSamplerMixin:
+class GuidanceIntervalSamplerMixin(ClassifierFreeGuidanceSamplerMixin):
     """
     A mixin class for samplers that apply classifier-free guidance with interval.
+    Outside the interval the guidance strength is 0, so only the conditional pass is run.
     """
 
     def _inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, **kwargs):
-        if cfg_interval[0] <= t <= cfg_interval[1]:
-            pred = super()._inference_model(model, x_t, t, cond, **kwargs)
-            neg_pred = super()._inference_model(model, x_t, t, neg_cond, **kwargs)
-            return (1 + cfg_strength) * pred - cfg_strength * neg_pred
-        else:
-            return super()._inference_model(model, x_t, t, cond, **kwargs)
+        if not cfg_interval[0] <= t <= cfg_interval[1]:
+            cfg_strength = 0.0
+        return super()._inference_model(model, x_t, t, cond, neg_cond, cfg_strength, **kwargs)
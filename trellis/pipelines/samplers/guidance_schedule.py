@@ -0,0 +1,102 @@
+from typing import *
+from abc import ABC, abstractmethod
+
+
+class GuidanceSchedule(ABC):
+    """
+    A per-timestep multiplier of the classifier-free guidance strength.
+    Where the multiplier is 0, samplers skip the unconditional forward pass.
+    """
+    @abstractmethod
+    def __call__(self, t: float) -> float:
+        pass
+
+
+class ConstantGuidanceSchedule(GuidanceSchedule):
+    """
+    Full guidance at every timestep.
+    """
+    def __call__(self, t: float) -> float:
+        return 1.0
+
+
+class IntervalGuidanceSchedule(GuidanceSchedule):
+    """
+    Full guidance for timesteps inside an interval, none outside it.
+
+    Args:
+        interval: The (t_min, t_max) interval, inclusive.
+    """
+    def __init__(self, interval: Tuple[float, float] = (0.0, 1.0)):
+        self.interval = interval
+
+    def __call__(self, t: float) -> float:
+        return 1.0 if self.interval[0] <= t <= self.interval[1] else 0.0
+
+
+class LinearGuidanceSchedule(GuidanceSchedule):
+    """
+    Guidance that changes linearly in t, from `start` times the strength at t = 1
+    to `end` times the strength at t = 0.
+
+    Args:
+        start: The multiplier at t = 1.
+        end: The multiplier at t = 0.
+    """
+    def __init__(self, start: float = 1.0, end: float = 0.0):
+        self.start = start
+        self.end = end
+
+    def __call__(self, t: float) -> float:
+        return self.end + (self.start - self.end) * t
+
+
+class FirstStepsGuidanceSchedule(GuidanceSchedule):
+    """
+    Full guidance for the first `k` steps of a timestep schedule, none afterwards.
+
+    Args:
+        k: The number of guided steps.
+        t_pairs: The (t, t_prev) pairs of the steps.
+    """
+    def __init__(self, k: int, t_pairs: List[Tuple[float, float]]):
+        self.k = k
+        # Guided evaluations lie strictly before the end of the k-th step
+        if k <= 0:
+            self.t_min = float('inf')
+        elif k >= len(t_pairs):
+            self.t_min = float('-inf')
+        else:
+            self.t_min = t_pairs[k - 1][1]
+
+    def __call__(self, t: float) -> float:
+        return 1.0 if t > self.t_min else 0.0
+
+
+def get_guidance_schedule(
+    config: Optional[Union[dict, GuidanceSchedule]],
+    t_pairs: List[Tuple[float, float]],
+) -> Optional[GuidanceSchedule]:
+    """
+    Build a guidance schedule from its config, as given in the sampler parameters.
+
+    Args:
+        config: None, a GuidanceSchedule, or a dict with the 'name' of the schedule
+            ('constant', 'interval', 'linear' or 'first_steps') and its arguments, e.g.
+            {'name': 'linear', 'start': 1.0, 'end': 0.0} or {'name': 'first_steps', 'k': 4}.
+        t_pairs: The (t, t_prev) pairs of the sampling steps.
+    """
+    if config is None or isinstance(config, GuidanceSchedule):
+        return config
+    args = {k: v for k, v in config.items() if k != 'name'}
+    name = config['name']
+    if name == 'constant':
+        return ConstantGuidanceSchedule()
+    elif name == 'interval':
+        return IntervalGuidanceSchedule(**args)
+    elif name == 'linear':
+        return LinearGuidanceSchedule(**args)
+    elif name == 'first_steps':
+        return FirstStepsGuidanceSchedule(t_pairs=t_pairs, **args)
+    else:
+        raise ValueError(f"Unknown guidance schedule: {name}")
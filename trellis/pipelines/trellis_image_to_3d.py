@@ -1,4 +1,5 @@
 from typing import *
+import itertools
 from contextlib import contextmanager
 import torch
 import torch.nn as nn
@@ -13,6 +14,7 @@ from .base import Pipeline
 from . import samplers
 from ..modules import sparse as sp
 from ..representations import Gaussian, Strivec, MeshExtractResult
+from ..utils.cache_utils import ArrayCache, hash_image
 
 
 class TrellisImageTo3DPipeline(Pipeline):
@@ -25,6 +27,7 @@ class TrellisImageTo3DPipeline(Pipeline):
         slat_sampler (samplers.Sampler): The sampler for the structured latent.
         slat_normalization (dict): The normalization parameters for the structured latent.
         image_cond_model (str): The name of the image conditioning model.
+        cond_cache (ArrayCache): Optional cache of preprocessed images and image conditions, keyed by image content.
     """
     def __init__(
         self,
@@ -33,6 +36,7 @@ class TrellisImageTo3DPipeline(Pipeline):
         slat_sampler: samplers.Sampler = None,
         slat_normalization: dict = None,
         image_cond_model: str = None,
+        cond_cache: ArrayCache = None,
     ):
         if models is None:
             return
@@ -43,6 +47,7 @@ class TrellisImageTo3DPipeline(Pipeline):
         self.slat_sampler_params = {}
         self.slat_normalization = slat_normalization
         self.rembg_session = None
+        self.cond_cache = cond_cache
         self._init_image_cond_model(image_cond_model)
 
     @staticmethod
@@ -85,7 +90,20 @@ class TrellisImageTo3DPipeline(Pipeline):
     def preprocess_image(self, input: Image.Image) -> Image.Image:
         """
         Preprocess the input image.
+        The result is looked up in and stored to `cond_cache` if one is set.
         """
+        cache = getattr(self, 'cond_cache', None)
+        if cache is None:
+            return self._preprocess_image(input)
+        key = f'preprocess_{hash_image(input)}'
+        cached = cache.get(key)
+        if cached is not None:
+            return Image.fromarray(np.asarray(cached['image']))
+        output = self._preprocess_image(input)
+        cache.put(key, {'image': np.array(output)})
+        return output
+
+    def _preprocess_image(self, input: Image.Image) -> Image.Image:
         # if has alpha channel, use it directly; otherwise, remove background
         has_alpha = False
         if input.mode == 'RGBA':
@@ -145,6 +163,22 @@ class TrellisImageTo3DPipeline(Pipeline):
         patchtokens = F.layer_norm(features, features.shape[-1:])
         return patchtokens
         
+    @torch.no_grad()
+    def _encode_image_cached(self, image: list[Image.Image], cache: ArrayCache) -> torch.Tensor:
+        """
+        Encode a list of images, only running the image conditioning model on images missing from the cache.
+        """
+        keys = [f'cond_{hash_image(i)}' for i in image]
+        conds = [cache.get(key) for key in keys]
+        missing = [i for i, c in enumerate(conds) if c is None]
+        if len(missing) > 0:
+            features = self.encode_image([image[i] for i in missing])
+            for j, i in enumerate(missing):
+                # A host copy of the slice, so that the entry does not keep the whole batch alive on the device
+                conds[i] = {'cond': features[j:j+1].to('cpu', copy=True)}
+                cache.put(keys[i], conds[i])
+        return torch.cat([torch.as_tensor(c['cond']).to(self.device) for c in conds], dim=0)
+        
     def get_cond(self, image: Union[torch.Tensor, list[Image.Image]]) -> dict:
         """
         Get the conditioning information for the model.
@@ -155,18 +189,33 @@ class TrellisImageTo3DPipeline(Pipeline):
         Returns:
             dict: The conditioning information
         """
-        cond = self.encode_image(image)
+        cache = getattr(self, 'cond_cache', None)
+        if cache is not None and isinstance(image, list):
+            cond = self._encode_image_cached(image, cache)
+        else:
+            cond = self.encode_image(image)
         neg_cond = torch.zeros_like(cond)
         return {
             'cond': cond,
             'neg_cond': neg_cond,
         }
 
+    def _sparse_structure_noise(self, num_samples: int, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        flow_model = self.models['sparse_structure_flow_model']
+        reso = flow_model.resolution
+        return torch.randn(num_samples, flow_model.in_channels, reso, reso, reso, generator=generator)
+
+    def _slat_noise(self, num_voxels: int, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        return torch.randn(num_voxels, self.models['slat_flow_model'].in_channels, generator=generator)
+
     def sample_sparse_structure(
         self,
         cond: dict,
         num_samples: int = 1,
         sampler_params: dict = {},
+        noise: Optional[torch.Tensor] = None,
+        preview: Optional[Callable[[torch.Tensor], None]] = None,
+        preview_interval: int = 3,
     ) -> torch.Tensor:
         """
         Sample sparse structures with the given conditioning.
@@ -175,22 +224,36 @@ class TrellisImageTo3DPipeline(Pipeline):
             cond (dict): The conditioning information.
             num_samples (int): The number of samples to generate.
             sampler_params (dict): Additional parameters for the sampler.
+            noise (torch.Tensor): Pre-drawn initial noise. Drawn from the global RNG if None.
+            preview (Callable): If given, called every `preview_interval` steps with the coordinates
+                of the occupancy decoded from the current prediction of x_0.
+            preview_interval (int): The number of sampling steps between previews.
         """
         # Sample occupancy latent
         flow_model = self.models['sparse_structure_flow_model']
-        reso = flow_model.resolution
-        noise = torch.randn(num_samples, flow_model.in_channels, reso, reso, reso).to(self.device)
-        sampler_params = {**self.sparse_structure_sampler_params, **sampler_params}
+        decoder = self.models['sparse_structure_decoder']
+        if noise is None:
+            noise = self._sparse_structure_noise(num_samples)
+        noise = noise.to(self.device)
+        # Only the final sample is used, so don't keep the per-step history alive
+        sampler_params = {'history_stride': 0, **self.sparse_structure_sampler_params, **sampler_params}
+
+        callback = None
+        if preview is not None:
+            def callback(out):
+                if (out.step + 1) % preview_interval == 0 and out.step + 1 < out.num_steps:
+                    preview(torch.argwhere(decoder(out.pred_x_0) > 0)[:, [0, 2, 3, 4]].int())
+
         z_s = self.sparse_structure_sampler.sample(
             flow_model,
             noise,
             **cond,
             **sampler_params,
-            verbose=True
+            verbose=True,
+            callback=callback,
         ).samples
         
         # Decode occupancy latent
-        decoder = self.models['sparse_structure_decoder']
         coords = torch.argwhere(decoder(z_s)>0)[:, [0, 2, 3, 4]].int()
 
         return coords
@@ -224,6 +287,7 @@ class TrellisImageTo3DPipeline(Pipeline):
         cond: dict,
         coords: torch.Tensor,
         sampler_params: dict = {},
+        noise: Optional[torch.Tensor] = None,
     ) -> sp.SparseTensor:
         """
         Sample structured latent with the given conditioning.
@@ -232,14 +296,17 @@ class TrellisImageTo3DPipeline(Pipeline):
             cond (dict): The conditioning information.
             coords (torch.Tensor): The coordinates of the sparse structure.
             sampler_params (dict): Additional parameters for the sampler.
+            noise (torch.Tensor): Pre-drawn [N x C] noise features. Drawn from the global RNG if None.
         """
         # Sample structured latent
         flow_model = self.models['slat_flow_model']
+        if noise is None:
+            noise = self._slat_noise(coords.shape[0])
         noise = sp.SparseTensor(
-            feats=torch.randn(coords.shape[0], flow_model.in_channels).to(self.device),
+            feats=noise.to(self.device),
             coords=coords,
         )
-        sampler_params = {**self.slat_sampler_params, **sampler_params}
+        sampler_params = {'history_stride': 0, **self.slat_sampler_params, **sampler_params}
         slat = self.slat_sampler.sample(
             flow_model,
             noise,
@@ -264,6 +331,9 @@ class TrellisImageTo3DPipeline(Pipeline):
         slat_sampler_params: dict = {},
         formats: List[str] = ['mesh', 'gaussian', 'radiance_field'],
         preprocess_image: bool = True,
+        progress: Optional[Callable[[str], None]] = None,
+        preview: Optional[Callable[[torch.Tensor], None]] = None,
+        preview_interval: int = 3,
     ) -> dict:
         """
         Run the pipeline.
@@ -274,15 +344,108 @@ class TrellisImageTo3DPipeline(Pipeline):
             sparse_structure_sampler_params (dict): Additional parameters for the sparse structure sampler.
             slat_sampler_params (dict): Additional parameters for the structured latent sampler.
             preprocess_image (bool): Whether to preprocess the image.
+            progress (Callable): Called with the name of each stage ('sampling_ss', 'sampling_slat', 'decoding') as it starts.
+            preview (Callable): If given, called every `preview_interval` sparse structure sampling steps with the
+                [N x 4] coordinates of the occupancy decoded from the current prediction.
+            preview_interval (int): The number of sampling steps between previews.
         """
         if preprocess_image:
             image = self.preprocess_image(image)
         cond = self.get_cond([image])
-        torch.manual_seed(seed)
-        coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params)
-        slat = self.sample_slat(cond, coords, slat_sampler_params)
+        # Noise is drawn from a generator of the run rather than the global RNG, so that concurrent
+        # runs on other threads neither disturb nor depend on each other
+        generator = torch.Generator().manual_seed(seed)
+        if progress is not None:
+            progress('sampling_ss')
+        noise = self._sparse_structure_noise(num_samples, generator)
+        coords = self.sample_sparse_structure(
+            cond, num_samples, sparse_structure_sampler_params, noise=noise,
+            preview=preview, preview_interval=preview_interval,
+        )
+        if progress is not None:
+            progress('sampling_slat')
+        noise = self._slat_noise(coords.shape[0], generator)
+        slat = self.sample_slat(cond, coords, slat_sampler_params, noise=noise)
+        if progress is not None:
+            progress('decoding')
         return self.decode_slat(slat, formats)
 
+    @torch.no_grad()
+    def run_batch(
+        self,
+        images: List[Image.Image],
+        seeds: Optional[List[int]] = None,
+        sparse_structure_sampler_params: Union[dict, List[dict]] = {},
+        slat_sampler_params: Union[dict, List[dict]] = {},
+        formats: List[str] = ['mesh', 'gaussian', 'radiance_field'],
+        preprocess_image: bool = True,
+    ) -> List[dict]:
+        """
+        Run the pipeline for several independent requests in one batched pass.
+
+        The conditioning of all requests is stacked, requests sharing the same sampler
+        parameters are sampled together and the structured latents of a group are packed
+        into one variable-length sparse tensor with one layout slice per request.
+        Each request draws its noise from its own seeded generator, so the result of a
+        request matches `run(image, seed=seed)`.
+
+        Args:
+            images (List[Image.Image]): The image prompts, one per request.
+            seeds (List[int]): The random seeds, one per request. Defaults to 42 for all.
+            sparse_structure_sampler_params (Union[dict, List[dict]]): Additional parameters for the sparse structure sampler,
+                either shared by all requests or one dict per request.
+            slat_sampler_params (Union[dict, List[dict]]): Additional parameters for the structured latent sampler,
+                either shared by all requests or one dict per request.
+            formats (List[str]): The formats to decode the structured latent to.
+            preprocess_image (bool): Whether to preprocess the images.
+
+        Returns:
+            List[dict]: The decoded outputs of each request, in the same format as `run`.
+        """
+        num_requests = len(images)
+        if seeds is None:
+            seeds = [42] * num_requests
+        if isinstance(sparse_structure_sampler_params, dict):
+            sparse_structure_sampler_params = [sparse_structure_sampler_params] * num_requests
+        if isinstance(slat_sampler_params, dict):
+            slat_sampler_params = [slat_sampler_params] * num_requests
+        assert len(seeds) == num_requests, f"Expected {num_requests} seeds, got {len(seeds)}"
+        assert len(sparse_structure_sampler_params) == num_requests, \
+            f"Expected {num_requests} sparse structure sampler params, got {len(sparse_structure_sampler_params)}"
+        assert len(slat_sampler_params) == num_requests, \
+            f"Expected {num_requests} slat sampler params, got {len(slat_sampler_params)}"
+
+        if preprocess_image:
+            images = [self.preprocess_image(image) for image in images]
+        cond = self.get_cond(images)
+        generators = [torch.Generator().manual_seed(seed) for seed in seeds]
+
+        # Requests can only share a sampler call if they share its parameters
+        groups = {}
+        for i in range(num_requests):
+            key = (repr(sorted(sparse_structure_sampler_params[i].items())), repr(sorted(slat_sampler_params[i].items())))
+            groups.setdefault(key, []).append(i)
+
+        outputs = [None] * num_requests
+        for indices in groups.values():
+            group_cond = {k: v[indices] for k, v in cond.items()}
+
+            # Sample sparse structures
+            noise = torch.cat([self._sparse_structure_noise(1, generators[i]) for i in indices])
+            coords = self.sample_sparse_structure(group_cond, len(indices), sparse_structure_sampler_params[indices[0]], noise=noise)
+
+            # Sample structured latents, one layout slice per request
+            seq_len = torch.bincount(coords[:, 0], minlength=len(indices)).tolist()
+            noise = torch.cat([self._slat_noise(n, generators[i]) for i, n in zip(indices, seq_len)])
+            slat = self.sample_slat(group_cond, coords, slat_sampler_params[indices[0]], noise=noise)
+
+            # Split the decoded batch back out per request
+            decoded = self.decode_slat(slat, formats)
+            for j, i in enumerate(indices):
+                outputs[i] = {k: v[j:j+1] for k, v in decoded.items()}
+
+        return outputs
+
     @contextmanager
     def inject_sampler_multi_image(
         self,
@@ -307,16 +470,19 @@ class TrellisImageTo3DPipeline(Pipeline):
                 print(f"\033[93mWarning: number of conditioning images is greater than number of steps for {sampler_name}. "
                     "This may lead to performance degradation.\033[0m")
 
-            cond_indices = (np.arange(num_steps) % num_images).tolist()
+            # Cycle through the images per model evaluation; higher-order samplers evaluate more than once per step
+            cond_indices = itertools.cycle(range(num_images))
             def _new_inference_model(self, model, x_t, t, cond, **kwargs):
-                cond_idx = cond_indices.pop(0)
+                cond_idx = next(cond_indices)
                 cond_i = cond[cond_idx:cond_idx+1]
                 return self._old_inference_model(model, x_t, t, cond=cond_i, **kwargs)
         
         elif mode =='multidiffusion':
             from .samplers import FlowEulerSampler
-            def _new_inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, **kwargs):
-                if cfg_interval[0] <= t <= cfg_interval[1]:
+            def _new_inference_model(self, model, x_t, t, cond, neg_cond, cfg_strength, cfg_interval, cfg_fused=False, cfg_schedule=None, **kwargs):
+                if cfg_schedule is not None:
+                    cfg_strength = cfg_strength * cfg_schedule(t)
+                if cfg_interval[0] <= t <= cfg_interval[1] and cfg_strength != 0:
                     preds = []
                     for i in range(len(cond)):
                         preds.append(FlowEulerSampler._inference_model(self, model, x_t, t, cond[i:i+1], **kwargs))
@@ -366,11 +532,12 @@ class TrellisImageTo3DPipeline(Pipeline):
             images = [self.preprocess_image(image) for image in images]
         cond = self.get_cond(images)
         cond['neg_cond'] = cond['neg_cond'][:1]
-        torch.manual_seed(seed)
+        generator = torch.Generator().manual_seed(seed)
         ss_steps = {**self.sparse_structure_sampler_params, **sparse_structure_sampler_params}.get('steps')
         with self.inject_sampler_multi_image('sparse_structure_sampler', len(images), ss_steps, mode=mode):
-            coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params)
+            noise = self._sparse_structure_noise(num_samples, generator)
+            coords = self.sample_sparse_structure(cond, num_samples, sparse_structure_sampler_params, noise=noise)
         slat_steps = {**self.slat_sampler_params, **slat_sampler_params}.get('steps')
         with self.inject_sampler_multi_image('slat_sampler', len(images), slat_steps, mode=mode):
-            slat = self.sample_slat(cond, coords, slat_sampler_params)
+            slat = self.sample_slat(cond, coords, slat_sampler_params, noise=self._slat_noise(coords.shape[0], generator))
         return self.decode_slat(slat, formats)
@@ -4,9 +4,11 @@ __attributes = {
     'OctreeRenderer': 'octree_renderer',
     'GaussianRenderer': 'gaussian_render',
     'MeshRenderer': 'mesh_renderer',
+    'TorchGaussianRenderer': 'gaussian_render_torch',
+    'TorchMeshRenderer': 'mesh_renderer_torch',
 }
 
-__submodules = []
+__submodules = ['pool']
 
 __all__ = list(__attributes.keys()) + __submodules
 
@@ -28,4 +30,7 @@ def __getattr__(name):
 if __name__ == '__main__':
     from .octree_renderer import OctreeRenderer
     from .gaussian_render import GaussianRenderer
-    from .mesh_renderer import MeshRenderer
\ No newline at end of file
+    from .mesh_renderer import MeshRenderer
+    from .gaussian_render_torch import TorchGaussianRenderer
+    from .mesh_renderer_torch import TorchMeshRenderer
+    from . import pool
\ No newline at end of file
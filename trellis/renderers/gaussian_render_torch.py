@@ -0,0 +1,212 @@
+import torch
+import numpy as np
+import torch.nn.functional as F
+from easydict import EasyDict as edict
+from ..representations.gaussian import Gaussian
+from ..representations.gaussian.general_utils import build_scaling_rotation
+from .sh_utils import eval_sh
+
+
+def splat_gaussians(
+    means: torch.Tensor,
+    covs: torch.Tensor,
+    colors: torch.Tensor,
+    opacities: torch.Tensor,
+    extrinsics: torch.Tensor,
+    intrinsics: torch.Tensor,
+    resolution: int,
+    bg_color: torch.Tensor,
+    kernel_size: float = 0.1,
+    max_fragments: int = 1 << 22,
+) -> torch.Tensor:
+    """
+    Alpha-composite 3D Gaussians front to back in plain PyTorch, for devices without the CUDA
+    rasterizer.
+
+    Follows the EWA splatting of the Mip-Splatting rasterizer `GaussianRenderer` uses: the
+    projected covariances are dilated by `kernel_size` pixels with the opacities compensated,
+    fragments with an alpha below 1/255 are skipped, alpha is capped at 0.99, and a pixel stops
+    accumulating before its transmittance would drop below 1e-4. Gaussians are processed in
+    depth order, in chunks of about `max_fragments` fragments, carrying the transmittance of
+    every pixel over.
+
+    Args:
+        means (torch.Tensor): [N x 3] centers.
+        covs (torch.Tensor): [N x 3 x 3] covariances.
+        colors (torch.Tensor): [N x 3] colors.
+        opacities (torch.Tensor): [N] opacities.
+        extrinsics (torch.Tensor): [4 x 4] OpenCV extrinsics.
+        intrinsics (torch.Tensor): [3 x 3] normalized OpenCV intrinsics.
+        resolution (int): Width and height of the image.
+        bg_color (torch.Tensor): [3] background color.
+        kernel_size (float): Dilation of the projected covariances, in pixels.
+        max_fragments (int): Maximum number of fragments processed at once.
+
+    Returns:
+        (torch.Tensor): [3 x H x W] image.
+    """
+    device = means.device
+    R, t = extrinsics[:3, :3], extrinsics[:3, 3]
+    view = means @ R.T + t
+    in_front = view[:, 2] > 0.2
+    view, covs, colors, opacities = view[in_front], covs[in_front], colors[in_front], opacities[in_front]
+    x, y, z = view.unbind(dim=-1)
+
+    # Projection and the Jacobian of the projection, in pixels
+    fx, fy = intrinsics[0, 0] * resolution, intrinsics[1, 1] * resolution
+    u = (intrinsics[0, 0] * x / z + intrinsics[0, 2]) * resolution
+    v = (intrinsics[1, 1] * y / z + intrinsics[1, 2]) * resolution
+    lim_x, lim_y = 1.3 * 0.5 / intrinsics[0, 0], 1.3 * 0.5 / intrinsics[1, 1]
+    tx, ty = (x / z).clamp(-lim_x, lim_x) * z, (y / z).clamp(-lim_y, lim_y) * z
+    J = torch.zeros((view.shape[0], 2, 3), dtype=view.dtype, device=device)
+    J[:, 0, 0], J[:, 0, 2] = fx / z, -fx * tx / z ** 2
+    J[:, 1, 1], J[:, 1, 2] = fy / z, -fy * ty / z ** 2
+    T = J @ R
+    cov2d = T @ covs @ T.transpose(1, 2)
+    a, b, c = cov2d[:, 0, 0], cov2d[:, 0, 1], cov2d[:, 1, 1]
+    det_0 = (a * c - b * b).clamp_min(1e-6)
+    a, c = a + kernel_size, c + kernel_size
+    det_1 = (a * c - b * b).clamp_min(1e-6)
+    opacities = opacities * torch.where((det_0 > 1e-6) & (det_1 > 1e-6), torch.sqrt(det_0 / (det_1 + 1e-6) + 1e-6), 0)
+    conic = torch.stack([c, -b, a], dim=-1) / det_1[:, None]
+    # Fragments are kept where alpha >= 1/255, within this many pixels of the center along the major axis
+    mid = 0.5 * (a + c)
+    major = mid + torch.sqrt((mid * mid - det_1).clamp_min(0.1))
+    radius = torch.ceil(torch.sqrt(2 * torch.log((255 * opacities).clamp_min(1)) * major)).long()
+    base_x = torch.floor(u - 0.5).long() - radius
+    base_y = torch.floor(v - 0.5).long() - radius
+    keep = (radius > 0) & (base_x < resolution) & (base_y < resolution) & (base_x + 2 * radius + 1 >= 0) & (base_y + 2 * radius + 1 >= 0)
+
+    # Gaussians in depth order; every one is evaluated on a square window of side 2 * radius + 2
+    order = torch.nonzero(keep).reshape(-1)
+    order = order[torch.argsort(z[order], stable=True)]
+    radius, base_x, base_y = radius[order], base_x[order], base_y[order]
+    u, v, conic, opacities, colors = u[order], v[order], conic[order], opacities[order], colors[order]
+    counts = (2 * radius + 2) ** 2
+
+    num_pixels = resolution * resolution
+    image = torch.zeros((num_pixels, 3), dtype=colors.dtype, device=device)
+    transmittance = torch.ones(num_pixels, dtype=torch.float64, device=device)
+    done = torch.zeros(num_pixels, dtype=torch.bool, device=device)
+    ends = torch.cumsum(counts, dim=0)
+    start = 0
+    while start < order.shape[0]:
+        end = max(int(torch.searchsorted(ends, ends[start] - counts[start] + max_fragments, right=True)), start + 1)
+        frag_pix, frag_rank, frag_alpha = [], [], []
+        chunk_radius = radius[start:end]
+        for r in torch.unique(chunk_radius).tolist():
+            # The Gaussians of one radius share their window offsets
+            idx = start + torch.nonzero(chunk_radius == r).reshape(-1)
+            offsets = torch.arange(2 * r + 2, device=device)
+            px = base_x[idx, None, None] + offsets[None, None, :]
+            py = base_y[idx, None, None] + offsets[None, :, None]
+            dx, dy = u[idx, None, None] - (px + 0.5), v[idx, None, None] - (py + 0.5)
+            power = -0.5 * (conic[idx, 0, None, None] * dx * dx + conic[idx, 2, None, None] * dy * dy) - conic[idx, 1, None, None] * dx * dy
+            alpha = (opacities[idx, None, None] * torch.exp(power)).clamp_max(0.99)
+            valid = (power <= 0) & (alpha >= 1 / 255) & (px >= 0) & (px < resolution) & (py >= 0) & (py < resolution)
+            frag_pix.append((py * resolution + px).masked_select(valid))
+            frag_rank.append(idx[:, None, None].expand_as(valid).masked_select(valid))
+            frag_alpha.append(alpha.masked_select(valid))
+        pix, rank, alpha = torch.cat(frag_pix), torch.cat(frag_rank), torch.cat(frag_alpha)
+
+        # Group the fragments by pixel, in depth order within each pixel
+        key, perm = torch.sort(pix * order.shape[0] + rank)
+        pix, rank, alpha = key // order.shape[0], key % order.shape[0], alpha[perm]
+        pix_unique, pix_counts = torch.unique_consecutive(pix, return_counts=True)
+        seg_start = torch.cumsum(pix_counts, dim=0) - pix_counts
+        log_t = torch.log1p(-alpha.double())
+        log_t_before = torch.cumsum(log_t, dim=0) - log_t
+        log_t_before -= log_t_before[seg_start].repeat_interleave(pix_counts)
+        t_before = transmittance[pix] * torch.exp(log_t_before)
+
+        # A pixel takes no fragment once one would bring its transmittance below 1e-4
+        stop = (t_before * (1 - alpha.double()) < 1e-4).int()
+        stops_before = torch.cumsum(stop, dim=0, dtype=torch.int32) - stop
+        stopped = stops_before + stop - stops_before[seg_start].repeat_interleave(pix_counts) > 0
+        take = torch.nonzero(~stopped & ~done[pix]).reshape(-1)
+        image.index_add_(0, pix[take], colors[rank[take]] * (alpha[take] * t_before[take].to(alpha.dtype))[:, None])
+        transmittance.mul_(torch.zeros_like(transmittance).index_add_(0, pix[take], log_t[take]).exp_())
+        done[pix[stopped]] = True
+        start = end
+
+    image = image + transmittance[:, None].to(image.dtype) * bg_color
+    return image.reshape(resolution, resolution, 3).permute(2, 0, 1)
+
+
+class TorchGaussianRenderer:
+    """
+    Renderer for the Gaussian representation in plain PyTorch, for devices without the CUDA
+    rasterizer. Takes the options of `GaussianRenderer` and renders with `splat_gaussians`.
+
+    Args:
+        rendering_options (dict): Rendering options.
+    """
+
+    def __init__(self, rendering_options={}) -> None:
+        self.pipe = edict({
+            "kernel_size": 0.1,
+            "scale_modifier": 1.0,
+            "max_fragments": 1 << 22,
+        })
+        self.rendering_options = edict({
+            "resolution": None,
+            "near": None,
+            "far": None,
+            "ssaa": 1,
+            "bg_color": 'random',
+        })
+        self.rendering_options.update(rendering_options)
+        self.bg_color = None
+
+    def render(
+            self,
+            gausssian: Gaussian,
+            extrinsics: torch.Tensor,
+            intrinsics: torch.Tensor,
+            colors_overwrite: torch.Tensor = None
+        ) -> edict:
+        """
+        Render the gausssian.
+
+        Args:
+            gaussian : gaussianmodule
+            extrinsics (torch.Tensor): (4, 4) camera extrinsics
+            intrinsics (torch.Tensor): (3, 3) camera intrinsics
+            colors_overwrite (torch.Tensor): (N, 3) override color
+
+        Returns:
+            edict containing:
+                color (torch.Tensor): (3, H, W) rendered color image
+        """
+        resolution = self.rendering_options["resolution"]
+        ssaa = self.rendering_options["ssaa"]
+        device = gausssian.get_xyz.device
+
+        if self.rendering_options["bg_color"] == 'random':
+            self.bg_color = torch.zeros(3, dtype=torch.float32, device=device)
+            if np.random.rand() < 0.5:
+                self.bg_color += 1
+        else:
+            self.bg_color = torch.tensor(self.rendering_options["bg_color"], dtype=torch.float32, device=device)
+
+        means = gausssian.get_xyz
+        L = build_scaling_rotation(self.pipe.scale_modifier * gausssian.get_scaling, gausssian.get_rotation)
+        if colors_overwrite is None:
+            camera = -extrinsics[:3, :3].T @ extrinsics[:3, 3]
+            dirs = F.normalize(means - camera, dim=-1)
+            shs = gausssian.get_features.transpose(1, 2).reshape(means.shape[0], 3, -1)
+            colors = torch.clamp_min(eval_sh(gausssian.active_sh_degree, shs, dirs) + 0.5, 0.0)
+        else:
+            colors = colors_overwrite
+
+        image = splat_gaussians(
+            means, L @ L.transpose(1, 2), colors, gausssian.get_opacity[:, 0],
+            extrinsics, intrinsics, resolution * ssaa, self.bg_color,
+            kernel_size=self.pipe.kernel_size, max_fragments=self.pipe.max_fragments,
+        )
+        if ssaa > 1:
+            image = F.interpolate(image[None], size=(resolution, resolution), mode='bilinear', align_corners=False, antialias=True).squeeze()
+
+        return edict({
+            'color': image
+        })
@@ -0,0 +1,223 @@
+from typing import *
+import torch
+import torch.nn.functional as F
+from easydict import EasyDict as edict
+from ..representations.mesh import MeshExtractResult
+
+
+def intrinsics_to_projection(
+        intrinsics: torch.Tensor,
+        near: float,
+        far: float,
+    ) -> torch.Tensor:
+    """
+    OpenCV intrinsics to OpenGL perspective matrix
+
+    Args:
+        intrinsics (torch.Tensor): [3, 3] OpenCV intrinsics matrix
+        near (float): near plane to clip
+        far (float): far plane to clip
+    Returns:
+        (torch.Tensor): [4, 4] OpenGL perspective matrix
+    """
+    fx, fy = intrinsics[0, 0], intrinsics[1, 1]
+    cx, cy = intrinsics[0, 2], intrinsics[1, 2]
+    ret = torch.zeros((4, 4), dtype=intrinsics.dtype, device=intrinsics.device)
+    ret[0, 0] = 2 * fx
+    ret[1, 1] = 2 * fy
+    ret[0, 2] = 2 * cx - 1
+    ret[1, 2] = - 2 * cy + 1
+    ret[2, 2] = far / (far - near)
+    ret[2, 3] = near * far / (near - far)
+    ret[3, 2] = 1.
+    return ret
+
+
+def rasterize_triangles(
+    verts_clip: torch.Tensor,
+    faces: torch.Tensor,
+    resolution: int,
+    max_fragments: int = 1 << 22,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Z-buffer rasterization of triangles in plain PyTorch, for devices without nvdiffrast.
+
+    Triangles are sampled at pixel centers without culling; triangles with a vertex behind the
+    camera are skipped, and fragments outside of the depth range [-1, 1] are discarded. Every
+    triangle is expanded to the pixels of its bounding box, `max_fragments` at most at a time,
+    and the nearest fragment of every pixel is kept, the first triangle winning ties, like
+    `visibility_utils.rasterize_face_ids_numpy`.
+
+    Args:
+        verts_clip (torch.Tensor): [V x 4] clip space vertices.
+        faces (torch.Tensor): [F x 3] faces.
+        resolution (int): Width and height of the image.
+        max_fragments (int): Maximum number of candidate pixels processed at once.
+
+    Returns:
+        (torch.Tensor): [H x W] face IDs, offset by one; 0 marks background.
+        (torch.Tensor): [H x W x 3] perspective-correct barycentric coordinates.
+        (torch.Tensor): [H x W] normalized device depth, inf at the background.
+    """
+    device, dtype = verts_clip.device, verts_clip.dtype
+    faces = faces.long()
+    w = verts_clip[:, 3]
+    valid = w > 0
+    screen = torch.zeros_like(verts_clip[:, :3])
+    screen[valid] = verts_clip[valid, :3] / w[valid, None]
+    screen[:, :2] = (screen[:, :2] + 1) * 0.5 * resolution
+    x, y, z = screen[faces].unbind(dim=-1)          # [F x 3] each
+    area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+    xmin = torch.floor(x.min(dim=1).values - 0.5).clamp_min(0).long()
+    xmax = torch.ceil(x.max(dim=1).values - 0.5).clamp_max(resolution - 1).long()
+    ymin = torch.floor(y.min(dim=1).values - 0.5).clamp_min(0).long()
+    ymax = torch.ceil(y.max(dim=1).values - 0.5).clamp_max(resolution - 1).long()
+    keep = valid[faces].all(dim=1) & (area != 0) & (xmin <= xmax) & (ymin <= ymax)
+    face_indices = torch.nonzero(keep).reshape(-1)
+    # Per kept face: its pixel box, and the values every fragment needs, gathered at once
+    boxes = torch.stack([xmin, ymin, xmax - xmin + 1, torch.arange(faces.shape[0], device=device)], dim=-1)[face_indices]
+    triangles = torch.cat([x, y, z, area[:, None]], dim=-1)[face_indices]
+    counts = boxes[:, 2] * (ymax - ymin + 1)[face_indices]
+
+    num_pixels = resolution * resolution
+    zbuf = torch.full((num_pixels,), float('inf'), dtype=dtype, device=device)
+    face_ids = torch.zeros(num_pixels, dtype=torch.long, device=device)
+    bary = torch.zeros((num_pixels, 2), dtype=dtype, device=device)
+
+    # Triangles are processed in order, in chunks of about `max_fragments` candidate pixels
+    ends = torch.cumsum(counts, dim=0)
+    start = 0
+    while start < face_indices.shape[0]:
+        end = max(int(torch.searchsorted(ends, ends[start] - counts[start] + max_fragments, right=True)), start + 1)
+        chunk_counts = counts[start:end]
+        chunk_offsets = torch.cumsum(chunk_counts, dim=0) - chunk_counts
+        slot = torch.repeat_interleave(torch.arange(start, end, device=device), chunk_counts)
+        local = torch.arange(slot.shape[0], device=device) - chunk_offsets.repeat_interleave(chunk_counts)
+        box = boxes.index_select(0, slot)
+        px = box[:, 0] + local % box[:, 2]
+        py = box[:, 1] + local // box[:, 2]
+        pxc, pyc = px.to(dtype) + 0.5, py.to(dtype) + 0.5
+        x0, x1, x2, y0, y1, y2, z0, z1, z2, frag_area = triangles.index_select(0, slot).T
+        w0 = ((x1 - pxc) * (y2 - pyc) - (x2 - pxc) * (y1 - pyc)) / frag_area
+        w1 = ((x2 - pxc) * (y0 - pyc) - (x0 - pxc) * (y2 - pyc)) / frag_area
+        w2 = 1 - w0 - w1
+        frag_z = w0 * z0 + w1 * z1 + w2 * z2
+        inside = torch.nonzero((w0 >= 0) & (w1 >= 0) & (w2 >= 0) & (frag_z >= -1) & (frag_z <= 1)).reshape(-1)
+        pix = (py * resolution + px).index_select(0, inside)
+        frag_face, frag_z = box[:, 3].index_select(0, inside), frag_z.index_select(0, inside)
+        w0, w1 = w0.index_select(0, inside), w1.index_select(0, inside)
+
+        # The nearest fragment of every pixel, the one of the first face among equally near ones
+        zmin = torch.full((num_pixels,), float('inf'), dtype=dtype, device=device).scatter_reduce(0, pix, frag_z, reduce='amin')
+        nearest = frag_z == zmin[pix]
+        fmin = torch.full((num_pixels,), faces.shape[0], dtype=torch.long, device=device).scatter_reduce(0, pix[nearest], frag_face[nearest], reduce='amin')
+        nearest = torch.nonzero(nearest & (frag_face == fmin[pix])).reshape(-1)
+        pix, frag_face, frag_z = pix[nearest], frag_face[nearest], frag_z[nearest]
+        closer = torch.nonzero(frag_z < zbuf[pix]).reshape(-1)
+        nearest, pix = nearest[closer], pix[closer]
+        zbuf[pix] = frag_z[closer]
+        face_ids[pix] = frag_face[closer] + 1
+        bary[pix] = torch.stack([w0[nearest], w1[nearest]], dim=-1)
+        start = end
+
+    # Screen space to perspective-correct barycentric coordinates
+    bary = torch.cat([bary, 1 - bary.sum(dim=-1, keepdim=True)], dim=-1)
+    covered = face_ids > 0
+    inv_w = 1 / w[faces[face_ids[covered] - 1]]
+    bary_persp = bary[covered] * inv_w
+    bary[covered] = bary_persp / bary_persp.sum(dim=-1, keepdim=True)
+    bary[~covered] = 0
+    return face_ids.reshape(resolution, resolution), bary.reshape(resolution, resolution, 3), zbuf.reshape(resolution, resolution)
+
+
+class TorchMeshRenderer:
+    """
+    Renderer for the Mesh representation in plain PyTorch, for devices without nvdiffrast.
+
+    Produces the outputs of `MeshRenderer` with `rasterize_triangles`, without its
+    analytic antialiasing; use `ssaa` to smooth the edges.
+
+    Args:
+        rendering_options (dict): Rendering options.
+    """
+    def __init__(self, rendering_options={}, device='cpu'):
+        self.rendering_options = edict({
+            "resolution": None,
+            "near": None,
+            "far": None,
+            "ssaa": 1,
+            "max_fragments": 1 << 22,
+        })
+        self.rendering_options.update(rendering_options)
+        self.device = device
+
+    def render(
+            self,
+            mesh : MeshExtractResult,
+            extrinsics: torch.Tensor,
+            intrinsics: torch.Tensor,
+            return_types = ["mask", "normal", "depth"]
+        ) -> edict:
+        """
+        Render the mesh.
+
+        Args:
+            mesh : meshmodel
+            extrinsics (torch.Tensor): (4, 4) camera extrinsics
+            intrinsics (torch.Tensor): (3, 3) camera intrinsics
+            return_types (list): list of return types, can be "mask", "depth", "normal_map", "normal", "color"
+
+        Returns:
+            edict based on return_types containing:
+                color (torch.Tensor): [3, H, W] rendered color image
+                depth (torch.Tensor): [H, W] rendered depth image
+                normal (torch.Tensor): [3, H, W] rendered normal image
+                normal_map (torch.Tensor): [3, H, W] rendered normal map image
+                mask (torch.Tensor): [H, W] rendered mask image
+        """
+        resolution = self.rendering_options["resolution"]
+        near = self.rendering_options["near"]
+        far = self.rendering_options["far"]
+        ssaa = self.rendering_options["ssaa"]
+        size = resolution * ssaa
+        device = mesh.vertices.device
+
+        if mesh.vertices.shape[0] == 0 or mesh.faces.shape[0] == 0:
+            return edict({
+                k: torch.zeros((3, resolution, resolution) if k in ['normal', 'normal_map', 'color'] else (resolution, resolution), device=device)
+                for k in return_types
+            })
+
+        perspective = intrinsics_to_projection(intrinsics, near, far)
+        vertices_homo = torch.cat([mesh.vertices, torch.ones_like(mesh.vertices[:, :1])], dim=-1)
+        vertices_camera = vertices_homo @ extrinsics.T
+        vertices_clip = vertices_homo @ (perspective @ extrinsics).T
+        face_ids, bary, _ = rasterize_triangles(vertices_clip, mesh.faces, size, self.rendering_options["max_fragments"])
+        covered = face_ids > 0
+        faces = mesh.faces.long()[face_ids[covered] - 1]        # [P x 3]
+        weights = bary[covered][..., None]                      # [P x 3 x 1]
+
+        def interpolate(corner_attrs: torch.Tensor) -> torch.Tensor:
+            # [P x 3 x C] attributes at the corners of the covered faces to an [H x W x C] image
+            img = torch.zeros((size, size, corner_attrs.shape[-1]), dtype=corner_attrs.dtype, device=device)
+            img[covered] = (corner_attrs * weights).sum(dim=1)
+            return img
+
+        out_dict = edict()
+        for type in return_types:
+            if type == "mask":
+                img = covered[..., None].float()
+            elif type == "depth":
+                img = interpolate(vertices_camera[:, 2:3][faces])
+            elif type == "normal":
+                img = (interpolate(mesh.face_normal[face_ids[covered] - 1]) + 1) / 2
+            elif type == "normal_map":
+                img = interpolate(mesh.vertex_attrs[:, 3:][faces])
+            elif type == "color":
+                img = interpolate(mesh.vertex_attrs[:, :3][faces])
+            img = img.permute(2, 0, 1)
+            if ssaa > 1:
+                img = F.interpolate(img[None], (resolution, resolution), mode='bilinear', align_corners=False, antialias=True)[0]
+            out_dict[type] = img.squeeze(0)
+
+        return out_dict
@@ -0,0 +1,103 @@
+from typing import *
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+import torch
+
+
+class RendererPool:
+    """
+    Process-level pool of renderers and rasterization contexts, keyed by their type, device and options.
+
+    Creating a renderer or a context is expensive (every `MeshRenderer` creates a CUDA rasterization
+    context), while they can be reused by any later call with the same key. Checkout is thread-safe
+    and exclusive: an object is handed to one caller at a time, and a new one is created if all
+    objects of the key are checked out. At most `max_idle` objects per key are kept once released;
+    an object that is never released, e.g. after an error, is simply not reused.
+
+    Args:
+        max_idle (int): Maximum number of idle objects kept per key.
+    """
+    def __init__(self, max_idle: int = 4):
+        self.max_idle = max_idle
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Check out an idle object of `key`, or create one with `factory`.
+        """
+        with self._lock:
+            if self._idle[key]:
+                self.reused += 1
+                return self._idle[key].pop()
+            self.created += 1
+        return factory()
+
+    def release(self, key: Hashable, obj: Any) -> None:
+        """
+        Return an object checked out with `acquire`.
+        """
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(obj)
+
+    @contextmanager
+    def checkout(self, key: Hashable, factory: Callable[[], Any]):
+        obj = self.acquire(key, factory)
+        try:
+            yield obj
+        finally:
+            self.release(key, obj)
+
+    def clear(self) -> None:
+        """
+        Drop all idle objects, e.g. to free their device memory.
+        """
+        with self._lock:
+            self._idle.clear()
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': sum(len(objs) for objs in self._idle.values()),
+            }
+
+
+default_pool = RendererPool()
+
+
+def _device_key(device: Union[str, torch.device]) -> str:
+    device = torch.device(device)
+    if device.type == 'cuda' and device.index is None and torch.cuda.is_available():
+        device = torch.device('cuda', torch.cuda.current_device())
+    return str(device)
+
+
+def rasterize_cuda_context(device: Union[str, torch.device] = 'cuda'):
+    """
+    Check out an `nvdiffrast.torch.RasterizeCudaContext` of the device from the default pool.
+    """
+    import nvdiffrast.torch as dr
+    return default_pool.checkout(('RasterizeCudaContext', _device_key(device)), lambda: dr.RasterizeCudaContext(device=device))
+
+
+def rast_context(backend: str = 'cuda'):
+    """
+    Check out a `utils3d.torch.RastContext` of the current device from the default pool.
+    """
+    import utils3d
+    return default_pool.checkout(('RastContext', backend, _device_key('cuda')), lambda: utils3d.torch.RastContext(backend=backend))
+
+
+def renderer(key: Tuple, factory: Callable[[], Any], device: Union[str, torch.device] = 'cuda'):
+    """
+    Check out a renderer from the default pool. `key` must cover everything `factory` configures,
+    e.g. the renderer type and its rendering options.
+    """
+    return default_pool.checkout(('renderer', _device_key(device)) + tuple(key), factory)
@@ -14,8 +14,10 @@ class Gaussian:
             scaling_bias : float = 0.01,
             opacity_bias : float = 0.1,
             scaling_activation : str = "exp",
-            device='cuda'
+            device=None
         ):
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.init_params = {
             'aabb': aabb,
             'sh_degree': sh_degree,
@@ -63,10 +65,10 @@ class Gaussian:
 
         self.rotation_activation = torch.nn.functional.normalize
         
-        self.scale_bias = self.inverse_scaling_activation(torch.tensor(self.scaling_bias)).cuda()
-        self.rots_bias = torch.zeros((4)).cuda()
+        self.scale_bias = self.inverse_scaling_activation(torch.tensor(self.scaling_bias)).to(self.device)
+        self.rots_bias = torch.zeros((4), device=self.device)
         self.rots_bias[0] = 1
-        self.opacity_bias = self.inverse_opacity_activation(torch.tensor(self.opacity_bias)).cuda()
+        self.opacity_bias = self.inverse_opacity_activation(torch.tensor(self.opacity_bias)).to(self.device)
 
     @property
     def get_scaling(self):
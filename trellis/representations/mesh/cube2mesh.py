@@ -77,6 +77,16 @@ class SparseFeatures2Mesh:
         self.reg_v = verts.to(self.device)
         self.use_color = use_color
         self._calc_layout()
+
+    def to(self, device) -> 'SparseFeatures2Mesh':
+        '''
+        move the dense grid and the flexicubes tables to a device
+        '''
+        self.device = device
+        self.mesh_extractor = FlexiCubes(device=device)
+        self.reg_c = self.reg_c.to(device)
+        self.reg_v = self.reg_v.to(device)
+        return self
     
     def _calc_layout(self):
         LAYOUTS = {
@@ -110,6 +120,8 @@ class SparseFeatures2Mesh:
         Returns:
             return the success tag and ni you loss, 
         """
+        if self.reg_c.device != cubefeats.device:
+            self.to(cubefeats.device)
         # add sdf bias to verts_attrs
         coords = cubefeats.coords[:, 1:]
         feats = cubefeats.feats
@@ -13,8 +13,10 @@ class Strivec(Octree):
         sh_degree: int = 0,
         rank: int = 8,
         dim: int = 8,
-        device: str = "cuda",
+        device: str = None,
     ):
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
         assert np.log2(resolution) % 1 == 0, "Resolution must be a power of 2"
         self.resolution = resolution
         depth = int(np.round(np.log2(resolution)))
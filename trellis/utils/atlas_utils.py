@@ -0,0 +1,191 @@
+from typing import *
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+from scipy.sparse.csgraph import connected_components
+import xatlas
+
+
+__all__ = [
+    'face_components',
+    'split_mesh',
+    'parametrize_parallel',
+]
+
+
+def face_components(faces: np.ndarray, num_vertices: int) -> np.ndarray:
+    """
+    Label the faces of a mesh by the connected component they belong to, faces sharing a vertex being connected.
+
+    Args:
+        faces (np.ndarray): [F x 3] faces.
+        num_vertices (int): Number of vertices.
+
+    Returns:
+        (np.ndarray): [F] component labels, numbered by their first face.
+    """
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]]], axis=0)
+    adjacency = sparse.coo_matrix((np.ones(edges.shape[0], dtype=np.int8), (edges[:, 0], edges[:, 1])), shape=(num_vertices, num_vertices))
+    _, vertex_labels = connected_components(adjacency, directed=False)
+    labels = vertex_labels[faces[:, 0]]
+    # Renumber by first occurrence, so the labels only depend on the face order
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    return np.argsort(np.argsort(first))[inverse]
+
+
+def _bisect(centers: np.ndarray, face_indices: np.ndarray, max_faces: int) -> List[np.ndarray]:
+    # Recursively split at the median along the longest axis of the bounding box
+    if face_indices.shape[0] <= max_faces:
+        return [face_indices]
+    points = centers[face_indices]
+    axis = np.argmax(points.max(axis=0) - points.min(axis=0))
+    order = np.argsort(points[:, axis], kind='stable')
+    half = face_indices.shape[0] // 2
+    return _bisect(centers, face_indices[order[:half]], max_faces) + _bisect(centers, face_indices[order[half:]], max_faces)
+
+
+def split_mesh(
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    max_faces: int,
+    num_chunks: Optional[int] = None,
+) -> List[np.ndarray]:
+    """
+    Split the faces of a mesh into chunks that can be charted independently.
+
+    The mesh is split into its connected components, and components with more than `max_faces`
+    faces are split further into spatial clusters by recursive median bisection. The pieces are
+    then grouped into chunks: into `num_chunks` chunks of balanced face count if given, or else in
+    order into chunks of at most `max_faces` faces, which does not depend on the number of workers.
+
+    Args:
+        vertices (np.ndarray): [V x 3] vertices.
+        faces (np.ndarray): [F x 3] faces.
+        max_faces (int): Maximum number of faces of a piece.
+        num_chunks (int): Number of chunks to balance the pieces over.
+
+    Returns:
+        (List[np.ndarray]): The face indices of every non-empty chunk.
+    """
+    labels = face_components(faces, vertices.shape[0])
+    order = np.argsort(labels, kind='stable')
+    splits = np.cumsum(np.bincount(labels))[:-1]
+    centers = vertices[faces].mean(axis=1)
+    pieces = []
+    for component in np.split(order, splits):
+        pieces.extend(_bisect(centers, component, max_faces))
+
+    if num_chunks is not None:
+        # Largest pieces first, each to the currently smallest chunk
+        chunks = [[] for _ in range(num_chunks)]
+        sizes = np.zeros(num_chunks, dtype=np.int64)
+        for i in sorted(range(len(pieces)), key=lambda i: -pieces[i].shape[0]):
+            j = np.argmin(sizes)
+            chunks[j].append(pieces[i])
+            sizes[j] += pieces[i].shape[0]
+    else:
+        chunks = [[]]
+        size = 0
+        for piece in pieces:
+            if size + piece.shape[0] > max_faces and size > 0:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(piece)
+            size += piece.shape[0]
+    return [np.sort(np.concatenate(chunk)) for chunk in chunks if len(chunk) > 0]
+
+
+def _chart_chunk(vertices: np.ndarray, faces: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Chart a chunk with xatlas. Returns the vertex mapping, faces and UVs of the chunk, with the
+    UVs in world units so that the charts of all chunks share one scale.
+    """
+    atlas = xatlas.Atlas()
+    atlas.add_mesh(vertices, faces)
+    atlas.generate()
+    vmapping, indices, uvs = atlas.get_mesh(0)
+    uvs = uvs * np.array([atlas.width, atlas.height], dtype=np.float32) / atlas.texels_per_unit
+    return vmapping, indices, uvs
+
+
+def _chart_chunk_star(args):
+    return _chart_chunk(*args)
+
+
+def _process_context() -> multiprocessing.context.BaseContext:
+    # Forking copies the locks held by the other threads of this process (the job queue, the web
+    # server), which can deadlock the child. Workers are started from a clean server process instead,
+    # which imports this module once so that every worker starts quickly.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def parametrize_parallel(
+    vertices: np.ndarray,
+    faces: np.ndarray,
+    num_workers: Optional[int] = None,
+    max_chunk_faces: int = 50000,
+    deterministic: bool = True,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parametrize a mesh with xatlas, charting chunks of it in a process pool.
+
+    The mesh is split by `split_mesh`, every chunk is charted on its own, and the charts of all
+    chunks are packed into one atlas by xatlas. Meshes that fit in one chunk are parametrized with
+    a single `xatlas.parametrize` call.
+
+    Args:
+        vertices (np.ndarray): [V x 3] vertices.
+        faces (np.ndarray): [F x 3] faces.
+        num_workers (int): Number of worker processes, all CPUs if None. Chunks are charted in this
+            process if 1.
+        max_chunk_faces (int): Maximum number of faces of a connected piece before it is split spatially.
+        deterministic (bool): Whether to chunk the mesh independently of `num_workers`, so that the
+            atlas is the same on every machine. Otherwise the pieces are balanced over the workers.
+
+    Returns:
+        (np.ndarray): [V' x 3] vertices, split along the seams.
+        (np.ndarray): [F x 3] faces.
+        (np.ndarray): [V' x 2] UVs.
+    """
+    vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+    faces = np.ascontiguousarray(faces, dtype=np.uint32)
+    num_workers = num_workers or os.cpu_count() or 1
+    if faces.shape[0] <= max_chunk_faces:
+        vmapping, indices, uvs = xatlas.parametrize(vertices, faces)
+        return vertices[vmapping], indices, uvs
+
+    chunks = split_mesh(vertices, faces, max_chunk_faces, num_chunks=None if deterministic else num_workers)
+    tasks = []
+    chunk_vertices = []
+    for chunk in chunks:
+        vertex_ids, chunk_faces = np.unique(faces[chunk], return_inverse=True)
+        chunk_vertices.append(vertex_ids)
+        tasks.append((vertices[vertex_ids], chunk_faces.reshape(-1, 3).astype(np.uint32)))
+
+    if num_workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(num_workers, len(tasks)), mp_context=_process_context()) as executor:
+            charts = list(executor.map(_chart_chunk_star, tasks))
+    else:
+        charts = [_chart_chunk(*task) for task in tasks]
+
+    # Pack the charts of all chunks into one atlas
+    atlas = xatlas.Atlas()
+    for _, indices, uvs in charts:
+        atlas.add_uv_mesh(np.ascontiguousarray(uvs, dtype=np.float32), np.ascontiguousarray(indices, dtype=np.uint32))
+    atlas.generate()
+
+    out_vertices, out_faces, out_uvs = [], [], []
+    offset = 0
+    for i, (vertex_ids, (chart_vmapping, _, _)) in enumerate(zip(chunk_vertices, charts)):
+        vmapping, indices, uvs = atlas.get_mesh(i)
+        out_vertices.append(vertices[vertex_ids[chart_vmapping[vmapping]]])
+        out_faces.append(indices.astype(np.int64) + offset)
+        out_uvs.append(uvs)
+        offset += vmapping.shape[0]
+    return np.concatenate(out_vertices), np.concatenate(out_faces).astype(np.uint32), np.concatenate(out_uvs)
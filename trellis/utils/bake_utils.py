@@ -0,0 +1,303 @@
+from typing import *
+import os
+import shutil
+import tempfile
+import numpy as np
+import torch
+import torch.nn.functional as F
+from easydict import EasyDict as edict
+from tqdm import tqdm
+
+
+__all__ = [
+    'bilinear_texel_weights',
+    'conjugate_gradient',
+    'TextureNormalEquations',
+    'ViewRasterStore',
+]
+
+
+# Offsets (dy, dx) between the texels of a bilinear footprint, in the order of the stencil
+STENCIL = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+NEIGHBORS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def bilinear_texel_weights(uv: torch.Tensor, texture_size: int) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    The four texels and bilinear weights that a lookup at `uv` blends, with the texel centers
+    and clamped borders of `nvdiffrast.torch.texture`.
+
+    Args:
+        uv (torch.Tensor): [N x 2] texture coordinates in [0, 1].
+        texture_size (int): Size of the texture.
+
+    Returns:
+        (torch.Tensor): [N x 4] row of the texels.
+        (torch.Tensor): [N x 4] column of the texels.
+        (torch.Tensor): [N x 4] bilinear weights.
+    """
+    xy = uv * texture_size - 0.5
+    xy0 = xy.floor()
+    f = xy - xy0
+    xy0 = xy0.long()
+    x = torch.stack([xy0[:, 0], xy0[:, 0] + 1, xy0[:, 0], xy0[:, 0] + 1], dim=1).clamp_(0, texture_size - 1)
+    y = torch.stack([xy0[:, 1], xy0[:, 1], xy0[:, 1] + 1, xy0[:, 1] + 1], dim=1).clamp_(0, texture_size - 1)
+    fx, fy = f[:, 0:1], f[:, 1:2]
+    w = torch.cat([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy], dim=1)
+    return y, x, w
+
+
+def conjugate_gradient(
+    matvec: Callable[[torch.Tensor], torch.Tensor],
+    b: torch.Tensor,
+    x0: Optional[torch.Tensor] = None,
+    precond: Optional[torch.Tensor] = None,
+    tol: float = 1e-4,
+    max_iters: int = 500,
+    check_every: int = 10,
+    verbose: bool = False,
+) -> Tuple[torch.Tensor, edict]:
+    """
+    Solve the symmetric positive definite systems A x = b for every channel of b at once
+    with (Jacobi preconditioned) conjugate gradients.
+
+    Args:
+        matvec (Callable): Applies A to a [... x C] tensor, channel by channel.
+        b (torch.Tensor): [... x C] right-hand sides.
+        x0 (torch.Tensor): [... x C] initial guess, zeros if None.
+        precond (torch.Tensor): [...] diagonal of A, used as preconditioner if given.
+        tol (float): Stop once the residual of every channel is below `tol` times its right-hand side.
+        max_iters (int): Maximum number of iterations.
+        check_every (int): Number of iterations between convergence checks, each of which
+            synchronizes with the device.
+        verbose (bool): Whether to print progress.
+
+    Returns:
+        (torch.Tensor): [... x C] solution.
+        (edict): Number of iterations ('iters') and the final relative residual ('residual').
+    """
+    dims = tuple(range(b.dim() - 1))
+    inv_diag = 1 / precond.unsqueeze(-1) if precond is not None else None
+    x = torch.zeros_like(b) if x0 is None else x0.clone()
+    r = b - matvec(x)
+    z = r * inv_diag if inv_diag is not None else r
+    p = z
+    rz = (r * z).sum(dim=dims)
+    b_norm = b.norm(dim=dims).clamp_min(1e-12)
+    residual = (r.norm(dim=dims) / b_norm).max().item()
+    it = 0
+    with tqdm(total=max_iters, disable=not verbose, desc='Conjugate gradient') as pbar:
+        while it < max_iters and residual > tol:
+            Ap = matvec(p)
+            alpha = rz / (p * Ap).sum(dim=dims).clamp_min(1e-30)
+            x = x + alpha * p
+            r = r - alpha * Ap
+            z = r * inv_diag if inv_diag is not None else r
+            rz_new = (r * z).sum(dim=dims)
+            p = z + (rz_new / rz.clamp_min(1e-30)) * p
+            rz = rz_new
+            it += 1
+            if it % check_every == 0 or it == max_iters:
+                residual = (r.norm(dim=dims) / b_norm).max().item()
+                pbar.set_postfix({'residual': residual})
+                pbar.update(check_every)
+    return x, edict({'iters': it, 'residual': residual})
+
+
+class TextureNormalEquations:
+    """
+    The normal equations of the least-squares texture bake
+
+        min_T  sum_p |sum_k w_pk T_k - c_p|^2 + lambda * sum_(i,j) |T_i - T_j|^2
+
+    where every observed pixel p of color c_p samples the texture bilinearly at the texels k
+    with weights w_pk, and (i, j) runs over the pairs of adjacent texels.
+
+    The data term couples a texel only with the 3 x 3 texels around it, so its matrix is kept
+    as one [S x S] image per stencil offset and observations can be added view by view with
+    scatter-adds; the memory does not depend on the number of views. The smoothness term is
+    a grid Laplacian applied on the fly. It also fills the texels that no pixel sees, and it
+    keeps the system positive definite.
+
+    Args:
+        texture_size (int): Size of the texture.
+        channels (int): Number of channels of the texture.
+        device (torch.device): Device of the accumulators.
+    """
+    def __init__(self, texture_size: int, channels: int = 3, device: torch.device = 'cuda'):
+        self.texture_size = texture_size
+        self.channels = channels
+        self.stencil = torch.zeros(len(STENCIL), texture_size * texture_size, dtype=torch.float32, device=device)
+        self.rhs = torch.zeros(texture_size * texture_size, channels, dtype=torch.float32, device=device)
+        self.num_pixels = 0
+
+    @property
+    def device(self) -> torch.device:
+        return self.rhs.device
+
+    @torch.no_grad()
+    def add(self, uv: torch.Tensor, colors: torch.Tensor) -> None:
+        """
+        Add observed pixels.
+
+        Args:
+            uv (torch.Tensor): [N x 2] texture coordinates of the pixels.
+            colors (torch.Tensor): [N x C] colors of the pixels.
+        """
+        S = self.texture_size
+        y, x, w = bilinear_texel_weights(uv.float(), S)
+        idx = y * S + x
+        self.rhs.index_add_(0, idx.reshape(-1), (w[:, :, None] * colors.float()[:, None, :]).reshape(-1, self.channels))
+        stencil = self.stencil.view(-1)
+        for a in range(4):
+            for b in range(4):
+                d = (y[:, b] - y[:, a] + 1) * 3 + (x[:, b] - x[:, a] + 1)
+                stencil.index_add_(0, d * S * S + idx[:, a], w[:, a] * w[:, b])
+        self.num_pixels += uv.shape[0]
+
+    def _shift(self, t: torch.Tensor, dy: int, dx: int) -> torch.Tensor:
+        # t[i + dy, j + dx] at [i, j], zero outside of the texture
+        S = self.texture_size
+        t = F.pad(t, (0, 0, 1, 1, 1, 1))
+        return t[1 + dy:1 + dy + S, 1 + dx:1 + dx + S]
+
+    def data_matvec(self, x: torch.Tensor) -> torch.Tensor:
+        S = self.texture_size
+        stencil = self.stencil.view(len(STENCIL), S, S, 1)
+        out = torch.zeros_like(x)
+        for i, (dy, dx) in enumerate(STENCIL):
+            out += stencil[i] * self._shift(x, dy, dx)
+        return out
+
+    def laplacian_degree(self) -> torch.Tensor:
+        ones = torch.ones(self.texture_size, self.texture_size, 1, device=self.device)
+        return sum(self._shift(ones, dy, dx) for dy, dx in NEIGHBORS)
+
+    def laplacian_matvec(self, x: torch.Tensor, degree: Optional[torch.Tensor] = None) -> torch.Tensor:
+        out = x * (self.laplacian_degree() if degree is None else degree)
+        for dy, dx in NEIGHBORS:
+            out -= self._shift(x, dy, dx)
+        return out
+
+    @torch.no_grad()
+    def solve(
+        self,
+        lambda_smooth: float,
+        tol: float = 1e-4,
+        max_iters: int = 500,
+        check_every: int = 10,
+        verbose: bool = False,
+    ) -> Tuple[torch.Tensor, edict]:
+        """
+        Solve for the texture with conjugate gradients, starting from the weighted average
+        of the colors at every texel.
+
+        Args:
+            lambda_smooth (float): Weight of the smoothness term.
+            tol (float): Relative residual at which to stop.
+            max_iters (int): Maximum number of iterations.
+            check_every (int): Number of iterations between convergence checks.
+            verbose (bool): Whether to print progress.
+
+        Returns:
+            (torch.Tensor): [S x S x C] texture, row i at v = (i + 0.5) / S.
+            (edict): Number of iterations ('iters'), final relative residual ('residual') and
+                the fraction of texels seen by any pixel ('coverage').
+        """
+        S = self.texture_size
+        b = self.rhs.view(S, S, self.channels)
+        center = self.stencil[STENCIL.index((0, 0))].view(S, S)
+        degree = self.laplacian_degree()
+        diag = center + lambda_smooth * degree[..., 0]
+        # Summed over the stencil, the matrix holds the total bilinear weight of each texel
+        weight = self.stencil.sum(dim=0).view(S, S, 1)
+        observed = weight > 0
+        x0 = torch.where(observed, b / weight.clamp_min(1e-12), torch.zeros_like(b))
+
+        def matvec(x):
+            return self.data_matvec(x) + lambda_smooth * self.laplacian_matvec(x, degree)
+
+        texture, stats = conjugate_gradient(
+            matvec, b, x0=x0, precond=diag, tol=tol, max_iters=max_iters, check_every=check_every, verbose=verbose
+        )
+        stats.coverage = observed.float().mean().item()
+        return texture, stats
+
+
+class ViewRasterStore:
+    """
+    The rasterized pixels of the baking views: texture coordinates, their screen-space
+    derivatives and the observed colors of the pixels the mesh covers in every view.
+
+    Views are kept on the device until `memory_budget` bytes are used. Further views are kept
+    in host memory, or, if `cache_dir` is given, in memory-mapped files under it that are
+    deleted by `close`. Derivatives are stored in half precision and colors as uint8.
+
+    Args:
+        memory_budget (int): Bytes of device memory to use.
+        cache_dir (str): Directory to spill the views that do not fit in the budget to.
+        device (torch.device): Device of the views returned by `gather`.
+    """
+    def __init__(self, memory_budget: int, cache_dir: Optional[str] = None, device: torch.device = 'cuda'):
+        self.memory_budget = memory_budget
+        self.device = torch.device(device)
+        self.cache_dir = tempfile.mkdtemp(prefix='trellis_bake_', dir=cache_dir) if cache_dir is not None else None
+        self.views = []
+        self.nbytes = {'device': 0, 'host': 0, 'disk': 0}
+
+    def __len__(self) -> int:
+        return len(self.views)
+
+    def add(self, uv: torch.Tensor, uv_dr: torch.Tensor, colors: torch.Tensor) -> None:
+        """
+        Add a view.
+
+        Args:
+            uv (torch.Tensor): [N x 2] texture coordinates of the covered pixels.
+            uv_dr (torch.Tensor): [N x 4] screen-space derivatives of the texture coordinates.
+            colors (torch.Tensor): [N x 3] uint8 observed colors.
+        """
+        view = [uv.float(), uv_dr.half(), colors.to(torch.uint8)]
+        nbytes = sum(t.numel() * t.element_size() for t in view)
+        if self.nbytes['device'] + nbytes <= self.memory_budget:
+            view = [t.to(self.device) for t in view]
+            self.nbytes['device'] += nbytes
+        elif self.cache_dir is not None:
+            paths = [os.path.join(self.cache_dir, f'{len(self.views)}_{name}.npy') for name in ['uv', 'uv_dr', 'colors']]
+            for path, t in zip(paths, view):
+                np.save(path, t.cpu().numpy())
+            view = [np.load(path, mmap_mode='r') for path in paths]
+            self.nbytes['disk'] += nbytes
+        else:
+            view = [t.cpu() for t in view]
+            if torch.cuda.is_available():
+                view = [t.pin_memory() for t in view]
+            self.nbytes['host'] += nbytes
+        self.views.append(view)
+
+    def gather(self, indices: Sequence[int]) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        The pixels of the views at `indices`, concatenated into a single [1 x N x 1] image.
+
+        Returns:
+            (torch.Tensor): [1 x N x 1 x 2] texture coordinates.
+            (torch.Tensor): [1 x N x 1 x 4] derivatives of the texture coordinates.
+            (torch.Tensor): [1 x N x 1 x 3] colors in [0, 1].
+        """
+        parts = [[], [], []]
+        for i in indices:
+            for part, t in zip(parts, self.views[i]):
+                if isinstance(t, np.ndarray):
+                    t = torch.from_numpy(np.array(t))
+                part.append(t.to(self.device, non_blocking=True))
+        uv, uv_dr, colors = [torch.cat(part) for part in parts]
+        return uv.view(1, -1, 1, 2), uv_dr.float().view(1, -1, 1, 4), (colors.float() / 255).view(1, -1, 1, 3)
+
+    def close(self) -> None:
+        """
+        Drop all views and delete the spilled files.
+        """
+        self.views = []
+        if self.cache_dir is not None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.cache_dir = None
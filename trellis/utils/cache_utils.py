@@ -0,0 +1,179 @@
+from typing import *
+import os
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+import numpy as np
+import torch
+from PIL import Image
+
+
+def hash_bytes(*chunks: bytes) -> str:
+    """
+    Content hash of a sequence of byte strings.
+    """
+    h = hashlib.sha1()
+    for chunk in chunks:
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_image(image: Image.Image) -> str:
+    """
+    Content hash of a PIL image, covering its mode, size and pixel data.
+    """
+    return hash_bytes(image.mode.encode(), str(image.size).encode(), image.tobytes())
+
+
+def hash_array(array: Union[np.ndarray, torch.Tensor]) -> str:
+    """
+    Content hash of an array, covering its dtype, shape and data.
+    """
+    if isinstance(array, torch.Tensor):
+        array = array.detach().cpu().numpy()
+    array = np.ascontiguousarray(array)
+    return hash_bytes(str(array.dtype).encode(), str(array.shape).encode(), array.tobytes())
+
+
+def _nbytes(value: Union[np.ndarray, torch.Tensor]) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    return value.nbytes
+
+
+class ArrayCache:
+    """
+    Content-addressed LRU cache of named arrays.
+
+    Each entry is a dict of numpy arrays or torch tensors. The in-memory tier is
+    bounded by the total number of bytes it holds; the least recently used entries
+    are evicted first. An optional on-disk tier stores every entry as a directory of
+    `.npy` files, so entries survive eviction and process restarts.
+
+    Hits and misses are also counted per namespace, the part of the key before its last
+    underscore (e.g. 'preprocess' for 'preprocess_<hash>').
+
+    Args:
+        max_bytes (int): Byte budget of the in-memory tier.
+        cache_dir (str): Directory of the on-disk tier. Disabled if None.
+    """
+    def __init__(self, max_bytes: int = 1 << 30, cache_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.num_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._namespace_stats = defaultdict(lambda: {'hits': 0, 'disk_hits': 0, 'misses': 0})
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        path = self._disk_path(key)
+        return key in self._entries or (path is not None and os.path.isdir(path))
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, key)
+
+    def _load_disk(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._disk_path(key)
+        if path is None or not os.path.isdir(path):
+            return None
+        return {
+            name[:-len('.npy')]: np.load(os.path.join(path, name))
+            for name in os.listdir(path) if name.endswith('.npy')
+        }
+
+    def _save_disk(self, key: str, value: Dict[str, Union[np.ndarray, torch.Tensor]]) -> None:
+        path = self._disk_path(key)
+        if path is None:
+            return
+        tmp_path = f'{path}.tmp{threading.get_ident()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in value.items():
+            if isinstance(array, torch.Tensor):
+                array = array.detach().cpu().numpy()
+            np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another writer got there first; its entry has the same content.
+            for name in os.listdir(tmp_path):
+                os.remove(os.path.join(tmp_path, name))
+            os.rmdir(tmp_path)
+
+    def _insert(self, key: str, value: dict) -> None:
+        size = sum(_nbytes(v) for v in value.values())
+        if key in self._entries:
+            self.num_bytes -= self._sizes.pop(key)
+            del self._entries[key]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._sizes[key] = size
+        self.num_bytes += size
+        while self.num_bytes > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self.num_bytes -= self._sizes.pop(old_key)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Union[np.ndarray, torch.Tensor]]]:
+        """
+        Look up an entry, promoting it to most recently used.
+        Entries found only on disk are loaded back into memory as numpy arrays.
+        """
+        namespace = key.rsplit('_', 1)[0]
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._namespace_stats[namespace]['hits'] += 1
+                return self._entries[key]
+        value = self._load_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self._namespace_stats[namespace]['misses'] += 1
+                return None
+            self.disk_hits += 1
+            self._namespace_stats[namespace]['disk_hits'] += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key: str, value: Dict[str, Union[np.ndarray, torch.Tensor]]) -> None:
+        """
+        Insert an entry into the in-memory tier and, if enabled, the on-disk tier.
+        """
+        with self._lock:
+            self._insert(key, value)
+        self._save_disk(key, value)
+
+    def clear(self) -> None:
+        """
+        Drop the in-memory tier. The on-disk tier is left untouched.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.num_bytes = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.num_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'namespaces': {k: dict(v) for k, v in self._namespace_stats.items()},
+        }
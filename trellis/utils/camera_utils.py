@@ -0,0 +1,121 @@
+from typing import *
+import numpy as np
+import torch
+import utils3d
+from .random_utils import sphere_hammersley_points
+
+
+__all__ = [
+    'yaw_pitch_to_origins',
+    'yaw_pitch_r_fov_to_cameras',
+    'orbit_cameras',
+    'hammersley_cameras',
+    'snapshot_cameras',
+]
+
+
+ArrayLike = Union[float, Sequence[float], np.ndarray, torch.Tensor]
+
+
+def _as_batch(value: ArrayLike, device: torch.device) -> torch.Tensor:
+    if isinstance(value, torch.Tensor):
+        return value.to(device=device, dtype=torch.float32).reshape(-1)
+    # Host values are converted on the host and uploaded in one copy
+    return torch.from_numpy(np.asarray(value, dtype=np.float32).reshape(-1)).to(device)
+
+
+def yaw_pitch_to_origins(yaws: torch.Tensor, pitchs: torch.Tensor, rs: torch.Tensor) -> torch.Tensor:
+    """
+    Positions of cameras on spheres around the origin, z up.
+
+    Args:
+        yaws (torch.Tensor): [N] yaws in radians.
+        pitchs (torch.Tensor): [N] pitches in radians.
+        rs (torch.Tensor): [N] distances to the origin.
+
+    Returns:
+        (torch.Tensor): [N x 3] camera positions.
+    """
+    return torch.stack([
+        torch.sin(yaws) * torch.cos(pitchs),
+        torch.cos(yaws) * torch.cos(pitchs),
+        torch.sin(pitchs),
+    ], dim=-1) * rs[:, None]
+
+
+def yaw_pitch_r_fov_to_cameras(
+    yaws: ArrayLike,
+    pitchs: ArrayLike,
+    rs: ArrayLike,
+    fovs: ArrayLike,
+    device: torch.device = 'cuda',
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Cameras looking at the origin from the given directions and distances, built in one batch.
+    Scalars are broadcast over the batch.
+
+    Args:
+        yaws (ArrayLike): Yaws in radians.
+        pitchs (ArrayLike): Pitches in radians.
+        rs (ArrayLike): Distances to the origin.
+        fovs (ArrayLike): Fields of view in degrees.
+        device (torch.device): Device of the cameras.
+
+    Returns:
+        (torch.Tensor): [N x 4 x 4] OpenCV extrinsics.
+        (torch.Tensor): [N x 3 x 3] normalized intrinsics.
+    """
+    yaws, pitchs, rs, fovs = torch.broadcast_tensors(*[_as_batch(x, device) for x in (yaws, pitchs, rs, fovs)])
+    origs = yaw_pitch_to_origins(yaws, pitchs, rs)
+    look_at = torch.zeros_like(origs)
+    up = torch.tensor([0, 0, 1], dtype=torch.float32, device=origs.device).expand_as(origs)
+    extrinsics = utils3d.torch.extrinsics_look_at(origs, look_at, up)
+    fovs = torch.deg2rad(fovs)
+    intrinsics = utils3d.torch.intrinsics_from_fov_xy(fovs, fovs)
+    return extrinsics, intrinsics
+
+
+def orbit_cameras(
+    num_frames: int,
+    r: float = 2,
+    fov: float = 40,
+    pitch_offset: float = 0.25,
+    pitch_amplitude: float = 0.5,
+    device: torch.device = 'cuda',
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Cameras of a turntable video: one turn of yaw, with the pitch swinging once around `pitch_offset`.
+    """
+    t = np.linspace(0, 2 * 3.1415, num_frames, dtype=np.float32)
+    return yaw_pitch_r_fov_to_cameras(t, pitch_offset + pitch_amplitude * np.sin(t), r, fov, device)
+
+
+def hammersley_cameras(
+    num_views: int,
+    r: float = 2,
+    fov: float = 40,
+    indices: Optional[Sequence[int]] = None,
+    device: torch.device = 'cuda',
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Cameras with directions from a spherical Hammersley sequence of `num_views` points, e.g. the
+    views textures are baked from.
+
+    Args:
+        indices (Sequence[int]): The points of the sequence to build cameras for, in order. All if None.
+    """
+    yaw_pitch = sphere_hammersley_points(np.arange(num_views) if indices is None else indices, num_views)
+    return yaw_pitch_r_fov_to_cameras(yaw_pitch[:, 0], yaw_pitch[:, 1], r, fov, device)
+
+
+def snapshot_cameras(
+    offset: Tuple[float, float] = (-16 / 180 * np.pi, 20 / 180 * np.pi),
+    r: float = 10,
+    fov: float = 8,
+    device: torch.device = 'cuda',
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Four cameras a quarter turn apart, with the yaw and pitch offset by `offset`.
+    """
+    yaws = np.array([0, np.pi / 2, np.pi, 3 * np.pi / 2]) + offset[0]
+    return yaw_pitch_r_fov_to_cameras(yaws, offset[1], r, fov, device)
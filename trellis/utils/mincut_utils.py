@@ -0,0 +1,297 @@
+from typing import *
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+from easydict import EasyDict as edict
+
+
+__all__ = [
+    'FlowGraph',
+    'MincutSolver',
+    'IgraphMincutSolver',
+    'ScipyMincutSolver',
+    'PushRelabelMincutSolver',
+    'get_mincut_solver',
+    'mincut',
+]
+
+
+class FlowGraph:
+    """
+    An undirected flow network in CSR form, built from numpy edge arrays.
+
+    Every undirected edge becomes a pair of opposite arcs with the same capacity, and
+    arcs are sorted by their tail. Capacities are quantized to integers, with the scale
+    chosen so that the total capacity at the source or at the sink is about 2^29; positive
+    capacities are kept at least 1, and capacities are clipped to 2^30, which no minimum
+    cut can contain.
+
+    Args:
+        num_nodes (int): Number of nodes, including source and sink.
+        edges (np.ndarray): [E x 2] undirected edges.
+        capacities (np.ndarray): [E] non-negative capacities of the edges.
+        source (int): The source node.
+        sink (int): The sink node.
+        max_scale (float): Upper bound of the quantization scale of the capacities.
+    """
+    def __init__(
+        self,
+        num_nodes: int,
+        edges: np.ndarray,
+        capacities: np.ndarray,
+        source: int,
+        sink: int,
+        max_scale: float = 1e6,
+    ):
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        capacities = np.asarray(capacities, dtype=np.float64).reshape(-1)
+        terminal_capacity = max(
+            capacities[(edges == source).any(axis=1)].sum(),
+            capacities[(edges == sink).any(axis=1)].sum(),
+            1e-12,
+        )
+        self.scale = min(max_scale, 2 ** 29 / terminal_capacity)
+        quantized = np.round(np.minimum(capacities * self.scale, 2 ** 30)).astype(np.int64)
+        quantized[(capacities > 0) & (quantized == 0)] = 1
+
+        E = edges.shape[0]
+        tails = np.concatenate([edges[:, 0], edges[:, 1]])
+        heads = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.argsort(tails, kind='stable')
+        inverse = np.empty_like(order)
+        inverse[order] = np.arange(2 * E)
+        rev = (np.arange(2 * E) + E) % (2 * E)
+
+        self.num_nodes = num_nodes
+        self.source = source
+        self.sink = sink
+        self.tails = tails[order]
+        self.heads = heads[order]
+        self.capacities = np.concatenate([quantized, quantized])[order]
+        self.rev = inverse[rev[order]]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(self.tails, minlength=num_nodes))])
+
+    @property
+    def num_arcs(self) -> int:
+        return self.heads.shape[0]
+
+    def expand(self, nodes: np.ndarray) -> np.ndarray:
+        """
+        The indices of all arcs out of `nodes`, grouped by node in the given order.
+        """
+        counts = self.indptr[nodes + 1] - self.indptr[nodes]
+        starts = np.repeat(self.indptr[nodes] - np.cumsum(counts) + counts, counts)
+        return starts + np.arange(counts.sum())
+
+    def reaches_sink(self, residual: np.ndarray) -> np.ndarray:
+        """
+        The nodes that can reach the sink through arcs of positive residual capacity.
+        """
+        reached = np.zeros(self.num_nodes, dtype=bool)
+        reached[self.sink] = True
+        frontier = np.array([self.sink])
+        while frontier.shape[0] > 0:
+            # An arc u -> v of the frontier node v is the reverse of the arc v -> u
+            arcs = self.expand(frontier)
+            arcs = arcs[residual[self.rev[arcs]] > 0]
+            nodes = np.unique(self.heads[arcs])
+            frontier = nodes[~reached[nodes]]
+            reached[frontier] = True
+        return reached
+
+    def sink_distances(self, residual: np.ndarray) -> np.ndarray:
+        """
+        BFS distances of all nodes to the sink in the residual network, `num_nodes` if unreachable.
+        """
+        dist = np.full(self.num_nodes, self.num_nodes, dtype=np.int64)
+        dist[self.sink] = 0
+        frontier = np.array([self.sink])
+        d = 0
+        while frontier.shape[0] > 0:
+            d += 1
+            arcs = self.expand(frontier)
+            arcs = arcs[residual[self.rev[arcs]] > 0]
+            nodes = np.unique(self.heads[arcs])
+            frontier = nodes[dist[nodes] == self.num_nodes]
+            dist[frontier] = d
+        return dist
+
+
+class MincutSolver(ABC):
+    """
+    A minimum s-t cut solver. Solvers compute a maximum flow and return the source side of
+    the cut as the nodes that cannot reach the sink in the residual network, which is the
+    largest minimum cut and the same for every maximum flow.
+    """
+    name = None
+
+    @abstractmethod
+    def __call__(self, graph: FlowGraph) -> np.ndarray:
+        """
+        Returns:
+            (np.ndarray): [num_nodes] bool mask of the source side of the cut.
+        """
+        pass
+
+
+class IgraphMincutSolver(MincutSolver):
+    """
+    Maximum flow with igraph's push-relabel implementation.
+    """
+    name = 'igraph'
+
+    def __call__(self, graph: FlowGraph) -> np.ndarray:
+        import igraph
+        g = igraph.Graph(n=graph.num_nodes, edges=np.stack([graph.tails, graph.heads], axis=1).tolist(), directed=True)
+        flow = np.asarray(g.maxflow(graph.source, graph.sink, graph.capacities.tolist()).flow, dtype=np.int64)
+        residual = graph.capacities - flow + flow[graph.rev]
+        return ~graph.reaches_sink(residual)
+
+
+class ScipyMincutSolver(MincutSolver):
+    """
+    Maximum flow with scipy.sparse.csgraph.maximum_flow.
+    """
+    name = 'scipy'
+
+    def __call__(self, graph: FlowGraph) -> np.ndarray:
+        import scipy.sparse as sparse
+        from scipy.sparse.csgraph import maximum_flow, breadth_first_order
+        n = graph.num_nodes
+        capacity = sparse.csr_matrix((graph.capacities.astype(np.int32), (graph.tails, graph.heads)), shape=(n, n))
+        flow = maximum_flow(capacity, graph.source, graph.sink).flow
+        residual = (capacity - flow).tocsr()
+        residual.data = (residual.data > 0).astype(np.int8)
+        residual.eliminate_zeros()
+        reaches_sink = np.zeros(n, dtype=bool)
+        reaches_sink[breadth_first_order(residual.T.tocsr(), graph.sink, directed=True, return_predecessors=False)] = True
+        return ~reaches_sink
+
+
+class PushRelabelMincutSolver(MincutSolver):
+    """
+    Maximum preflow with a synchronous push-relabel algorithm in numpy.
+
+    In every pulse, all active nodes push their excess along all admissible arcs at once
+    and the nodes with excess left are relabeled; distance labels are recomputed exactly
+    by a BFS from the sink every `global_relabel_interval` pulses. Only the first phase is
+    run, since the cut does not need the excess to be returned to the source.
+
+    Args:
+        global_relabel_interval (int): Number of pulses between global relabelings.
+    """
+    name = 'push_relabel'
+
+    def __init__(self, global_relabel_interval: int = 8):
+        self.global_relabel_interval = global_relabel_interval
+
+    def __call__(self, graph: FlowGraph) -> np.ndarray:
+        n, s, t = graph.num_nodes, graph.source, graph.sink
+        residual = graph.capacities.copy()
+        excess = np.zeros(n, dtype=np.int64)
+
+        # Saturate the arcs out of the source
+        arcs = graph.expand(np.array([s]))
+        np.add.at(excess, graph.heads[arcs], residual[arcs])
+        residual[graph.rev[arcs]] += residual[arcs]
+        residual[arcs] = 0
+        excess[s] = 0
+
+        pulse = 0
+        while True:
+            if pulse % self.global_relabel_interval == 0:
+                height = graph.sink_distances(residual)
+                height[s] = n
+            pulse += 1
+            active = np.nonzero((excess > 0) & (height < n))[0]
+            active = active[active != t]
+            if active.shape[0] == 0:
+                break
+
+            # Push along admissible arcs, in arc order, until the excess of each node is used up
+            arcs = graph.expand(active)
+            tails = graph.tails[arcs]
+            admissible = (residual[arcs] > 0) & (height[tails] == height[graph.heads[arcs]] + 1)
+            arcs, tails = arcs[admissible], tails[admissible]
+            r = residual[arcs]
+            cumsum = np.cumsum(r)
+            group_start = np.searchsorted(tails, tails, side='left')    # arcs are grouped by tail
+            pushed_before = cumsum - r - (cumsum[group_start] - r[group_start])
+            push = np.clip(excess[tails] - pushed_before, 0, r)
+            residual[arcs] -= push
+            residual[graph.rev[arcs]] += push
+            # Active nodes whose excess was not used up have no admissible arc left and are relabeled
+            relabel = active[excess[active] > np.bincount(tails, weights=push, minlength=n)[active]]
+            excess -= np.bincount(tails, weights=push, minlength=n).astype(np.int64)
+            excess += np.bincount(graph.heads[arcs], weights=push, minlength=n).astype(np.int64)
+
+            if relabel.shape[0] > 0:
+                arcs = graph.expand(relabel)
+                counts = graph.indptr[relabel + 1] - graph.indptr[relabel]
+                heights = np.where(residual[arcs] > 0, height[graph.heads[arcs]], n - 1)
+                min_heights = np.full(relabel.shape[0], n - 1, dtype=np.int64)
+                nonempty = counts > 0
+                if arcs.shape[0] > 0:
+                    min_heights[nonempty] = np.minimum.reduceat(heights, (np.cumsum(counts) - counts)[nonempty])
+                height[relabel] = np.maximum(height[relabel], min_heights + 1)
+
+        return ~graph.reaches_sink(residual)
+
+
+SOLVERS = {
+    'igraph': IgraphMincutSolver,
+    'scipy': ScipyMincutSolver,
+    'push_relabel': PushRelabelMincutSolver,
+}
+
+
+def get_mincut_solver(name: str = 'auto') -> MincutSolver:
+    """
+    Get a minimum cut solver by name: 'igraph', 'scipy', 'push_relabel', or 'auto' for the
+    first of them whose dependencies are installed.
+    """
+    if name == 'auto':
+        for name, module in [('igraph', 'igraph'), ('scipy', 'scipy.sparse.csgraph')]:
+            try:
+                __import__(module)
+                return SOLVERS[name]()
+            except ImportError:
+                pass
+        return PushRelabelMincutSolver()
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown mincut solver: {name}")
+    return SOLVERS[name]()
+
+
+def mincut(
+    num_nodes: int,
+    edges: np.ndarray,
+    capacities: np.ndarray,
+    source: int,
+    sink: int,
+    solver: Union[str, MincutSolver] = 'auto',
+) -> Tuple[np.ndarray, edict]:
+    """
+    Minimum s-t cut of an undirected graph.
+
+    Args:
+        num_nodes (int): Number of nodes, including source and sink.
+        edges (np.ndarray): [E x 2] undirected edges.
+        capacities (np.ndarray): [E] non-negative capacities of the edges.
+        source (int): The source node.
+        sink (int): The sink node.
+        solver (Union[str, MincutSolver]): The solver or its name, see `get_mincut_solver`.
+
+    Returns:
+        (np.ndarray): [num_nodes] bool mask of the source side of the cut.
+        (edict): Timings in seconds of building the graph ('build') and solving ('solve'),
+            and the name of the solver ('solver').
+    """
+    if isinstance(solver, str):
+        solver = get_mincut_solver(solver)
+    start = time.time()
+    graph = FlowGraph(num_nodes, edges, capacities, source, sink)
+    built = time.time()
+    source_side = solver(graph)
+    solved = time.time()
+    return source_side, edict({'solver': solver.name, 'build': built - start, 'solve': solved - built})
@@ -1,20 +1,26 @@
 from typing import *
+import time
 import numpy as np
 import torch
 import utils3d
 import nvdiffrast.torch as dr
 from tqdm import tqdm
+from easydict import EasyDict as edict
 import trimesh
 import trimesh.visual
 import xatlas
 import pyvista as pv
 from pymeshfix import _meshfix
-import igraph
 import cv2
 from PIL import Image
-from .random_utils import sphere_hammersley_sequence
-from .render_utils import render_multiview
+from .render_utils import render_multiview, iter_multiview
+from .visibility_utils import sphere_hammersley_views, face_visibility, adaptive_face_visibility, auto_visibility_resolution
+from .mincut_utils import mincut
+from .bake_utils import TextureNormalEquations, ViewRasterStore
+from .cache_utils import ArrayCache, hash_array, hash_bytes
+from .atlas_utils import parametrize_parallel
 from ..renderers import GaussianRenderer
+from ..renderers.pool import rast_context
 from ..representations import Strivec, Gaussian, MeshExtractResult
 
 
@@ -26,6 +32,10 @@ def _fill_holes(
     max_hole_nbe=32,
     resolution=128,
     num_views=500,
+    views_per_batch=16,
+    adaptive_views=False,
+    mincut_solver='auto',
+    backend='cuda',
     debug=False,
     verbose=False
 ):
@@ -39,45 +49,56 @@ def _fill_holes(
         verts (torch.Tensor): Vertices of the mesh. Shape (V, 3).
         faces (torch.Tensor): Faces of the mesh. Shape (F, 3).
         max_hole_size (float): Maximum area of a hole to fill.
-        resolution (int): Resolution of the rasterization.
-        num_views (int): Number of views to rasterize the mesh.
+        resolution (int): Resolution of the rasterization. Chosen from the face count and size of the mesh if None.
+        num_views (int): Number of views to rasterize the mesh. The maximum number if `adaptive_views`.
+        views_per_batch (int): Number of views rasterized per call.
+        adaptive_views (bool): Whether to stop adding views once the visibility of the faces converges.
+        mincut_solver (str): Max-flow solver of the mincut, see `mincut_utils.get_mincut_solver`.
+        backend (str): Rasterization backend of the visibility, see `visibility_utils.face_visibility`.
         verbose (bool): Whether to print progress.
+
+    Returns:
+        (torch.Tensor): Vertices of the processed mesh.
+        (torch.Tensor): Faces of the processed mesh.
+        (edict): Statistics of the run:
+            - 'resolution': the resolution of the rasterization.
+            - 'num_views': the number of views rasterized.
+            - 'max_views': the number of views the fixed estimation rasterizes.
+            - 'visibility_time': the time spent estimating the visibility, in seconds.
+            - 'visibility_time_saved': the estimated time the skipped views would have taken, in seconds.
+            - 'num_invisible': the number of faces seen from no view.
+            - 'num_removed': the number of faces removed by the mincut.
     """
     # Construct cameras
-    yaws = []
-    pitchs = []
-    for i in range(num_views):
-        y, p = sphere_hammersley_sequence(i, num_views)
-        yaws.append(y)
-        pitchs.append(p)
-    yaws = torch.tensor(yaws).cuda()
-    pitchs = torch.tensor(pitchs).cuda()
-    radius = 2.0
-    fov = torch.deg2rad(torch.tensor(40)).cuda()
+    fov = torch.deg2rad(torch.tensor(40, dtype=torch.float32, device=verts.device))
     projection = utils3d.torch.perspective_from_fov_xy(fov, fov, 1, 3)
-    views = []
-    for (yaw, pitch) in zip(yaws, pitchs):
-        orig = torch.tensor([
-            torch.sin(yaw) * torch.cos(pitch),
-            torch.cos(yaw) * torch.cos(pitch),
-            torch.sin(pitch),
-        ]).cuda().float() * radius
-        view = utils3d.torch.view_look_at(orig, torch.tensor([0, 0, 0]).float().cuda(), torch.tensor([0, 0, 1]).float().cuda())
-        views.append(view)
-    views = torch.stack(views, dim=0)
+    if resolution is None:
+        resolution = auto_visibility_resolution(verts, faces, radius=2.0, fov=40)
 
     # Rasterize
-    visblity = torch.zeros(faces.shape[0], dtype=torch.int32, device=verts.device)
-    rastctx = utils3d.torch.RastContext(backend='cuda')
-    for i in tqdm(range(views.shape[0]), total=views.shape[0], disable=not verbose, desc='Rasterizing'):
-        view = views[i]
-        buffers = utils3d.torch.rasterize_triangle_faces(
-            rastctx, verts[None], faces, resolution, resolution, view=view, projection=projection
+    if adaptive_views:
+        visblity, stats = adaptive_face_visibility(
+            verts, faces, projection, resolution, radius=2.0, max_views=num_views, batch_size=views_per_batch,
+            backend=backend, verbose=verbose,
         )
-        face_id = buffers['face_id'][0][buffers['mask'][0] > 0.95] - 1
-        face_id = torch.unique(face_id).long()
-        visblity[face_id] += 1
-    visblity = visblity.float() / num_views
+        if verbose:
+            tqdm.write(f'Visibility converged after {stats.num_views}/{stats.max_views} views at {resolution}px '
+                       f'in {stats.time:.2f}s, saving ~{stats.time_saved:.2f}s')
+    else:
+        start_time = time.time()
+        views = sphere_hammersley_views(num_views, radius=2.0, device=verts.device)
+        visblity = face_visibility(verts, faces, views, projection, resolution, batch_size=views_per_batch, backend=backend, verbose=verbose)
+        visblity = visblity.float() / num_views
+        stats = edict({'num_views': num_views, 'max_views': num_views, 'time': time.time() - start_time, 'time_saved': 0.0})
+    fill_stats = edict({
+        'resolution': resolution,
+        'num_views': stats.num_views,
+        'max_views': stats.max_views,
+        'visibility_time': stats.time,
+        'visibility_time_saved': stats.time_saved,
+        'num_invisible': 0,
+        'num_removed': 0,
+    })
     
     # Mincut
     ## construct outer faces
@@ -91,10 +112,11 @@ def _fill_holes(
     
     ## construct inner faces
     inner_face_indices = torch.nonzero(visblity == 0).reshape(-1)
+    fill_stats.num_invisible = inner_face_indices.shape[0]
     if verbose:
         tqdm.write(f'Found {inner_face_indices.shape[0]} invisible faces')
     if inner_face_indices.shape[0] == 0:
-        return verts, faces
+        return verts, faces, fill_stats
     
     ## Construct dual graph (faces as nodes, edges as edges)
     dual_edges, dual_edge2edge = utils3d.torch.compute_dual_graph(face2edge)
@@ -104,27 +126,26 @@ def _fill_holes(
         tqdm.write(f'Dual graph: {dual_edges.shape[0]} edges')
 
     ## solve mincut problem
-    ### construct main graph
-    g = igraph.Graph()
-    g.add_vertices(faces.shape[0])
-    g.add_edges(dual_edges.cpu().numpy())
-    g.es['weight'] = dual_edges_weights.cpu().numpy()
-    
-    ### source and target
-    g.add_vertex('s')
-    g.add_vertex('t')
-    
-    ### connect invisible faces to source
-    g.add_edges([(f, 's') for f in inner_face_indices], attributes={'weight': torch.ones(inner_face_indices.shape[0], dtype=torch.float32).cpu().numpy()})
-    
-    ### connect outer faces to target
-    g.add_edges([(f, 't') for f in outer_face_indices], attributes={'weight': torch.ones(outer_face_indices.shape[0], dtype=torch.float32).cpu().numpy()})
-                
+    ### faces are nodes 0..F-1, the source is F and the target is F+1
+    F = faces.shape[0]
+    inner = inner_face_indices.cpu().numpy()
+    outer = outer_face_indices.cpu().numpy()
+    graph_edges = np.concatenate([
+        dual_edges.cpu().numpy(),
+        np.stack([inner, np.full_like(inner, F)], axis=1),     # invisible faces to source
+        np.stack([outer, np.full_like(outer, F + 1)], axis=1), # outer faces to target
+    ], axis=0)
+    graph_weights = np.concatenate([
+        dual_edges_weights.cpu().numpy(),
+        np.ones(inner.shape[0] + outer.shape[0], dtype=np.float32),
+    ])
+
     ### solve mincut
-    cut = g.mincut('s', 't', (np.array(g.es['weight']) * 1000).tolist())
-    remove_face_indices = torch.tensor([v for v in cut.partition[0] if v < faces.shape[0]], dtype=torch.long, device=faces.device)
+    source_side, stats = mincut(F + 2, graph_edges, graph_weights, F, F + 1, solver=mincut_solver)
+    remove_face_indices = torch.from_numpy(np.nonzero(source_side[:F])[0]).to(faces.device)
     if verbose:
-        tqdm.write(f'Mincut solved, start checking the cut')
+        tqdm.write(f'Mincut solved with {stats.solver} ({graph_edges.shape[0]} edges, build {stats.build:.2f}s, '
+                   f'solve {stats.solve:.2f}s), start checking the cut')
     
     ### check if the cut is valid with each connected component
     to_remove_cc = utils3d.torch.compute_connected_components(faces[remove_face_indices])
@@ -182,19 +203,21 @@ def _fill_holes(
         mask[remove_face_indices] = 0
         faces = faces[mask]
         faces, verts = utils3d.torch.remove_unreferenced_vertices(faces, verts)
+        fill_stats.num_removed = int((~mask).sum())
         if verbose:
             tqdm.write(f'Removed {(~mask).sum()} faces by mincut')
     else:
         if verbose:
             tqdm.write(f'Removed 0 faces by mincut')
             
+    device = verts.device
     mesh = _meshfix.PyTMesh()
     mesh.load_array(verts.cpu().numpy(), faces.cpu().numpy())
     mesh.fill_small_boundaries(nbe=max_hole_nbe, refine=True)
     verts, faces = mesh.return_arrays()
-    verts, faces = torch.tensor(verts, device='cuda', dtype=torch.float32), torch.tensor(faces, device='cuda', dtype=torch.int32)
+    verts, faces = torch.tensor(verts, device=device, dtype=torch.float32), torch.tensor(faces, device=device, dtype=torch.int32)
 
-    return verts, faces
+    return verts, faces, fill_stats
 
 
 def postprocess_mesh(
@@ -205,8 +228,13 @@ def postprocess_mesh(
     fill_holes: bool = True,
     fill_holes_max_hole_size: float = 0.04,
     fill_holes_max_hole_nbe: int = 32,
-    fill_holes_resolution: int = 1024,
+    fill_holes_resolution: Optional[int] = 1024,
     fill_holes_num_views: int = 1000,
+    fill_holes_adaptive_views: bool = False,
+    fill_holes_mincut_solver: str = 'auto',
+    fill_holes_backend: Literal['auto', 'cuda', 'torch', 'numpy'] = 'auto',
+    device: Optional[torch.device] = None,
+    return_stats: bool = False,
     debug: bool = False,
     verbose: bool = False,
 ):
@@ -221,10 +249,24 @@ def postprocess_mesh(
         fill_holes (bool): Whether to fill holes in the mesh.
         fill_holes_max_hole_size (float): Maximum area of a hole to fill.
         fill_holes_max_hole_nbe (int): Maximum number of boundary edges of a hole to fill.
-        fill_holes_resolution (int): Resolution of the rasterization.
-        fill_holes_num_views (int): Number of views to rasterize the mesh.
+        fill_holes_resolution (int): Resolution of the rasterization. Chosen from the mesh if None.
+        fill_holes_num_views (int): Number of views to rasterize the mesh. The maximum number if `fill_holes_adaptive_views`.
+        fill_holes_adaptive_views (bool): Whether to stop adding views once the visibility of the faces converges.
+        fill_holes_mincut_solver (str): Max-flow solver of the mincut: 'igraph', 'scipy', 'push_relabel' or 'auto'.
+        fill_holes_backend (str): Rasterization backend of the visibility: 'cuda' for nvdiffrast, 'torch' for the
+            PyTorch rasterizer, 'numpy' for the reference rasterizer, or 'auto' for 'cuda' on CUDA devices and
+            'torch' on others.
+        device (torch.device): Device to fill the holes on, CUDA if available if None.
+        return_stats (bool): Whether to also return the statistics of the postprocessing.
         verbose (bool): Whether to print progress.
+
+    Returns:
+        (np.array): Vertices of the processed mesh.
+        (np.array): Faces of the processed mesh.
+        (edict): If `return_stats`, statistics of the postprocessing:
+            - 'fill_holes': the statistics of the hole filling, see `_fill_holes`, None if skipped.
     """
+    stats = edict({'fill_holes': None})
 
     if verbose:
         tqdm.write(f'Before postprocess: {vertices.shape[0]} vertices, {faces.shape[0]} faces')
@@ -239,13 +281,20 @@ def postprocess_mesh(
 
     # Remove invisible faces
     if fill_holes:
-        vertices, faces = torch.tensor(vertices).cuda(), torch.tensor(faces.astype(np.int32)).cuda()
-        vertices, faces = _fill_holes(
+        if device is None:
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if fill_holes_backend == 'auto':
+            fill_holes_backend = 'cuda' if torch.device(device).type == 'cuda' else 'torch'
+        vertices, faces = torch.tensor(vertices, device=device), torch.tensor(faces.astype(np.int32), device=device)
+        vertices, faces, stats.fill_holes = _fill_holes(
             vertices, faces,
             max_hole_size=fill_holes_max_hole_size,
             max_hole_nbe=fill_holes_max_hole_nbe,
             resolution=fill_holes_resolution,
             num_views=fill_holes_num_views,
+            adaptive_views=fill_holes_adaptive_views,
+            mincut_solver=fill_holes_mincut_solver,
+            backend=fill_holes_backend,
             debug=debug,
             verbose=verbose,
         )
@@ -253,17 +302,33 @@ def postprocess_mesh(
         if verbose:
             tqdm.write(f'After remove invisible faces: {vertices.shape[0]} vertices, {faces.shape[0]} faces')
 
+    if return_stats:
+        return vertices, faces, stats
     return vertices, faces
 
 
-def parametrize_mesh(vertices: np.array, faces: np.array):
+def parametrize_mesh(
+    vertices: np.array,
+    faces: np.array,
+    num_workers: Optional[int] = 1,
+    max_chunk_faces: int = 50000,
+    deterministic: bool = True,
+):
     """
     Parametrize a mesh to a texture space, using xatlas.
 
     Args:
         vertices (np.array): Vertices of the mesh. Shape (V, 3).
         faces (np.array): Faces of the mesh. Shape (F, 3).
+        num_workers (int): Number of processes to chart the mesh with, all CPUs if None. With more than one,
+            meshes larger than `max_chunk_faces` are charted in chunks, see `atlas_utils.parametrize_parallel`.
+        max_chunk_faces (int): Maximum number of faces of a chunk.
+        deterministic (bool): Whether the chunks, and so the atlas, are independent of the number of workers.
     """
+    if num_workers != 1:
+        return parametrize_parallel(
+            vertices, faces, num_workers=num_workers, max_chunk_faces=max_chunk_faces, deterministic=deterministic
+        )
 
     vmapping, indices, uvs = xatlas.parametrize(vertices, faces)
 
@@ -273,6 +338,85 @@ def parametrize_mesh(vertices: np.array, faces: np.array):
     return vertices, faces, uvs
 
 
+def _optimize_texture(
+    texture_size: int,
+    num_views: int,
+    fetch: Callable[[np.ndarray], Tuple[torch.Tensor, torch.Tensor, torch.Tensor, Optional[torch.Tensor]]],
+    lambda_tv: float,
+    num_steps: int,
+    views_per_step: int,
+    sync_every: int,
+    early_stop_patience: int,
+    early_stop_tol: float,
+    verbose: bool,
+) -> torch.Tensor:
+    """
+    The Adam optimization of 'opt' texture baking. `fetch` returns the texture coordinates,
+    their derivatives, the observed colors and the mask (None if all pixels count) of the
+    given views, as images for `dr.texture`. Returns the [1 x S x S x 3] texture.
+    """
+    texture = torch.nn.Parameter(torch.zeros((1, texture_size, texture_size, 3), dtype=torch.float32).cuda())
+    optimizer = torch.optim.Adam([texture], betas=(0.5, 0.9), lr=1e-2)
+
+    def exp_anealing(optimizer, step, total_steps, start_lr, end_lr):
+        return start_lr * (end_lr / start_lr) ** (step / total_steps)
+
+    def cosine_anealing(optimizer, step, total_steps, start_lr, end_lr):
+        return end_lr + 0.5 * (start_lr - end_lr) * (1 + np.cos(np.pi * step / total_steps))
+
+    def tv_loss(texture):
+        return torch.nn.functional.l1_loss(texture[:, :-1, :, :], texture[:, 1:, :, :]) + \
+               torch.nn.functional.l1_loss(texture[:, :, :-1, :], texture[:, :, 1:, :])
+
+    total_steps = num_steps
+    views_per_step = min(views_per_step, num_views)
+    loss_sum = torch.zeros((), dtype=torch.float32, device=texture.device)
+    best_loss, bad_reads = float('inf'), 0
+    with tqdm(total=total_steps, disable=not verbose, desc='Texture baking (opt): optimizing') as pbar:
+        for step in range(total_steps):
+            optimizer.zero_grad()
+            uv, uv_dr, observation, mask = fetch(np.random.choice(num_views, views_per_step, replace=False))
+            render = dr.texture(texture.expand(uv.shape[0], -1, -1, -1), uv, uv_dr)
+            if mask is not None:
+                render, observation = render[mask], observation[mask]
+            loss = torch.nn.functional.l1_loss(render, observation)
+            if lambda_tv > 0:
+                loss += lambda_tv * tv_loss(texture)
+            loss.backward()
+            optimizer.step()
+            # annealing
+            optimizer.param_groups[0]['lr'] = cosine_anealing(optimizer, step, total_steps, 1e-2, 1e-5)
+            loss_sum += loss.detach()
+            if (step + 1) % sync_every == 0 or step == total_steps - 1:
+                # Reading the loss synchronizes with the device, so it is only done every `sync_every` steps
+                mean_loss = loss_sum.item() / (step % sync_every + 1)
+                loss_sum.zero_()
+                pbar.set_postfix({'loss': mean_loss})
+                pbar.update(step % sync_every + 1)
+                if early_stop_patience > 0:
+                    if mean_loss < best_loss * (1 - early_stop_tol):
+                        best_loss, bad_reads = mean_loss, 0
+                    else:
+                        bad_reads += 1
+                        if bad_reads >= early_stop_patience:
+                            if verbose:
+                                tqdm.write(f'Texture baking (opt): loss plateaued at {mean_loss:.4f}, stopping after {step + 1} steps')
+                            break
+    return texture
+
+
+def _finalize_texture(texture: torch.Tensor, rastctx, faces: torch.Tensor, uvs: torch.Tensor, texture_size: int) -> np.ndarray:
+    """
+    Convert a [S x S x 3] texture with rows along v to a uint8 image, inpainting the texels
+    outside of the UV charts.
+    """
+    texture = np.clip(texture.flip(0).detach().cpu().numpy() * 255, 0, 255).astype(np.uint8)
+    mask = 1 - utils3d.torch.rasterize_triangle_faces(
+        rastctx, (uvs * 2 - 1)[None], faces, texture_size, texture_size
+    )['mask'][0].detach().cpu().numpy().astype(np.uint8)
+    return cv2.inpaint(texture, mask, 3, cv2.INPAINT_TELEA)
+
+
 def bake_texture(
     vertices: np.array,
     faces: np.array,
@@ -284,12 +428,17 @@ def bake_texture(
     texture_size: int = 2048,
     near: float = 0.1,
     far: float = 10.0,
-    mode: Literal['fast', 'opt'] = 'opt',
+    mode: Literal['fast', 'opt', 'ls'] = 'opt',
     lambda_tv: float = 1e-2,
+    num_steps: int = 2500,
+    views_per_step: int = 1,
+    sync_every: int = 50,
+    early_stop_patience: int = 0,
+    early_stop_tol: float = 1e-3,
     verbose: bool = False,
 ):
     """
-    Bake texture to a mesh from multiple observations.
+    Bake texture to a mesh from multiple observations. Rasterizes with nvdiffrast and needs CUDA.
 
     Args:
         vertices (np.array): Vertices of the mesh. Shape (V, 3).
@@ -302,8 +451,18 @@ def bake_texture(
         texture_size (int): Size of the texture.
         near (float): Near plane of the camera.
         far (float): Far plane of the camera.
-        mode (Literal['fast', 'opt']): Mode of texture baking.
-        lambda_tv (float): Weight of total variation loss in optimization.
+        mode (Literal['fast', 'opt', 'ls']): Mode of texture baking.
+            'fast': average the colors of the pixels that look up each texel.
+            'opt': optimize the texture to reproduce the observations with Adam.
+            'ls': solve the least-squares version of 'opt' in closed form with conjugate gradients.
+        lambda_tv (float): Weight of total variation loss in optimization. In 'ls' mode, the weight of
+            a quadratic smoothness term, relative to the data term as in 'opt'.
+        num_steps (int): Number of optimization steps in 'opt' mode.
+        views_per_step (int): Number of random views whose loss is averaged in each step of 'opt' mode.
+        sync_every (int): Number of steps of 'opt' mode between reads of the loss on the host.
+        early_stop_patience (int): Stop 'opt' mode once the mean loss over `sync_every` steps has not improved
+            by a relative `early_stop_tol` for this many reads. Disabled if 0.
+        early_stop_tol (float): Relative improvement of the loss that resets the patience.
         verbose (bool): Whether to print progress.
     """
     vertices = torch.tensor(vertices).cuda()
@@ -314,147 +473,358 @@ def bake_texture(
     views = [utils3d.torch.extrinsics_to_view(torch.tensor(extr).cuda()) for extr in extrinsics]
     projections = [utils3d.torch.intrinsics_to_perspective(torch.tensor(intr).cuda(), near, far) for intr in intrinsics]
 
-    if mode == 'fast':
-        texture = torch.zeros((texture_size * texture_size, 3), dtype=torch.float32).cuda()
-        texture_weights = torch.zeros((texture_size * texture_size), dtype=torch.float32).cuda()
-        rastctx = utils3d.torch.RastContext(backend='cuda')
-        for observation, view, projection in tqdm(zip(observations, views, projections), total=len(observations), disable=not verbose, desc='Texture baking (fast)'):
-            with torch.no_grad():
-                rast = utils3d.torch.rasterize_triangle_faces(
-                    rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None], view=view, projection=projection
-                )
-                uv_map = rast['uv'][0].detach().flip(0)
-                mask = rast['mask'][0].detach().bool() & masks[0]
+    with rast_context() as rastctx:
+        if mode == 'fast':
+            texture = torch.zeros((texture_size * texture_size, 3), dtype=torch.float32).cuda()
+            texture_weights = torch.zeros((texture_size * texture_size), dtype=torch.float32).cuda()
+            for observation, view, projection in tqdm(zip(observations, views, projections), total=len(observations), disable=not verbose, desc='Texture baking (fast)'):
+                with torch.no_grad():
+                    rast = utils3d.torch.rasterize_triangle_faces(
+                        rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None], view=view, projection=projection
+                    )
+                    uv_map = rast['uv'][0].detach().flip(0)
+                    mask = rast['mask'][0].detach().bool() & masks[0]
             
-            # nearest neighbor interpolation
-            uv_map = (uv_map * texture_size).floor().long()
-            obs = observation[mask]
-            uv_map = uv_map[mask]
-            idx = uv_map[:, 0] + (texture_size - uv_map[:, 1] - 1) * texture_size
-            texture = texture.scatter_add(0, idx.view(-1, 1).expand(-1, 3), obs)
-            texture_weights = texture_weights.scatter_add(0, idx, torch.ones((obs.shape[0]), dtype=torch.float32, device=texture.device))
-
-        mask = texture_weights > 0
-        texture[mask] /= texture_weights[mask][:, None]
-        texture = np.clip(texture.reshape(texture_size, texture_size, 3).cpu().numpy() * 255, 0, 255).astype(np.uint8)
-
-        # inpaint
-        mask = (texture_weights == 0).cpu().numpy().astype(np.uint8).reshape(texture_size, texture_size)
-        texture = cv2.inpaint(texture, mask, 3, cv2.INPAINT_TELEA)
-
-    elif mode == 'opt':
-        rastctx = utils3d.torch.RastContext(backend='cuda')
-        observations = [observations.flip(0) for observations in observations]
-        masks = [m.flip(0) for m in masks]
-        _uv = []
-        _uv_dr = []
-        for observation, view, projection in tqdm(zip(observations, views, projections), total=len(views), disable=not verbose, desc='Texture baking (opt): UV'):
-            with torch.no_grad():
-                rast = utils3d.torch.rasterize_triangle_faces(
-                    rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None], view=view, projection=projection
-                )
-                _uv.append(rast['uv'].detach())
-                _uv_dr.append(rast['uv_dr'].detach())
+                # nearest neighbor interpolation
+                uv_map = (uv_map * texture_size).floor().long()
+                obs = observation[mask]
+                uv_map = uv_map[mask]
+                idx = uv_map[:, 0] + (texture_size - uv_map[:, 1] - 1) * texture_size
+                texture = texture.scatter_add(0, idx.view(-1, 1).expand(-1, 3), obs)
+                texture_weights = texture_weights.scatter_add(0, idx, torch.ones((obs.shape[0]), dtype=torch.float32, device=texture.device))
+
+            mask = texture_weights > 0
+            texture[mask] /= texture_weights[mask][:, None]
+            texture = np.clip(texture.reshape(texture_size, texture_size, 3).cpu().numpy() * 255, 0, 255).astype(np.uint8)
+
+            # inpaint
+            mask = (texture_weights == 0).cpu().numpy().astype(np.uint8).reshape(texture_size, texture_size)
+            texture = cv2.inpaint(texture, mask, 3, cv2.INPAINT_TELEA)
+
+        elif mode == 'opt':
+            observations = [observations.flip(0) for observations in observations]
+            masks = [m.flip(0) for m in masks]
+            _uv = []
+            _uv_dr = []
+            for observation, view, projection in tqdm(zip(observations, views, projections), total=len(views), disable=not verbose, desc='Texture baking (opt): UV'):
+                with torch.no_grad():
+                    rast = utils3d.torch.rasterize_triangle_faces(
+                        rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None], view=view, projection=projection
+                    )
+                    _uv.append(rast['uv'].detach())
+                    _uv_dr.append(rast['uv_dr'].detach())
+            # Stack the views so that a step can gather any subset of them
+            _uv, _uv_dr = torch.cat(_uv), torch.cat(_uv_dr)
+            observations, masks = torch.stack(observations), torch.stack(masks)
+
+            def fetch(selected):
+                selected = torch.from_numpy(selected).to(_uv.device)
+                return _uv[selected], _uv_dr[selected], observations[selected], masks[selected]
+
+            texture = _optimize_texture(
+                texture_size, len(views), fetch,
+                lambda_tv=lambda_tv, num_steps=num_steps, views_per_step=views_per_step, sync_every=sync_every,
+                early_stop_patience=early_stop_patience, early_stop_tol=early_stop_tol, verbose=verbose,
+            )
+            texture = _finalize_texture(texture[0], rastctx, faces, uvs, texture_size)
+
+        elif mode == 'ls':
+            equations = TextureNormalEquations(texture_size, 3, device=vertices.device)
+            for observation, obs_mask, view, projection in tqdm(zip(observations, masks, views, projections), total=len(views), disable=not verbose, desc='Texture baking (ls): accumulating'):
+                with torch.no_grad():
+                    rast = utils3d.torch.rasterize_triangle_faces(
+                        rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None], view=view, projection=projection
+                    )
+                    mask = rast['mask'][0].bool() & obs_mask.flip(0)
+                    equations.add(rast['uv'][0][mask], observation.flip(0)[mask])
+
+            # Match the balance of the terms in 'opt': the data term is a mean over the pixels, the smoothness term a mean over the texels
+            lambda_smooth = lambda_tv * equations.num_pixels / texture_size ** 2
+            texture, stats = equations.solve(lambda_smooth, verbose=verbose)
+            if verbose:
+                tqdm.write(f'Texture baking (ls): {stats.iters} CG iterations, residual {stats.residual:.2e}, {stats.coverage * 100:.1f}% texels observed')
+            texture = _finalize_texture(texture, rastctx, faces, uvs, texture_size)
+        else:
+            raise ValueError(f'Unknown mode: {mode}')
 
-        texture = torch.nn.Parameter(torch.zeros((1, texture_size, texture_size, 3), dtype=torch.float32).cuda())
-        optimizer = torch.optim.Adam([texture], betas=(0.5, 0.9), lr=1e-2)
+    return texture
 
-        def exp_anealing(optimizer, step, total_steps, start_lr, end_lr):
-            return start_lr * (end_lr / start_lr) ** (step / total_steps)
 
-        def cosine_anealing(optimizer, step, total_steps, start_lr, end_lr):
-            return end_lr + 0.5 * (start_lr - end_lr) * (1 + np.cos(np.pi * step / total_steps))
-        
-        def tv_loss(texture):
-            return torch.nn.functional.l1_loss(texture[:, :-1, :, :], texture[:, 1:, :, :]) + \
-                   torch.nn.functional.l1_loss(texture[:, :, :-1, :], texture[:, :, 1:, :])
-    
-        total_steps = 2500
-        with tqdm(total=total_steps, disable=not verbose, desc='Texture baking (opt): optimizing') as pbar:
-            for step in range(total_steps):
-                optimizer.zero_grad()
-                selected = np.random.randint(0, len(views))
-                uv, uv_dr, observation, mask = _uv[selected], _uv_dr[selected], observations[selected], masks[selected]
-                render = dr.texture(texture, uv, uv_dr)[0]
-                loss = torch.nn.functional.l1_loss(render[mask], observation[mask])
-                if lambda_tv > 0:
-                    loss += lambda_tv * tv_loss(texture)
-                loss.backward()
-                optimizer.step()
-                # annealing
-                optimizer.param_groups[0]['lr'] = cosine_anealing(optimizer, step, total_steps, 1e-2, 1e-5)
-                pbar.set_postfix({'loss': loss.item()})
-                pbar.update()
-        texture = np.clip(texture[0].flip(0).detach().cpu().numpy() * 255, 0, 255).astype(np.uint8)
-        mask = 1 - utils3d.torch.rasterize_triangle_faces(
-            rastctx, (uvs * 2 - 1)[None], faces, texture_size, texture_size
-        )['mask'][0].detach().cpu().numpy().astype(np.uint8)
-        texture = cv2.inpaint(texture, mask, 3, cv2.INPAINT_TELEA)
-    else:
-        raise ValueError(f'Unknown mode: {mode}')
+def bake_texture_streaming(
+    vertices: np.array,
+    faces: np.array,
+    uvs: np.array,
+    frames: Iterable[Tuple[List[np.array], List[torch.Tensor], List[torch.Tensor]]],
+    texture_size: int = 2048,
+    near: float = 0.1,
+    far: float = 10.0,
+    mode: Literal['fast', 'opt', 'ls'] = 'opt',
+    lambda_tv: float = 1e-2,
+    memory_budget: int = 2 ** 30,
+    cache_dir: Optional[str] = None,
+    num_steps: int = 2500,
+    views_per_step: int = 1,
+    sync_every: int = 50,
+    early_stop_patience: int = 0,
+    early_stop_tol: float = 1e-3,
+    verbose: bool = False,
+):
+    """
+    Bake texture to a mesh from observations that arrive in chunks, e.g. from `render_utils.iter_multiview`.
+    Needs CUDA, like `bake_texture`.
+
+    Every chunk is rasterized and reduced to the pixels the mesh covers before the next one is
+    requested. 'fast' and 'ls' only accumulate these pixels into the texture. 'opt' keeps them in
+    a `ViewRasterStore` that uses up to `memory_budget` bytes of device memory, and spills the rest
+    to host memory or to memory-mapped files in `cache_dir`. Pixels count as observed where any
+    channel of the observation is nonzero.
+
+    Args:
+        vertices (np.array): Vertices of the mesh. Shape (V, 3).
+        faces (np.array): Faces of the mesh. Shape (F, 3).
+        uvs (np.array): UV coordinates of the mesh. Shape (V, 2).
+        frames (Iterable): Chunks of (observations, extrinsics, intrinsics). Observations are uint8 images of shape (H, W, 3).
+        texture_size (int): Size of the texture.
+        near (float): Near plane of the camera.
+        far (float): Far plane of the camera.
+        mode (Literal['fast', 'opt', 'ls']): Mode of texture baking, see `bake_texture`.
+        lambda_tv (float): Weight of the smoothness term, see `bake_texture`.
+        memory_budget (int): Bytes of device memory for the rasterized views of 'opt' mode.
+        cache_dir (str): Directory to spill the rasterized views of 'opt' mode that exceed the budget to.
+            They are kept in host memory if None.
+        num_steps, views_per_step, sync_every, early_stop_patience, early_stop_tol: See `bake_texture`.
+        verbose (bool): Whether to print progress.
+    """
+    vertices = torch.tensor(vertices).cuda()
+    faces = torch.tensor(faces.astype(np.int32)).cuda()
+    uvs = torch.tensor(uvs).cuda()
+
+    with rast_context() as rastctx:
+        if mode == 'fast':
+            texture = torch.zeros((texture_size * texture_size, 3), dtype=torch.float32).cuda()
+            texture_weights = torch.zeros((texture_size * texture_size), dtype=torch.float32).cuda()
+        elif mode == 'ls':
+            equations = TextureNormalEquations(texture_size, 3, device=vertices.device)
+        elif mode == 'opt':
+            store = ViewRasterStore(memory_budget, cache_dir=cache_dir, device=vertices.device)
+        else:
+            raise ValueError(f'Unknown mode: {mode}')
+
+        with tqdm(disable=not verbose, desc=f'Texture baking ({mode}): views') as pbar:
+            for observations, extrinsics, intrinsics in frames:
+                for observation, extr, intr in zip(observations, extrinsics, intrinsics):
+                    with torch.no_grad():
+                        observation = torch.from_numpy(observation).cuda().flip(0)
+                        rast = utils3d.torch.rasterize_triangle_faces(
+                            rastctx, vertices[None], faces, observation.shape[1], observation.shape[0], uv=uvs[None],
+                            view=utils3d.torch.extrinsics_to_view(torch.as_tensor(extr).cuda()),
+                            projection=utils3d.torch.intrinsics_to_perspective(torch.as_tensor(intr).cuda(), near, far),
+                        )
+                        mask = rast['mask'][0].bool() & (observation > 0).any(dim=-1)
+                        uv, colors = rast['uv'][0][mask], observation[mask]
+                    if mode == 'fast':
+                        # nearest neighbor interpolation
+                        uv = (uv * texture_size).floor().long().clamp(0, texture_size - 1)
+                        idx = uv[:, 0] + (texture_size - uv[:, 1] - 1) * texture_size
+                        texture.index_add_(0, idx, colors.float() / 255)
+                        texture_weights.index_add_(0, idx, torch.ones_like(idx, dtype=torch.float32))
+                    elif mode == 'ls':
+                        equations.add(uv, colors.float() / 255)
+                    else:
+                        store.add(uv, rast['uv_dr'][0][mask], colors)
+                    pbar.update()
+
+        if mode == 'fast':
+            mask = texture_weights > 0
+            texture[mask] /= texture_weights[mask][:, None]
+            texture = np.clip(texture.reshape(texture_size, texture_size, 3).cpu().numpy() * 255, 0, 255).astype(np.uint8)
+            mask = (texture_weights == 0).cpu().numpy().astype(np.uint8).reshape(texture_size, texture_size)
+            texture = cv2.inpaint(texture, mask, 3, cv2.INPAINT_TELEA)
+
+        elif mode == 'ls':
+            lambda_smooth = lambda_tv * equations.num_pixels / texture_size ** 2
+            texture, stats = equations.solve(lambda_smooth, verbose=verbose)
+            if verbose:
+                tqdm.write(f'Texture baking (ls): {stats.iters} CG iterations, residual {stats.residual:.2e}, {stats.coverage * 100:.1f}% texels observed')
+            texture = _finalize_texture(texture, rastctx, faces, uvs, texture_size)
+
+        else:
+            if verbose:
+                tqdm.write(f'Texture baking (opt): rasterized views use {store.nbytes["device"] / 2 ** 20:.0f} MB on the device, '
+                           f'{store.nbytes["host"] / 2 ** 20:.0f} MB on the host and {store.nbytes["disk"] / 2 ** 20:.0f} MB on disk')
+            try:
+                texture = _optimize_texture(
+                    texture_size, len(store), lambda selected: (*store.gather(selected), None),
+                    lambda_tv=lambda_tv, num_steps=num_steps, views_per_step=views_per_step, sync_every=sync_every,
+                    early_stop_patience=early_stop_patience, early_stop_tol=early_stop_tol, verbose=verbose,
+                )
+            finally:
+                store.close()
+            texture = _finalize_texture(texture[0], rastctx, faces, uvs, texture_size)
 
     return texture
 
 
+def _hash_representation(rep) -> str:
+    """
+    Content hash of a representation, covering its type, init parameters and tensors.
+    """
+    tensors = sorted((k, v) for k, v in vars(rep).items() if isinstance(v, torch.Tensor))
+    return hash_bytes(
+        type(rep).__name__.encode(),
+        repr(getattr(rep, 'init_params', None)).encode(),
+        *[f'{k}:{hash_array(v)}'.encode() for k, v in tensors],
+    )
+
+
+def _cached_stage(
+    cache: Optional[ArrayCache],
+    stage: str,
+    key: str,
+    compute: Callable[[], Dict[str, np.ndarray]],
+    verbose: bool = False,
+) -> Dict[str, np.ndarray]:
+    """
+    Look up the arrays of a `to_glb` stage in `cache` under `glb_{stage}_{key}`, computing and storing them on a miss.
+    """
+    if cache is None:
+        return compute()
+    full_key = f'glb_{stage}_{key}'
+    value = cache.get(full_key)
+    if value is not None:
+        if verbose:
+            tqdm.write(f'Reusing cached {stage}')
+        return value
+    value = compute()
+    cache.put(full_key, value)
+    return value
+
+
 def to_glb(
     app_rep: Union[Strivec, Gaussian],
     mesh: MeshExtractResult,
     simplify: float = 0.95,
     fill_holes: bool = True,
     fill_holes_max_size: float = 0.04,
+    fill_holes_adaptive: bool = True,
     texture_size: int = 1024,
+    texture_bake_mode: Literal['fast', 'opt', 'ls'] = 'opt',
+    texture_bake_memory_budget: Optional[int] = None,
+    texture_bake_cache_dir: Optional[str] = None,
+    uv_num_workers: Optional[int] = 1,
+    cache: Optional[ArrayCache] = None,
     debug: bool = False,
     verbose: bool = True,
 ) -> trimesh.Trimesh:
     """
     Convert a generated asset to a glb file.
 
+    The mesh is postprocessed on the device of `mesh`. Texture baking rasterizes with nvdiffrast and
+    needs CUDA: on other devices the UV atlas and the texture are skipped and the mesh is returned
+    untextured.
+
     Args:
         app_rep (Union[Strivec, Gaussian]): Appearance representation.
         mesh (MeshExtractResult): Extracted mesh.
         simplify (float): Ratio of faces to remove in simplification.
         fill_holes (bool): Whether to fill holes in the mesh.
         fill_holes_max_size (float): Maximum area of a hole to fill.
+        fill_holes_adaptive (bool): Whether to choose the number of views and the resolution of the visibility
+            estimation from the mesh, instead of always rasterizing 1000 views at 1024px.
         texture_size (int): Size of the texture.
+        texture_bake_mode (Literal['fast', 'opt', 'ls']): Mode of texture baking, see `bake_texture`.
+        texture_bake_memory_budget (int): If given, render and bake the views in chunks, keeping at most this
+            many bytes of rasterized views on the device, see `bake_texture_streaming`. Otherwise all views
+            are rendered and uploaded at once.
+        texture_bake_cache_dir (str): Directory to spill rasterized views beyond the budget to, in streaming mode.
+        uv_num_workers (int): Number of processes to compute the UV atlas with, all CPUs if None, see `parametrize_mesh`.
+            A single `xatlas.parametrize` call if 1.
+        cache (ArrayCache): Cache of the results of every stage: the postprocessed mesh, the UV atlas,
+            the multiview renders and the texture, keyed by the content of their inputs and their parameters.
+            Re-exports with other settings only recompute the stages the settings affect. Renders are not
+            cached in streaming mode.
         debug (bool): Whether to print debug information.
         verbose (bool): Whether to print progress.
     """
+    device = mesh.vertices.device
     vertices = mesh.vertices.cpu().numpy()
     faces = mesh.faces.cpu().numpy()
-    
+    # Every stage is keyed by the keys of its inputs and its own parameters
+    mesh_key = hash_bytes(hash_array(vertices).encode(), hash_array(faces).encode(), repr((simplify, fill_holes, fill_holes_max_size, fill_holes_adaptive)).encode()) if cache is not None else None
+    views_key = hash_bytes(_hash_representation(app_rep).encode(), repr((1024, 100)).encode()) if cache is not None else None
+
     # mesh postprocess
-    vertices, faces = postprocess_mesh(
-        vertices, faces,
-        simplify=simplify > 0,
-        simplify_ratio=simplify,
-        fill_holes=fill_holes,
-        fill_holes_max_hole_size=fill_holes_max_size,
-        fill_holes_max_hole_nbe=int(250 * np.sqrt(1-simplify)),
-        fill_holes_resolution=1024,
-        fill_holes_num_views=1000,
-        debug=debug,
-        verbose=verbose,
-    )
+    def postprocess():
+        vertices_, faces_ = postprocess_mesh(
+            vertices, faces,
+            simplify=simplify > 0,
+            simplify_ratio=simplify,
+            fill_holes=fill_holes,
+            fill_holes_max_hole_size=fill_holes_max_size,
+            fill_holes_max_hole_nbe=int(250 * np.sqrt(1-simplify)),
+            fill_holes_resolution=None if fill_holes_adaptive else 1024,
+            fill_holes_num_views=1000,
+            fill_holes_adaptive_views=fill_holes_adaptive,
+            device=device,
+            debug=debug,
+            verbose=verbose,
+        )
+        return {'vertices': vertices_, 'faces': faces_}
+    mesh_arrays = _cached_stage(cache, 'mesh', mesh_key, postprocess, verbose)
+    z_up_to_y_up = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]])
+    if device.type != 'cuda':
+        # texture baking needs nvdiffrast: export the untextured mesh, rotated from z-up to y-up
+        return trimesh.Trimesh(mesh_arrays['vertices'] @ z_up_to_y_up, mesh_arrays['faces'])
 
     # parametrize mesh
-    vertices, faces, uvs = parametrize_mesh(vertices, faces)
+    def parametrize():
+        vertices_, faces_, uvs_ = parametrize_mesh(mesh_arrays['vertices'], mesh_arrays['faces'], num_workers=uv_num_workers)
+        return {'vertices': vertices_, 'faces': faces_, 'uvs': uvs_}
+    uv_key = hash_bytes(mesh_key.encode(), repr(uv_num_workers != 1).encode()) if cache is not None else None
+    uv_arrays = _cached_stage(cache, 'uv', uv_key, parametrize, verbose)
+    vertices, faces, uvs = uv_arrays['vertices'], uv_arrays['faces'], uv_arrays['uvs']
 
     # bake texture
-    observations, extrinsics, intrinsics = render_multiview(app_rep, resolution=1024, nviews=100)
-    masks = [np.any(observation > 0, axis=-1) for observation in observations]
-    extrinsics = [extrinsics[i].cpu().numpy() for i in range(len(extrinsics))]
-    intrinsics = [intrinsics[i].cpu().numpy() for i in range(len(intrinsics))]
-    texture = bake_texture(
-        vertices, faces, uvs,
-        observations, masks, extrinsics, intrinsics,
-        texture_size=texture_size, mode='opt',
-        lambda_tv=0.01,
-        verbose=verbose
-    )
-    texture = Image.fromarray(texture)
+    lambda_tv = 0.01
+    def bake():
+        if texture_bake_memory_budget is not None:
+            texture_ = bake_texture_streaming(
+                vertices, faces, uvs,
+                iter_multiview(app_rep, resolution=1024, nviews=100, chunk_size=8),
+                texture_size=texture_size, mode=texture_bake_mode,
+                lambda_tv=lambda_tv,
+                memory_budget=texture_bake_memory_budget,
+                cache_dir=texture_bake_cache_dir,
+                verbose=verbose
+            )
+            return {'texture': texture_}
+
+        def render():
+            observations_, extrinsics_, intrinsics_ = render_multiview(app_rep, resolution=1024, nviews=100)
+            return {
+                'observations': np.stack(observations_),
+                'extrinsics': extrinsics_.cpu().numpy(),
+                'intrinsics': intrinsics_.cpu().numpy(),
+            }
+        views = _cached_stage(cache, 'views', views_key, render, verbose)
+        observations = list(views['observations'])
+        masks = [np.any(observation > 0, axis=-1) for observation in observations]
+        extrinsics = list(views['extrinsics'])
+        intrinsics = list(views['intrinsics'])
+        texture_ = bake_texture(
+            vertices, faces, uvs,
+            observations, masks, extrinsics, intrinsics,
+            texture_size=texture_size, mode=texture_bake_mode,
+            lambda_tv=lambda_tv,
+            verbose=verbose
+        )
+        return {'texture': texture_}
+    # The streaming baker masks the views differently, so its textures are keyed apart from those of `bake_texture`
+    texture_key = hash_bytes(uv_key.encode(), views_key.encode(), repr((texture_size, texture_bake_mode, lambda_tv, texture_bake_memory_budget is not None)).encode()) if cache is not None else None
+    texture = Image.fromarray(_cached_stage(cache, 'texture', texture_key, bake, verbose)['texture'])
 
     # rotate mesh (from z-up to y-up)
-    vertices = vertices @ np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]])
+    vertices = vertices @ z_up_to_y_up
     material = trimesh.visual.material.PBRMaterial(
         roughnessFactor=1.0,
         baseColorTexture=texture,
@@ -492,7 +862,7 @@ def simplify_gs(
             "ssaa": 1,
             "bg_color": (0,0,0),
         })
-    new_gs = Gaussian(**gs.init_params)
+    new_gs = Gaussian(**gs.init_params, device=gs.device)
     new_gs._features_dc = gs._features_dc.clone()
     new_gs._features_rest = gs._features_rest.clone() if gs._features_rest is not None else None
     new_gs._opacity = torch.nn.Parameter(gs._opacity.clone())
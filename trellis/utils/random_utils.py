@@ -27,4 +27,26 @@ def sphere_hammersley_sequence(n, num_samples, offset=(0, 0), remap=False):
         u = 2 * u if u < 0.25 else 2 / 3 * u + 1 / 3
     theta = np.arccos(1 - 2 * u) - np.pi / 2
     phi = v * 2 * np.pi
-    return [phi, theta]
\ No newline at end of file
+    return [phi, theta]
+
+def radical_inverse_base2(n):
+    # Vectorized radical_inverse(2, n): the bits of n mirrored around the binary point
+    n = np.asarray(n, dtype=np.uint64)
+    val = np.zeros(n.shape, dtype=np.float64)
+    inv_base_n = 0.5
+    while np.any(n > 0):
+        val += (n & 1) * inv_base_n
+        n = n >> np.uint64(1)
+        inv_base_n *= 0.5
+    return val
+
+def sphere_hammersley_points(indices, num_samples, offset=(0, 0), remap=False):
+    # Vectorized sphere_hammersley_sequence over an array of indices, as [N x 2] (phi, theta)
+    indices = np.asarray(indices, dtype=np.int64)
+    u = indices / num_samples + offset[0] / num_samples
+    v = radical_inverse_base2(indices) + offset[1]
+    if remap:
+        u = np.where(u < 0.25, 2 * u, 2 / 3 * u + 1 / 3)
+    theta = np.arccos(1 - 2 * u) - np.pi / 2
+    phi = v * 2 * np.pi
+    return np.stack([phi, theta], axis=-1)
\ No newline at end of file
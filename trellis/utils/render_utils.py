@@ -1,46 +1,36 @@
+from contextlib import ExitStack, nullcontext
 import torch
 import numpy as np
 from tqdm import tqdm
-import utils3d
 from PIL import Image
 
-from ..renderers import OctreeRenderer, GaussianRenderer, MeshRenderer
+from ..renderers import OctreeRenderer, GaussianRenderer, MeshRenderer, TorchGaussianRenderer, TorchMeshRenderer
+from ..renderers import pool
 from ..representations import Octree, Gaussian, MeshExtractResult
 from ..modules import sparse as sp
-from .random_utils import sphere_hammersley_sequence
+from .camera_utils import yaw_pitch_r_fov_to_cameras, orbit_cameras, hammersley_cameras, snapshot_cameras
 
 
-def yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, rs, fovs):
+def yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, rs, fovs, device='cuda'):
+    # Lists of per-frame cameras, or a single camera for scalar yaw and pitch; see camera_utils for batches
     is_list = isinstance(yaws, list)
+    extrinsics, intrinsics = yaw_pitch_r_fov_to_cameras(yaws, pitchs, rs, fovs, device)
     if not is_list:
-        yaws = [yaws]
-        pitchs = [pitchs]
-    if not isinstance(rs, list):
-        rs = [rs] * len(yaws)
-    if not isinstance(fovs, list):
-        fovs = [fovs] * len(yaws)
-    extrinsics = []
-    intrinsics = []
-    for yaw, pitch, r, fov in zip(yaws, pitchs, rs, fovs):
-        fov = torch.deg2rad(torch.tensor(float(fov))).cuda()
-        yaw = torch.tensor(float(yaw)).cuda()
-        pitch = torch.tensor(float(pitch)).cuda()
-        orig = torch.tensor([
-            torch.sin(yaw) * torch.cos(pitch),
-            torch.cos(yaw) * torch.cos(pitch),
-            torch.sin(pitch),
-        ]).cuda() * r
-        extr = utils3d.torch.extrinsics_look_at(orig, torch.tensor([0, 0, 0]).float().cuda(), torch.tensor([0, 0, 1]).float().cuda())
-        intr = utils3d.torch.intrinsics_from_fov_xy(fov, fov)
-        extrinsics.append(extr)
-        intrinsics.append(intr)
-    if not is_list:
-        extrinsics = extrinsics[0]
-        intrinsics = intrinsics[0]
-    return extrinsics, intrinsics
+        return extrinsics[0], intrinsics[0]
+    return list(extrinsics.unbind(0)), list(intrinsics.unbind(0))
+
 
+def _sample_device(sample) -> torch.device:
+    if isinstance(sample, (list, tuple)):
+        sample = sample[0]
+    if isinstance(sample, MeshExtractResult):
+        return sample.vertices.device
+    return torch.device(getattr(sample, 'device', 'cuda'))
 
-def render_frames(sample, extrinsics, intrinsics, options={}, colors_overwrite=None, verbose=True, **kwargs):
+
+def _make_renderer(sample, options={}, **kwargs):
+    # The Gaussian and mesh rasterizers need CUDA; elsewhere the plain PyTorch renderers are used
+    on_cuda = _sample_device(sample).type == 'cuda'
     if isinstance(sample, Octree):
         renderer = OctreeRenderer()
         renderer.rendering_options.resolution = options.get('resolution', 512)
@@ -50,7 +40,7 @@ def render_frames(sample, extrinsics, intrinsics, options={}, colors_overwrite=N
         renderer.rendering_options.ssaa = options.get('ssaa', 4)
         renderer.pipe.primitive = sample.primitive
     elif isinstance(sample, Gaussian):
-        renderer = GaussianRenderer()
+        renderer = GaussianRenderer() if on_cuda else TorchGaussianRenderer()
         renderer.rendering_options.resolution = options.get('resolution', 512)
         renderer.rendering_options.near = options.get('near', 0.8)
         renderer.rendering_options.far = options.get('far', 1.6)
@@ -59,58 +49,190 @@ def render_frames(sample, extrinsics, intrinsics, options={}, colors_overwrite=N
         renderer.pipe.kernel_size = kwargs.get('kernel_size', 0.1)
         renderer.pipe.use_mip_gaussian = True
     elif isinstance(sample, MeshExtractResult):
-        renderer = MeshRenderer()
+        renderer = MeshRenderer() if on_cuda else TorchMeshRenderer()
         renderer.rendering_options.resolution = options.get('resolution', 512)
         renderer.rendering_options.near = options.get('near', 1)
         renderer.rendering_options.far = options.get('far', 100)
-        renderer.rendering_options.ssaa = options.get('ssaa', 4)
+        renderer.rendering_options.ssaa = options.get('ssaa', 4 if on_cuda else 2)
     else:
         raise ValueError(f'Unsupported sample type: {type(sample)}')
-    
-    rets = {}
-    for j, (extr, intr) in tqdm(enumerate(zip(extrinsics, intrinsics)), desc='Rendering', disable=not verbose):
-        if not isinstance(sample, MeshExtractResult):
-            res = renderer.render(sample, extr, intr, colors_overwrite=colors_overwrite)
-            if 'color' not in rets: rets['color'] = []
-            if 'depth' not in rets: rets['depth'] = []
-            rets['color'].append(np.clip(res['color'].detach().cpu().numpy().transpose(1, 2, 0) * 255, 0, 255).astype(np.uint8))
-            if 'percent_depth' in res:
-                rets['depth'].append(res['percent_depth'].detach().cpu().numpy())
-            elif 'depth' in res:
-                rets['depth'].append(res['depth'].detach().cpu().numpy())
+    return renderer
+
+
+def _checkout_renderer(sample, options={}, **kwargs):
+    # Renderers are reused across calls from the process-level pool, keyed by everything _make_renderer sets
+    key = (type(sample).__name__, repr(sorted(options.items())), kwargs.get('kernel_size'), getattr(sample, 'primitive', None))
+    return pool.renderer(key, lambda: _make_renderer(sample, options, **kwargs), device=_sample_device(sample))
+
+
+def _iter_composite_frames(samples, channels, extrinsics, intrinsics, options={}, colors_overwrite=None, verbose=True, num_buffers=2, **kwargs):
+    if channels is None or len(channels) != len(samples):
+        raise ValueError('Composite rendering needs one channel per sample')
+    resolution = options.get('resolution', 512)
+    # The composed frames are copied once per camera into a ring of preallocated (pinned) host buffers
+    buffers = torch.empty((num_buffers, resolution, resolution * len(samples), 3), dtype=torch.uint8, pin_memory=torch.cuda.is_available())
+    with ExitStack() as stack:
+        renderers = [stack.enter_context(_checkout_renderer(sample, options, **kwargs)) for sample in samples]
+        for j, (extr, intr) in tqdm(enumerate(zip(extrinsics, intrinsics)), total=len(extrinsics), desc='Rendering', disable=not verbose):
+            images = []
+            for sample, channel, renderer in zip(samples, channels, renderers):
+                if isinstance(sample, MeshExtractResult):
+                    res = renderer.render(sample, extr, intr, return_types=[channel])
+                else:
+                    res = renderer.render(sample, extr, intr, colors_overwrite=colors_overwrite)
+                images.append((res[channel].detach().clamp(0, 1) * 255).to(torch.uint8))
+            buffer = buffers[j % num_buffers]
+            buffer.copy_(torch.cat(images, dim=2).permute(1, 2, 0))
+            yield {'composite': buffer.numpy()}
+
+
+def iter_frames(sample, extrinsics, intrinsics, options={}, colors_overwrite=None, verbose=True, channels=None, num_buffers=2, **kwargs):
+    """
+    The frames of `render_frames`, yielded one at a time as dicts of a 'color' and a 'depth'
+    frame, or of a 'normal' frame for meshes, so that callers can consume them as they are rendered.
+
+    If `sample` is a list of representations, they are rendered in one pass per camera and the
+    channel `channels[i]` of the i-th one (e.g. 'color' or 'normal') is placed side by side in a
+    'composite' frame. Composite frames are views of a ring of `num_buffers` reused buffers: a frame
+    is overwritten `num_buffers` frames later, so consumers holding on to frames, like a queued
+    video writer, need as many buffers as frames they hold plus one.
+    """
+    if isinstance(sample, (list, tuple)):
+        yield from _iter_composite_frames(sample, channels, extrinsics, intrinsics, options, colors_overwrite, verbose, num_buffers, **kwargs)
+        return
+    with _checkout_renderer(sample, options, **kwargs) as renderer:
+        for extr, intr in tqdm(zip(extrinsics, intrinsics), total=len(extrinsics), desc='Rendering', disable=not verbose):
+            if not isinstance(sample, MeshExtractResult):
+                res = renderer.render(sample, extr, intr, colors_overwrite=colors_overwrite)
+                frame = {'color': np.clip(res['color'].detach().cpu().numpy().transpose(1, 2, 0) * 255, 0, 255).astype(np.uint8)}
+                if 'percent_depth' in res:
+                    frame['depth'] = res['percent_depth'].detach().cpu().numpy()
+                elif 'depth' in res:
+                    frame['depth'] = res['depth'].detach().cpu().numpy()
+                else:
+                    frame['depth'] = None
             else:
-                rets['depth'].append(None)
-        else:
-            res = renderer.render(sample, extr, intr)
-            if 'normal' not in rets: rets['normal'] = []
-            rets['normal'].append(np.clip(res['normal'].detach().cpu().numpy().transpose(1, 2, 0) * 255, 0, 255).astype(np.uint8))
+                res = renderer.render(sample, extr, intr)
+                frame = {'normal': np.clip(res['normal'].detach().cpu().numpy().transpose(1, 2, 0) * 255, 0, 255).astype(np.uint8)}
+            yield frame
+
+
+def _render_frames_batched(sample, extrinsics, intrinsics, options={}, colors_overwrite=None, verbose=True, transfer_chunk_size=None, return_depth=True, **kwargs):
+    num_frames = len(extrinsics)
+    key = 'normal' if isinstance(sample, MeshExtractResult) else 'color'
+    device_frames, device_depths, host_frames, host_depths = None, None, None, None
+    pin_memory = torch.cuda.is_available()
+    copy_stream = torch.cuda.Stream() if pin_memory and transfer_chunk_size else None
+    copied = 0
+
+    def transfer(end, non_blocking):
+        # Copy the frames rendered since the last transfer to the host, on the copy stream if any
+        nonlocal copied
+        if end <= copied:
+            return
+        if copy_stream is not None:
+            copy_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(copy_stream) if copy_stream is not None else nullcontext():
+            host_frames[copied:end].copy_(device_frames[copied:end], non_blocking=non_blocking)
+            if device_depths is not None:
+                host_depths[copied:end].copy_(device_depths[copied:end], non_blocking=non_blocking)
+        copied = end
+
+    with _checkout_renderer(sample, options, **kwargs) as renderer:
+        for j, (extr, intr) in tqdm(enumerate(zip(extrinsics, intrinsics)), total=num_frames, desc='Rendering', disable=not verbose):
+            if key == 'color':
+                res = renderer.render(sample, extr, intr, colors_overwrite=colors_overwrite)
+                depth = (res['percent_depth'] if 'percent_depth' in res else res.get('depth')) if return_depth else None
+            else:
+                res = renderer.render(sample, extr, intr)
+                depth = None
+            image = (res[key].detach() * 255).clamp(0, 255).to(torch.uint8).permute(1, 2, 0)
+            if device_frames is None:
+                # The outputs are allocated from the first frame: on its device, and pinned on the host
+                device_frames = torch.empty((num_frames, *image.shape), dtype=torch.uint8, device=image.device)
+                host_frames = torch.empty(device_frames.shape, dtype=torch.uint8, pin_memory=pin_memory)
+                if depth is not None:
+                    device_depths = torch.empty((num_frames, *depth.shape), dtype=depth.dtype, device=depth.device)
+                    host_depths = torch.empty(device_depths.shape, dtype=depth.dtype, pin_memory=pin_memory)
+            device_frames[j] = image
+            if device_depths is not None:
+                device_depths[j] = depth.detach()
+            if copy_stream is not None and (j + 1) % transfer_chunk_size == 0:
+                transfer(j + 1, non_blocking=True)
+
+    if device_frames is None:
+        resolution = options.get('resolution', 512)
+        return {key: np.zeros((0, resolution, resolution, 3), dtype=np.uint8), **({'depth': None} if key == 'color' else {})}
+    if copy_stream is not None:
+        transfer(num_frames, non_blocking=True)
+        copy_stream.synchronize()
+    else:
+        transfer(num_frames, non_blocking=False)
+    rets = {key: host_frames.numpy()}
+    if key == 'color':
+        rets['depth'] = host_depths.numpy() if host_depths is not None else None
+    return rets
+
+
+def render_frames(sample, extrinsics, intrinsics, options={}, colors_overwrite=None, verbose=True, channels=None, batched=False, transfer_chunk_size=None, return_depth=True, **kwargs):
+    """
+    Render a representation from the given cameras.
+
+    Returns lists of [H x W x 3] uint8 'color' frames and of 'depth' frames, or of 'normal' frames
+    for meshes. With `batched`, the frames are instead gathered in a preallocated device tensor and
+    returned as one contiguous [N x H x W x 3] array, with the depths as one [N x ...] array (or
+    None), copied to pinned host memory in a single transfer at the end, or every
+    `transfer_chunk_size` frames on a side stream, overlapping with rendering. Without
+    `return_depth` no depth buffers are allocated and 'depth' is None.
+
+    With a list of samples and `channels`, the composite frames of `iter_frames`, all in one
+    preallocated buffer.
+    """
+    if batched and not isinstance(sample, (list, tuple)):
+        return _render_frames_batched(sample, extrinsics, intrinsics, options, colors_overwrite, verbose, transfer_chunk_size, return_depth, **kwargs)
+    rets = {}
+    num_buffers = len(extrinsics) if isinstance(sample, (list, tuple)) else 2
+    for frame in iter_frames(sample, extrinsics, intrinsics, options, colors_overwrite, verbose, channels, num_buffers, **kwargs):
+        for k, v in frame.items():
+            rets.setdefault(k, []).append(v)
+    if not return_depth and 'depth' in rets:
+        rets['depth'] = None
     return rets
 
 
 def render_video(sample, resolution=512, bg_color=(0, 0, 0), num_frames=300, r=2, fov=40, **kwargs):
-    yaws = torch.linspace(0, 2 * 3.1415, num_frames)
-    pitch = 0.25 + 0.5 * torch.sin(torch.linspace(0, 2 * 3.1415, num_frames))
-    yaws = yaws.tolist()
-    pitch = pitch.tolist()
-    extrinsics, intrinsics = yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitch, r, fov)
+    extrinsics, intrinsics = orbit_cameras(num_frames, r, fov, device=_sample_device(sample))
     return render_frames(sample, extrinsics, intrinsics, {'resolution': resolution, 'bg_color': bg_color}, **kwargs)
 
 
+def iter_video(sample, resolution=512, bg_color=(0, 0, 0), num_frames=300, r=2, fov=40, **kwargs):
+    # The frames of `render_video`, one at a time
+    extrinsics, intrinsics = orbit_cameras(num_frames, r, fov, device=_sample_device(sample))
+    return iter_frames(sample, extrinsics, intrinsics, {'resolution': resolution, 'bg_color': bg_color}, **kwargs)
+
+
+def multiview_cameras(nviews=30, r=2, fov=40, device='cuda'):
+    # [nviews x 4 x 4] extrinsics and [nviews x 3 x 3] intrinsics
+    return hammersley_cameras(nviews, r, fov, device=device)
+
+
 def render_multiview(sample, resolution=512, nviews=30):
-    r = 2
-    fov = 40
-    cams = [sphere_hammersley_sequence(i, nviews) for i in range(nviews)]
-    yaws = [cam[0] for cam in cams]
-    pitchs = [cam[1] for cam in cams]
-    extrinsics, intrinsics = yaw_pitch_r_fov_to_extrinsics_intrinsics(yaws, pitchs, r, fov)
-    res = render_frames(sample, extrinsics, intrinsics, {'resolution': resolution, 'bg_color': (0, 0, 0)})
+    extrinsics, intrinsics = multiview_cameras(nviews, device=_sample_device(sample))
+    res = render_frames(sample, extrinsics, intrinsics, {'resolution': resolution, 'bg_color': (0, 0, 0)}, batched=True, transfer_chunk_size=8, return_depth=False)
     return res['color'], extrinsics, intrinsics
 
 
+def iter_multiview(sample, resolution=512, nviews=30, chunk_size=8):
+    """
+    The views of `render_multiview`, rendered and yielded `chunk_size` at a time, so that
+    only one chunk of frames is in memory at once.
+    """
+    extrinsics, intrinsics = multiview_cameras(nviews, device=_sample_device(sample))
+    for i in range(0, nviews, chunk_size):
+        res = render_frames(sample, extrinsics[i:i + chunk_size], intrinsics[i:i + chunk_size], {'resolution': resolution, 'bg_color': (0, 0, 0)}, verbose=False, batched=True, return_depth=False)
+        yield res['color'], extrinsics[i:i + chunk_size], intrinsics[i:i + chunk_size]
+
+
 def render_snapshot(samples, resolution=512, bg_color=(0, 0, 0), offset=(-16 / 180 * np.pi, 20 / 180 * np.pi), r=10, fov=8, **kwargs):
-    yaw = [0, np.pi/2, np.pi, 3*np.pi/2]
-    yaw_offset = offset[0]
-    yaw = [y + yaw_offset for y in yaw]
-    pitch = [offset[1] for _ in range(4)]
-    extrinsics, intrinsics = yaw_pitch_r_fov_to_extrinsics_intrinsics(yaw, pitch, r, fov)
+    extrinsics, intrinsics = snapshot_cameras(offset, r, fov, device=_sample_device(samples))
     return render_frames(samples, extrinsics, intrinsics, {'resolution': resolution, 'bg_color': bg_color}, **kwargs)
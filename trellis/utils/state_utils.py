@@ -0,0 +1,177 @@
+from typing import *
+import os
+import json
+import struct
+import numpy as np
+import torch
+
+
+__all__ = [
+    'ENCODINGS',
+    'save_state',
+    'load_state',
+]
+
+
+MAGIC = b'TRLSTATE'
+VERSION = 1
+ALIGNMENT = 64
+# Magic, version, reserved, header length
+_PREAMBLE = struct.Struct('<8sIIQ')
+
+# Storage encodings of an array: as is, as float16, or affinely quantized per channel (last axis)
+ENCODINGS = ('raw', 'float16', 'quant8', 'quant16')
+
+
+def _align(n: int) -> int:
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _encode(array: np.ndarray, encoding: str) -> Tuple[np.ndarray, dict]:
+    if encoding == 'raw':
+        return array, {}
+    if encoding == 'float16':
+        return array.astype(np.float16), {}
+    if encoding in ('quant8', 'quant16'):
+        dtype = np.uint8 if encoding == 'quant8' else np.uint16
+        levels = np.iinfo(dtype).max
+        channels = array.reshape(-1, array.shape[-1] if array.ndim > 0 else 1).astype(np.float64)
+        low = channels.min(axis=0) if channels.shape[0] > 0 else np.zeros(channels.shape[1])
+        high = channels.max(axis=0) if channels.shape[0] > 0 else np.zeros(channels.shape[1])
+        scale = np.where(high > low, (high - low) / levels, 1.0)
+        quantized = np.clip(np.round((channels - low) / scale), 0, levels).astype(dtype).reshape(array.shape)
+        return quantized, {'low': low.tolist(), 'scale': scale.tolist()}
+    raise ValueError(f"Unknown encoding: {encoding}")
+
+
+def _decode(stored: np.ndarray, entry: dict) -> np.ndarray:
+    if entry['encoding'] in ('quant8', 'quant16'):
+        low = np.array(entry['low'], dtype=np.float32)
+        scale = np.array(entry['scale'], dtype=np.float32)
+        # The per-channel broadcast turns 0-d arrays into 1-d ones, so restore the shape
+        return (stored.astype(np.float32) * scale + low).astype(entry['dtype']).reshape(entry['shape'])
+    # Raw and float16 arrays are returned as stored, so that they stay views of the file
+    return stored
+
+
+def save_state(
+    path: str,
+    arrays: Dict[str, Union[np.ndarray, torch.Tensor]],
+    meta: Optional[dict] = None,
+    encodings: Optional[Dict[str, str]] = None,
+    compression: Optional[str] = None,
+    compression_level: int = 3,
+) -> int:
+    """
+    Save named arrays and JSON metadata to a single binary file.
+
+    The file starts with a fixed preamble and a JSON header describing every array (dtype, shape,
+    encoding, offset), followed by the array data, each array aligned to 64 bytes so that
+    uncompressed arrays can be memory-mapped in place by `load_state`. The file is written to a
+    temporary path and moved into place, so readers never see a partial file, and maps of a
+    previous version of the file stay valid.
+
+    Args:
+        path (str): Path of the file.
+        arrays (Dict[str, Union[np.ndarray, torch.Tensor]]): Arrays to save.
+        meta (dict): JSON-serializable metadata.
+        encodings (Dict[str, str]): Encoding of some of the arrays, one of `ENCODINGS`; 'raw' for the others.
+            'quant8' and 'quant16' store floating point arrays as 8 or 16 bit integers, scaled per channel.
+        compression (str): 'zstd' to compress every array with zstandard, which then has to be decompressed
+            into memory on load. Uncompressed if None.
+        compression_level (int): zstd compression level.
+
+    Returns:
+        (int): Size of the file in bytes.
+    """
+    encodings = encodings or {}
+    if compression not in (None, 'zstd'):
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == 'zstd':
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=compression_level)
+
+    entries, blobs = [], []
+    offset = 0
+    for name, array in arrays.items():
+        if isinstance(array, torch.Tensor):
+            array = array.detach().cpu().numpy()
+        # `np.ascontiguousarray` returns 0-d arrays as 1-d ones
+        array = np.ascontiguousarray(array).reshape(np.shape(array))
+        encoding = encodings.get(name, 'raw')
+        stored, params = _encode(array, encoding)
+        blob = stored.tobytes()
+        if compression == 'zstd':
+            blob = compressor.compress(blob)
+        entries.append({
+            'name': name,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'encoding': encoding,
+            'stored_dtype': stored.dtype.str,
+            'offset': offset,
+            'nbytes': len(blob),
+            **params,
+        })
+        blobs.append(blob)
+        offset = _align(offset + len(blob))
+
+    header = json.dumps({'meta': meta or {}, 'compression': compression, 'arrays': entries}).encode()
+    data_start = _align(_PREAMBLE.size + len(header))
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, 0, len(header)))
+        f.write(header)
+        for entry, blob in zip(entries, blobs):
+            f.seek(data_start + entry['offset'])
+            f.write(blob)
+        f.truncate(data_start + offset)
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return size
+
+
+def load_state(path: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    Load a file written by `save_state`.
+
+    With `mmap`, uncompressed raw and float16 arrays are copy-on-write views of a memory map of the
+    file: loading them reads nothing until they are accessed, `torch.from_numpy` wraps them without
+    a copy, and writes to them never reach the file. Quantized arrays are dequantized into memory,
+    and compressed files are decompressed into memory.
+
+    Args:
+        path (str): Path of the file.
+        mmap (bool): Whether to memory-map the file instead of reading it.
+
+    Returns:
+        (Dict[str, np.ndarray]): The arrays, float16 arrays staying float16.
+        (dict): The metadata.
+    """
+    with open(path, 'rb') as f:
+        magic, version, _, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a state file: {path}")
+        if version > VERSION:
+            raise ValueError(f"Unsupported state file version {version}: {path}")
+        header = json.loads(f.read(header_len))
+    data_start = _align(_PREAMBLE.size + header_len)
+
+    if mmap and os.path.getsize(path) > data_start:
+        buffer = np.memmap(path, dtype=np.uint8, mode='c')
+    else:
+        with open(path, 'rb') as f:
+            buffer = np.frombuffer(bytearray(f.read()), dtype=np.uint8)
+    if header['compression'] == 'zstd':
+        import zstandard
+        decompressor = zstandard.ZstdDecompressor()
+
+    arrays = {}
+    for entry in header['arrays']:
+        start = data_start + entry['offset']
+        raw = buffer[start:start + entry['nbytes']]
+        if header['compression'] == 'zstd':
+            raw = np.frombuffer(bytearray(decompressor.decompress(raw.tobytes())), dtype=np.uint8)
+        stored = raw.view(np.dtype(entry['stored_dtype'])).reshape(entry['shape'])
+        arrays[entry['name']] = _decode(stored, entry)
+    return arrays, header['meta']
@@ -0,0 +1,87 @@
+from typing import *
+import queue
+import threading
+import numpy as np
+import imageio
+
+
+__all__ = [
+    'BackgroundVideoWriter',
+]
+
+
+class BackgroundVideoWriter:
+    """
+    Video writer that encodes frames on a background thread while the caller produces the next ones.
+
+    Frames are handed over through a queue of at most `max_queue_size` frames: `write` blocks when
+    the encoder falls behind, so memory stays bounded however many frames are written. Errors of the
+    encoder are raised by the next `write` or by `close`.
+
+    Args:
+        path (str): Path of the video file.
+        fps (int): Frames per second.
+        max_queue_size (int): Maximum number of frames waiting to be encoded.
+        **kwargs: Further arguments of `imageio.get_writer`.
+    """
+    def __init__(self, path: str, fps: int = 15, max_queue_size: int = 8, **kwargs):
+        self.path = path
+        self.num_frames = 0
+        self._writer = imageio.get_writer(path, fps=fps, **kwargs)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._encode_loop, name='video-writer', daemon=True)
+        self._thread.start()
+
+    def _encode_loop(self) -> None:
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            if self._error is not None:
+                # Keep draining so that writers never block on a dead encoder
+                continue
+            try:
+                self._writer.append_data(frame)
+            except Exception as e:
+                self._error = e
+        try:
+            self._writer.close()
+        except Exception as e:
+            self._error = self._error or e
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Queue a [H x W x C] uint8 frame for encoding.
+        """
+        if self._closed:
+            raise ValueError('Write to a closed video writer')
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+        self.num_frames += 1
+
+    def close(self) -> None:
+        """
+        Encode the remaining frames and finalize the file.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not mask the original error with one of the encoder
+            try:
+                self.close()
+            except Exception:
+                pass
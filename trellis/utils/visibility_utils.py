@@ -0,0 +1,340 @@
+from typing import *
+import math
+import time
+from contextlib import nullcontext
+import numpy as np
+import torch
+from tqdm import tqdm
+from easydict import EasyDict as edict
+import utils3d
+from .random_utils import radical_inverse
+from .camera_utils import hammersley_cameras
+from ..renderers.pool import rasterize_cuda_context
+from ..renderers.mesh_renderer_torch import rasterize_triangles
+
+
+def progressive_hammersley_order(num_samples: int) -> List[int]:
+    """
+    An order of the indices of a Hammersley sequence of `num_samples` points in which every
+    prefix is spread over the whole sequence: the indices are visited in bit-reversed
+    (van der Corput) order, so the first k samples are close to a k-point Hammersley set.
+    """
+    order = []
+    seen = set()
+    num_bits = max(num_samples - 1, 1).bit_length()
+    for k in range(1 << num_bits):
+        i = int(radical_inverse(2, k) * num_samples)
+        if i not in seen:
+            seen.add(i)
+            order.append(i)
+    return order
+
+
+def sphere_hammersley_views(
+    num_views: int,
+    radius: float = 2.0,
+    device: torch.device = 'cuda',
+    indices: Optional[List[int]] = None,
+) -> torch.Tensor:
+    """
+    View matrices of cameras on a sphere around the origin, looking at the origin, with
+    directions from a spherical Hammersley sequence.
+
+    Args:
+        num_views (int): Number of points of the Hammersley sequence.
+        radius (float): Distance of the cameras to the origin.
+        device (torch.device): Device of the returned tensor.
+        indices (List[int]): The points of the sequence to build views for, in order. All if None.
+
+    Returns:
+        (torch.Tensor): [len(indices) x 4 x 4] OpenGL view matrices.
+    """
+    extrinsics, _ = hammersley_cameras(num_views, r=radius, indices=indices, device=device)
+    return utils3d.torch.extrinsics_to_view(extrinsics)
+
+
+def rasterize_face_ids(
+    ctx,
+    verts: torch.Tensor,
+    faces: torch.Tensor,
+    views: torch.Tensor,
+    projection: torch.Tensor,
+    resolution: int,
+) -> torch.Tensor:
+    """
+    Rasterize the face IDs of a mesh from a batch of views in one nvdiffrast call.
+
+    Args:
+        ctx: nvdiffrast rasterization context.
+        verts (torch.Tensor): [V x 3] vertices.
+        faces (torch.Tensor): [F x 3] faces.
+        views (torch.Tensor): [B x 4 x 4] view matrices.
+        projection (torch.Tensor): [4 x 4] projection matrix.
+        resolution (int): Width and height of the images.
+
+    Returns:
+        (torch.Tensor): [B x H x W] face IDs, offset by one; 0 marks background.
+    """
+    import nvdiffrast.torch as dr
+    verts_homo = torch.cat([verts, torch.ones_like(verts[:, :1])], dim=-1)
+    verts_clip = verts_homo[None] @ (projection[None] @ views).transpose(-1, -2)    # [B, V, 4]
+    rast, _ = dr.rasterize(ctx, verts_clip.contiguous(), faces.int().contiguous(), (resolution, resolution))
+    return rast[..., 3].long()
+
+
+def rasterize_face_ids_numpy(
+    verts: np.ndarray,
+    faces: np.ndarray,
+    views: np.ndarray,
+    projection: np.ndarray,
+    resolution: int,
+) -> np.ndarray:
+    """
+    Reference z-buffer rasterizer of face IDs in numpy, for testing without a GPU.
+    Triangles are rasterized one by one at pixel centers without culling; triangles
+    with a vertex behind the camera are skipped.
+
+    Args:
+        verts (np.ndarray): [V x 3] vertices.
+        faces (np.ndarray): [F x 3] faces.
+        views (np.ndarray): [B x 4 x 4] view matrices.
+        projection (np.ndarray): [4 x 4] projection matrix.
+        resolution (int): Width and height of the images.
+
+    Returns:
+        (np.ndarray): [B x H x W] face IDs, offset by one; 0 marks background.
+    """
+    verts_homo = np.concatenate([verts, np.ones_like(verts[:, :1])], axis=-1)
+    face_ids = np.zeros((views.shape[0], resolution, resolution), dtype=np.int64)
+    for b in range(views.shape[0]):
+        clip = verts_homo @ (projection @ views[b]).T
+        w = clip[:, 3]
+        screen = np.zeros((verts.shape[0], 3))
+        valid = w > 0
+        screen[valid] = clip[valid, :3] / w[valid, None]
+        screen[:, :2] = (screen[:, :2] + 1) * 0.5 * resolution
+        zbuf = np.full((resolution, resolution), np.inf)
+        for f in range(faces.shape[0]):
+            if not valid[faces[f]].all():
+                continue
+            (x0, y0, z0), (x1, y1, z1), (x2, y2, z2) = screen[faces[f]]
+            area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+            if area == 0:
+                continue
+            xmin = max(int(np.floor(min(x0, x1, x2) - 0.5)), 0)
+            xmax = min(int(np.ceil(max(x0, x1, x2) - 0.5)), resolution - 1)
+            ymin = max(int(np.floor(min(y0, y1, y2) - 0.5)), 0)
+            ymax = min(int(np.ceil(max(y0, y1, y2) - 0.5)), resolution - 1)
+            if xmin > xmax or ymin > ymax:
+                continue
+            px, py = np.meshgrid(np.arange(xmin, xmax + 1) + 0.5, np.arange(ymin, ymax + 1) + 0.5)
+            w0 = ((x1 - px) * (y2 - py) - (x2 - px) * (y1 - py)) / area
+            w1 = ((x2 - px) * (y0 - py) - (x0 - px) * (y2 - py)) / area
+            w2 = 1 - w0 - w1
+            z = w0 * z0 + w1 * z1 + w2 * z2
+            tile = zbuf[ymin:ymax + 1, xmin:xmax + 1]
+            mask = (w0 >= 0) & (w1 >= 0) & (w2 >= 0) & (z >= -1) & (z <= 1) & (z < tile)
+            tile[mask] = z[mask]
+            face_ids[b, ymin:ymax + 1, xmin:xmax + 1][mask] = f + 1
+    return face_ids
+
+
+def rasterize_face_ids_torch(
+    verts: torch.Tensor,
+    faces: torch.Tensor,
+    views: torch.Tensor,
+    projection: torch.Tensor,
+    resolution: int,
+) -> torch.Tensor:
+    """
+    Rasterize the face IDs of a mesh from a batch of views with the PyTorch rasterizer of
+    `TorchMeshRenderer`, for devices without nvdiffrast. Gives the face IDs of
+    `rasterize_face_ids_numpy`.
+
+    Args:
+        verts (torch.Tensor): [V x 3] vertices.
+        faces (torch.Tensor): [F x 3] faces.
+        views (torch.Tensor): [B x 4 x 4] view matrices.
+        projection (torch.Tensor): [4 x 4] projection matrix.
+        resolution (int): Width and height of the images.
+
+    Returns:
+        (torch.Tensor): [B x H x W] face IDs, offset by one; 0 marks background.
+    """
+    # In double precision, so that pixels on an edge shared by two faces do not fall through both
+    verts, views, projection = verts.double(), views.double(), projection.double()
+    verts_homo = torch.cat([verts, torch.ones_like(verts[:, :1])], dim=-1)
+    verts_clip = verts_homo[None] @ (projection[None] @ views).transpose(-1, -2)    # [B, V, 4]
+    return torch.stack([rasterize_triangles(clip, faces, resolution)[0] for clip in verts_clip])
+
+
+def auto_visibility_resolution(
+    verts: torch.Tensor,
+    faces: torch.Tensor,
+    radius: float = 2.0,
+    fov: float = 40,
+    pixels_per_face: float = 4,
+    min_resolution: int = 256,
+    max_resolution: int = 1024,
+) -> int:
+    """
+    A rasterization resolution at which a face of average size spans about `pixels_per_face`
+    pixels across, for cameras at `radius` with a field of view of `fov` degrees. Finer meshes
+    and smaller objects get higher resolutions.
+
+    Returns:
+        (int): The resolution, a multiple of 64 in [min_resolution, max_resolution].
+    """
+    v0, v1, v2 = verts[faces.long()].unbind(dim=1)
+    area = torch.linalg.norm(torch.cross(v1 - v0, v2 - v0, dim=-1), dim=-1).sum().item() * 0.5
+    face_size = math.sqrt(2 * area / max(faces.shape[0], 1))
+    view_width = 2 * radius * math.tan(math.radians(fov) / 2)
+    resolution = math.ceil(pixels_per_face * view_width / max(face_size, 1e-8) / 64) * 64
+    return int(min(max(resolution, min_resolution), max_resolution))
+
+
+def _rasterize_batch(ctx, verts, faces, views, projection, resolution, backend) -> torch.Tensor:
+    if backend == 'cuda':
+        return rasterize_face_ids(ctx, verts, faces, views, projection, resolution)
+    elif backend == 'torch':
+        return rasterize_face_ids_torch(verts, faces, views, projection, resolution)
+    elif backend == 'numpy':
+        return torch.from_numpy(rasterize_face_ids_numpy(
+            verts.cpu().numpy(), faces.cpu().numpy(), views.cpu().numpy(), projection.cpu().numpy(), resolution
+        )).to(verts.device)
+    else:
+        raise ValueError(f"Unknown rasterization backend: {backend}")
+
+
+def _count_visible_faces(face_ids: torch.Tensor, num_faces: int) -> torch.Tensor:
+    """
+    The number of views of a [B x H x W] face ID batch that each face is visible in, by one
+    bincount over (view, face) pairs.
+    """
+    B = face_ids.shape[0]
+    keys = face_ids.reshape(B, -1) + torch.arange(B, device=face_ids.device)[:, None] * (num_faces + 1)
+    seen = torch.bincount(keys.reshape(-1), minlength=B * (num_faces + 1)).reshape(B, num_faces + 1) > 0
+    return seen[:, 1:].sum(dim=0, dtype=torch.int32)
+
+
+def _rasterize_context(backend: str, device: torch.device):
+    # A pooled nvdiffrast context for 'cuda', none for 'torch' and 'numpy'
+    if backend == 'cuda':
+        return rasterize_cuda_context(device)
+    return nullcontext()
+
+
+def face_visibility(
+    verts: torch.Tensor,
+    faces: torch.Tensor,
+    views: torch.Tensor,
+    projection: torch.Tensor,
+    resolution: int,
+    batch_size: int = 16,
+    backend: Literal['cuda', 'torch', 'numpy'] = 'cuda',
+    verbose: bool = False,
+) -> torch.Tensor:
+    """
+    Count for every face of a mesh the number of views it is visible in.
+
+    Views are rasterized `batch_size` at a time and the visible faces of a whole batch are
+    counted with one bincount over (view, face) pairs.
+
+    Args:
+        verts (torch.Tensor): [V x 3] vertices.
+        faces (torch.Tensor): [F x 3] faces.
+        views (torch.Tensor): [N x 4 x 4] view matrices.
+        projection (torch.Tensor): [4 x 4] projection matrix.
+        resolution (int): Resolution of the rasterization.
+        batch_size (int): Number of views rasterized per call. The face ID buffers of a batch
+            take batch_size * resolution^2 * 8 bytes.
+        backend (str): 'cuda' rasterizes with nvdiffrast, 'torch' with `rasterize_face_ids_torch` on any
+            device, 'numpy' with the reference rasterizer.
+        verbose (bool): Whether to show a progress bar.
+
+    Returns:
+        (torch.Tensor): [F] int32 number of views each face is visible in.
+    """
+    visibility = torch.zeros(faces.shape[0], dtype=torch.int32, device=verts.device)
+    with _rasterize_context(backend, verts.device) as ctx:
+        for start in tqdm(range(0, views.shape[0], batch_size), disable=not verbose, desc='Rasterizing'):
+            face_ids = _rasterize_batch(ctx, verts, faces, views[start:start + batch_size], projection, resolution, backend)
+            visibility += _count_visible_faces(face_ids, faces.shape[0])
+    return visibility
+
+
+def adaptive_face_visibility(
+    verts: torch.Tensor,
+    faces: torch.Tensor,
+    projection: torch.Tensor,
+    resolution: int,
+    radius: float = 2.0,
+    max_views: int = 1000,
+    min_views: int = 32,
+    batch_size: int = 16,
+    tol: float = 1e-3,
+    patience: int = 2,
+    backend: Literal['cuda', 'torch', 'numpy'] = 'cuda',
+    verbose: bool = False,
+) -> Tuple[torch.Tensor, edict]:
+    """
+    Estimate the fraction of views every face of a mesh is visible in, adding views of a
+    `max_views`-point spherical Hammersley sequence in progressive order until the estimate
+    converges.
+
+    After every batch of views, the fraction of faces whose classification as visible
+    (seen at least once) or invisible changed is compared to `tol`. Sampling stops once it
+    stayed below `tol` for `patience` consecutive batches and at least `min_views` views were
+    used. With tol = 0 all `max_views` views are used, as in `face_visibility`.
+
+    Args:
+        verts (torch.Tensor): [V x 3] vertices.
+        faces (torch.Tensor): [F x 3] faces.
+        projection (torch.Tensor): [4 x 4] projection matrix.
+        resolution (int): Resolution of the rasterization.
+        radius (float): Distance of the cameras to the origin.
+        max_views (int): Maximum number of views.
+        min_views (int): Minimum number of views.
+        batch_size (int): Number of views rasterized per call.
+        tol (float): Convergence threshold of the fraction of reclassified faces per batch.
+        patience (int): Number of consecutive converged batches before stopping.
+        backend (str): 'cuda' rasterizes with nvdiffrast, 'torch' with `rasterize_face_ids_torch` on any
+            device, 'numpy' with the reference rasterizer.
+        verbose (bool): Whether to show a progress bar.
+
+    Returns:
+        (torch.Tensor): [F] fraction of the used views each face is visible in.
+        (edict): Statistics of the run:
+            - 'num_views': the number of views used.
+            - 'max_views': the maximum number of views.
+            - 'time': the time spent, in seconds.
+            - 'time_saved': the estimated time the remaining views would have taken, in seconds.
+    """
+    start_time = time.time()
+    views = sphere_hammersley_views(max_views, radius=radius, device=verts.device, indices=progressive_hammersley_order(max_views))
+    visibility = torch.zeros(faces.shape[0], dtype=torch.int32, device=verts.device)
+    visible = torch.zeros(faces.shape[0], dtype=torch.bool, device=verts.device)
+    num_views, num_stable = 0, 0
+    pbar = tqdm(total=max_views, disable=not verbose, desc='Rasterizing')
+    with _rasterize_context(backend, verts.device) as ctx:
+        while num_views < max_views:
+            batch_views = views[num_views:num_views + batch_size]
+            face_ids = _rasterize_batch(ctx, verts, faces, batch_views, projection, resolution, backend)
+            visibility += _count_visible_faces(face_ids, faces.shape[0])
+            num_views += batch_views.shape[0]
+            pbar.update(batch_views.shape[0])
+            new_visible = visibility > 0
+            changed = (new_visible != visible).float().mean().item()
+            visible = new_visible
+            num_stable = num_stable + 1 if changed < tol else 0
+            if num_views >= min_views and num_stable >= patience:
+                break
+    pbar.close()
+    elapsed = time.time() - start_time
+    stats = edict({
+        'num_views': num_views,
+        'max_views': max_views,
+        'time': elapsed,
+        'time_saved': elapsed / num_views * (max_views - num_views),
+    })
+    return visibility.float() / num_views, stats